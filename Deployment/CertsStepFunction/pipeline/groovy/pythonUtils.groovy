@@ -15,7 +15,10 @@ def installLambdaDependencies() {
     def lambdaDirs = [
         'check-certs': 'lambdas/check-certs',
         'generate-certs': 'lambdas/generate-certs',
-        'replace-certs': 'lambdas/replace-certs'
+        'replace-certs': 'lambdas/replace-certs',
+        'schedule-certs': 'lambdas/schedule-certs',
+        'probe-certs': 'lambdas/probe-certs',
+        'sweep-certs': 'lambdas/sweep-certs'
     ]
     
     lambdaDirs.each { dir ->
@@ -35,7 +38,12 @@ def runLambdaTests() {
     def lambdaDirs = [
         'check-certs': 'lambdas/check-certs',
         'generate-certs': 'lambdas/generate-certs',
-        'replace-certs': 'lambdas/replace-certs'
+        'replace-certs': 'lambdas/replace-certs',
+        'schedule-certs': 'lambdas/schedule-certs',
+        'probe-certs': 'lambdas/probe-certs',
+        'sweep-certs': 'lambdas/sweep-certs',
+        'shared': 'lambdas/shared',
+        'benchmarks': 'lambdas/benchmarks'
     ]
     
     // Run tests for each Lambda function
@@ -72,6 +80,23 @@ def runLambdaTests() {
     return testResults
 }
 
+def runLambdaBenchmarks() {
+    echo "Running Lambda cold-start and invocation benchmarks"
+    
+    dir('lambdas') {
+        def status = sh(
+            script: "python benchmarks/run_benchmarks.py --output benchmark-results.json",
+            returnStatus: true
+        )
+        archiveArtifacts artifacts: 'benchmark-results.json', allowEmptyArchive: true
+        
+        if (status != 0) {
+            error "❌ Lambda benchmarks regressed against benchmarks/baseline.json"
+        }
+        echo "✅ Lambda benchmarks within baseline"
+    }
+}
+
 def extractCoveragePercentage(coverageOutput) {
     // Extract coverage percentage from pytest output
     def coverageMatch = coverageOutput =~ /TOTAL\\s+\\d+\\s+\\d+\\s+(\\d+)%/
@@ -159,7 +184,11 @@ def uploadTestReportsToS3(bucketName, region) {
     def lambdaDirs = [
         'check-certs': 'lambdas/check-certs',
         'generate-certs': 'lambdas/generate-certs',
-        'replace-certs': 'lambdas/replace-certs'
+        'replace-certs': 'lambdas/replace-certs',
+        'schedule-certs': 'lambdas/schedule-certs',
+        'probe-certs': 'lambdas/probe-certs',
+        'sweep-certs': 'lambdas/sweep-certs',
+        'shared': 'lambdas/shared'
     ]
     
     def tempDir = "test-reports-temp-${buildNumber}"
@@ -106,7 +106,10 @@ def packageLambdaFunctions() {
     def lambdaDirs = [
         'lambdas/check_certificate',
         'lambdas/generate_certificate',
-        'lambdas/replace_certificate'
+        'lambdas/replace_certificate',
+        'lambdas/schedule_certificate',
+        'lambdas/probe_certificate',
+        'lambdas/sweep_certificate'
     ]
     
     lambdaDirs.each { dir ->
@@ -7,6 +7,9 @@ mkdir -p layers/python
 
 cd layers/python
 pip install -r requirements.txt
+
+# Shared modules imported by the Lambda handlers (available under /opt/python)
+find ../../shared -maxdepth 1 -name "*.py" ! -name "test_*" -exec cp {} . \;
 # Create zip files for layers
 zip -r ../python_layer.zip . && cd ../..
 
@@ -1,3 +1,10 @@
+locals {
+  # Transaction records, summaries, run logs, certificate files and test reports
+  archived_prefixes = ["transactions/", "summary/", "runs/", "certificates/", "test-reports/"]
+  # ACME accounts, the RSA key pool, the expiry schedule, ACME rate-limit buckets and the certificate inventory index
+  state_prefixes = ["acme/", "key-pool/", "schedule/", "rate-limits/", "inventory/"]
+}
+
 # S3 bucket for certificate storage with KMS encryption
 resource "aws_s3_bucket" "certificate_bucket" {
   bucket = var.certificate_bucket
@@ -16,21 +23,51 @@ resource "aws_s3_bucket" "certificate_bucket" {
     enabled = true
   }
 
-  lifecycle_rule {
-    id      = "certificate_cleanup"
-    enabled = true
+  # Write-once history is archived after 30 days and expired after a year
+  dynamic "lifecycle_rule" {
+    for_each = local.archived_prefixes
+    content {
+      id      = "certificate_cleanup_${trimsuffix(lifecycle_rule.value, "/")}"
+      prefix  = lifecycle_rule.value
+      enabled = true
 
-    transition {
-      days          = 30
-      storage_class = "GLACIER"
+      transition {
+        days          = 30
+        storage_class = "GLACIER"
+      }
+
+      expiration {
+        days = 365
+      }
+
+      noncurrent_version_expiration {
+        days = 30
+      }
     }
+  }
 
-    expiration {
-      days = 365
+  # State read back on later runs must stay readable, so only old versions are removed
+  dynamic "lifecycle_rule" {
+    for_each = local.state_prefixes
+    content {
+      id      = "state_versions_${trimsuffix(lifecycle_rule.value, "/")}"
+      prefix  = lifecycle_rule.value
+      enabled = true
+
+      noncurrent_version_expiration {
+        days = 30
+      }
     }
+  }
 
-    noncurrent_version_expiration {
-      days = 30
+  # Claim markers left by an invocation that died mid-claim
+  lifecycle_rule {
+    id      = "key_pool_claims"
+    prefix  = "key-pool/claims/"
+    enabled = true
+
+    expiration {
+      days = 1
     }
   }
 
@@ -1,8 +1,9 @@
-# EventBridge Rule for monthly certificate check
-resource "aws_cloudwatch_event_rule" "monthly_cert_check" {
-  name                = "monthly-certificate-check"
-  description         = "Trigger certificate check on the first day of every month"
-  schedule_expression = "cron(0 2 1 * ? *)" # 2 AM on the 1st day of every month
+# EventBridge Rule for the daily scheduler tick. The scheduler only starts the
+# certificate workflow for domains whose renewal window has opened.
+resource "aws_cloudwatch_event_rule" "certificate_schedule_tick" {
+  name                = "certificate-schedule-tick"
+  description         = "Trigger the expiry-ordered certificate scheduler every day"
+  schedule_expression = "cron(0 2 * * ? *)" # 2 AM every day
 
   tags = {
     Environment = var.env
@@ -10,16 +11,11 @@ resource "aws_cloudwatch_event_rule" "monthly_cert_check" {
   }
 }
 
-# EventBridge Target for Step Function
-resource "aws_cloudwatch_event_target" "step_function_target" {
-  rule      = aws_cloudwatch_event_rule.monthly_cert_check.name
-  target_id = "certificate-manager-step-function"
-  arn       = aws_sfn_state_machine.certificate_manager.arn
-  role_arn  = aws_iam_role.eventbridge_role.arn
-
-  input = jsonencode({
-    domain = var.domain
-  })
+# EventBridge Target for the scheduler Lambda
+resource "aws_cloudwatch_event_target" "scheduler_target" {
+  rule      = aws_cloudwatch_event_rule.certificate_schedule_tick.name
+  target_id = "certificate-scheduler-lambda"
+  arn       = aws_lambda_function.certificate_scheduler.arn
 }
 
 # IAM Role for EventBridge to trigger Step Function
@@ -57,4 +53,33 @@ resource "aws_iam_role_policy" "eventbridge_step_function_policy" {
       }
     ]
   })
-}
\ No newline at end of file
+}
+
+# EventBridge Rule for the sweeper that deletes superseded certificates once
+# nothing uses them
+resource "aws_cloudwatch_event_rule" "certificate_sweep_tick" {
+  name                = "certificate-sweep-tick"
+  description         = "Delete superseded certificates queued by replace-certs"
+  schedule_expression = var.sweep_schedule_expression
+
+  tags = {
+    Environment = var.env
+    Purpose     = "certificate-management"
+  }
+}
+
+# EventBridge Target for the sweeper Lambda
+resource "aws_cloudwatch_event_target" "sweeper_target" {
+  rule      = aws_cloudwatch_event_rule.certificate_sweep_tick.name
+  target_id = "certificate-sweeper-lambda"
+  arn       = aws_lambda_function.certificate_management["sweep_certificate"].arn
+}
+
+# EventBridge Trigger for Sweeper Lambda
+resource "aws_lambda_permission" "eventbridge_sweeper_trigger" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.certificate_management["sweep_certificate"].function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.certificate_sweep_tick.arn
+}
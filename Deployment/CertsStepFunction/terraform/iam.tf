@@ -99,4 +99,31 @@ resource "aws_iam_role_policy" "sns_lambda_invoke_policy" {
       }
     ]
   })
-}
\ No newline at end of file
+}
+
+# Route53 permissions for answering ACME dns-01 challenges
+resource "aws_iam_role_policy" "lambda_route53_dns01_policy" {
+  name = "lambda_route53_dns01_policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "route53:ListHostedZones",
+          "route53:GetChange"
+        ]
+        Resource = ["*"]
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "route53:ChangeResourceRecordSets"
+        ]
+        Resource = ["arn:aws:route53:::hostedzone/*"]
+      }
+    ]
+  })
+}
@@ -0,0 +1,266 @@
+import io
+import itertools
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+ACCOUNT_ID = "000000000000"
+REGION = "us-east-1"
+
+
+class ApiCallCounter:
+    """Counts AWS API calls made against the fakes, keyed by "service.operation"."""
+
+    def __init__(self):
+        self.calls = Counter()
+
+    def record(self, service, operation):
+        self.calls[f"{service}.{operation}"] += 1
+
+    def reset(self):
+        self.calls.clear()
+
+    def snapshot(self):
+        return dict(sorted(self.calls.items()))
+
+
+class FakeServiceError(Exception):
+    """Base class for errors raised by the fakes."""
+
+
+class FakeClient:
+    """Shared plumbing for the in-process AWS client fakes."""
+
+    service_name = None
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def _record(self, operation):
+        self.counter.record(self.service_name, operation)
+
+
+class FakePaginator:
+    """Paginator over a fake list operation; every page counts as one API call."""
+
+    def __init__(self, operation, token_field):
+        self._operation = operation
+        self._token_field = token_field
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            page = self._operation(**kwargs, **({self._token_field: token} if token else {}))
+            yield page
+            token = page.get(self._token_field)
+            if not token:
+                return
+
+
+class FakeS3(FakeClient):
+    """Dict-backed S3 supporting the object calls the Lambdas make."""
+
+    service_name = "s3"
+
+    class exceptions:
+        class NoSuchKey(ClientError):
+            def __init__(self, key):
+                super().__init__({"Error": {"Code": "NoSuchKey", "Message": f"NoSuchKey: {key}"}}, "GetObject")
+
+    def __init__(self, counter):
+        super().__init__(counter)
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None, IfMatch=None, IfNoneMatch=None, **kwargs):
+        self._record("put_object")
+        current = self.objects.get((Bucket, Key))
+        if (IfNoneMatch == "*" and current) or (IfMatch and (not current or current["ETag"] != IfMatch)):
+            raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": "At least one of the pre-conditions you specified did not hold"}}, "PutObject")
+        body = Body.encode() if isinstance(Body, str) else Body
+        etag = f'"{uuid.uuid4().hex}"'
+        self.objects[(Bucket, Key)] = {"Body": body, "Metadata": dict(Metadata or {}), "ETag": etag}
+        return {"ETag": etag}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._record("get_object")
+        stored = self._get(Bucket, Key)
+        return {
+            "Body": io.BytesIO(stored["Body"]),
+            "Metadata": dict(stored["Metadata"]),
+            "ContentLength": len(stored["Body"]),
+            "ETag": stored["ETag"],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._record("head_object")
+        stored = self._get(Bucket, Key)
+        return {"Metadata": dict(stored["Metadata"]), "ContentLength": len(stored["Body"]), "ETag": stored["ETag"]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._record("delete_object")
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        self._record("list_objects_v2")
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return {"Contents": [{"Key": key} for key in keys], "KeyCount": len(keys)}
+
+    def _get(self, bucket, key):
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise self.exceptions.NoSuchKey(key) from None
+
+
+class FakeACM(FakeClient):
+    """In-memory ACM holding imported certificates."""
+
+    service_name = "acm"
+    page_size = 1000
+
+    class exceptions:
+        class ResourceNotFoundException(FakeServiceError):
+            pass
+
+    def __init__(self, counter):
+        super().__init__(counter)
+        self.certificates = {}
+        self._serial = itertools.count(1)
+
+    def add_certificate(self, domain, not_after, sans=None, certificate="", chain="", key_algorithm="EC_prime256v1"):
+        """Seed a certificate without counting an API call."""
+        arn = f"arn:aws:acm:{REGION}:{ACCOUNT_ID}:certificate/{next(self._serial):08d}"
+        self.certificates[arn] = {
+            "CertificateArn": arn,
+            "DomainName": domain,
+            "SubjectAlternativeNames": [domain, *(sans or [])],
+            "NotAfter": not_after,
+            "Status": "ISSUED",
+            "Type": "IMPORTED",
+            "KeyAlgorithm": key_algorithm,
+            "InUseBy": [],
+            "Certificate": certificate,
+            "CertificateChain": chain,
+        }
+        return arn
+
+    def import_certificate(self, Certificate, PrivateKey, CertificateChain=None, CertificateArn=None, **kwargs):
+        self._record("import_certificate")
+        parsed = x509.load_pem_x509_certificate(Certificate.encode() if isinstance(Certificate, str) else Certificate)
+        domain = parsed.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
+        if CertificateArn:
+            self._get(CertificateArn)
+            self.certificates[CertificateArn].update({
+                "NotAfter": parsed.not_valid_after_utc,
+                "Certificate": Certificate,
+                "CertificateChain": CertificateChain or "",
+            })
+            return {"CertificateArn": CertificateArn}
+        arn = self.add_certificate(domain, parsed.not_valid_after_utc, certificate=Certificate, chain=CertificateChain or "")
+        return {"CertificateArn": arn}
+
+    def list_certificates(self, Includes=None, NextToken=None, **kwargs):
+        self._record("list_certificates")
+        arns = sorted(self.certificates)
+        start = int(NextToken or 0)
+        page = arns[start:start + self.page_size]
+        response = {
+            "CertificateSummaryList": [
+                {
+                    "CertificateArn": arn,
+                    "DomainName": self.certificates[arn]["DomainName"],
+                    "SubjectAlternativeNameSummaries": self.certificates[arn]["SubjectAlternativeNames"],
+                    "NotAfter": self.certificates[arn]["NotAfter"],
+                    "Status": self.certificates[arn]["Status"],
+                }
+                for arn in page
+            ]
+        }
+        if start + self.page_size < len(arns):
+            response["NextToken"] = str(start + self.page_size)
+        return response
+
+    def get_paginator(self, operation_name):
+        if operation_name != "list_certificates":
+            raise NotImplementedError(operation_name)
+        return FakePaginator(self.list_certificates, "NextToken")
+
+    def describe_certificate(self, CertificateArn):
+        self._record("describe_certificate")
+        certificate = self._get(CertificateArn)
+        detail = {key: value for key, value in certificate.items() if key not in ("Certificate", "CertificateChain")}
+        return {"Certificate": detail}
+
+    def get_certificate(self, CertificateArn):
+        self._record("get_certificate")
+        certificate = self._get(CertificateArn)
+        return {"Certificate": certificate["Certificate"], "CertificateChain": certificate["CertificateChain"]}
+
+    def delete_certificate(self, CertificateArn):
+        self._record("delete_certificate")
+        self._get(CertificateArn)
+        del self.certificates[CertificateArn]
+        return {}
+
+    def _get(self, arn):
+        try:
+            return self.certificates[arn]
+        except KeyError:
+            raise self.exceptions.ResourceNotFoundException(f"Certificate not found: {arn}") from None
+
+
+class FakeSNS(FakeClient):
+    """SNS fake that records published messages."""
+
+    service_name = "sns"
+
+    class exceptions:
+        class NotFoundException(FakeServiceError):
+            pass
+
+    def __init__(self, counter):
+        super().__init__(counter)
+        self.messages = []
+
+    def publish(self, TopicArn, Message, **kwargs):
+        self._record("publish")
+        self.messages.append({"TopicArn": TopicArn, "Message": Message, **kwargs})
+        return {"MessageId": str(uuid.uuid4())}
+
+
+def make_fakes(counter=None):
+    """Return a fresh set of fakes sharing one call counter."""
+    counter = counter or ApiCallCounter()
+    return {"counter": counter, "s3": FakeS3(counter), "acm": FakeACM(counter), "sns": FakeSNS(counter)}
+
+
+def make_self_signed_certificate(domain, days=90):
+    """Return (certificate_pem, private_key_pem) for a short-lived self-signed certificate."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domain)])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(domain)]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    certificate_pem = certificate.public_bytes(serialization.Encoding.PEM).decode()
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return certificate_pem, key_pem
@@ -0,0 +1,277 @@
+"""Cold-start and per-invocation benchmarks for the certificate Lambdas.
+
+Each lambda_handler runs against the in-process S3/ACM/SNS fakes in fakes.py.
+For every Lambda we record the import time (in a fresh interpreter), the
+first-call and warm-call latency, and the AWS API calls made per invocation.
+
+    python benchmarks/run_benchmarks.py                    # compare with baseline.json
+    python benchmarks/run_benchmarks.py --update-baseline  # record a new baseline
+
+A run fails (exit code 1) when an invocation makes more AWS API calls than
+the baseline recorded. Only API call counts are kept in baseline.json: they
+are deterministic, so a change to the file is a reviewable behaviour change.
+Timings depend on the machine, so they are compared only on request, against
+results recorded on the same machine:
+
+    python benchmarks/run_benchmarks.py --output before.json
+    python benchmarks/run_benchmarks.py --baseline before.json --tolerance 2.0
+
+A timing then fails when it exceeds baseline * tolerance + slack.
+"""
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+LAMBDAS_DIR = BENCHMARKS_DIR.parent
+SHARED_DIR = LAMBDAS_DIR / "shared"
+sys.path.insert(0, str(BENCHMARKS_DIR))
+sys.path.insert(0, str(SHARED_DIR))
+
+from cert_bundle import write_bundle  # noqa: E402
+from fakes import make_fakes, make_self_signed_certificate  # noqa: E402
+
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+DEFAULT_LAMBDAS = ["check-certs", "generate-certs", "replace-certs", "notification"]
+BENCHMARK_DOMAIN = "bench.example.com"
+BENCHMARK_ENV = {
+    "S3_BUCKET": "benchmark-bucket",
+    "SNS_TOPIC_ARN": "arn:aws:sns:us-east-1:000000000000:certificate-notifications",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "LOG_LEVEL": "WARNING",
+}
+TIMING_METRICS = ["import_ms", "first_call_ms", "warm_call_ms"]
+
+IMPORT_SNIPPET = """
+import importlib.util, os, sys, time
+sys.path[:0] = [os.path.dirname(sys.argv[1]), sys.argv[2]]
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("index", sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def load_lambda(name):
+    """Import a Lambda's index.py under a unique module name."""
+    module_name = f"benchmark_{name.replace('-', '_')}"
+    # Sibling modules (e.g. generate-certs/acme_client.py) import as they do on Lambda
+    if str(LAMBDAS_DIR / name) not in sys.path:
+        sys.path.insert(0, str(LAMBDAS_DIR / name))
+    spec = importlib.util.spec_from_file_location(module_name, LAMBDAS_DIR / name / "index.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure_import_time(name, repeats):
+    """Median import time of a Lambda in a fresh interpreter, as on a cold start."""
+    env = {**os.environ, **BENCHMARK_ENV}
+    timings = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET, str(LAMBDAS_DIR / name / "index.py"), str(SHARED_DIR)],
+            check=True, capture_output=True, text=True, env=env,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def bind_fakes(module, fakes):
+    """Point a Lambda module's clients and configuration at the fakes."""
+    for service in ("s3", "acm", "sns"):
+        if hasattr(module, service):
+            setattr(module, service, fakes[service])
+    if hasattr(module, "bucket_name"):
+        module.bucket_name = BENCHMARK_ENV["S3_BUCKET"]
+    if hasattr(module, "sns_topic_arn"):
+        module.sns_topic_arn = BENCHMARK_ENV["SNS_TOPIC_ARN"]
+
+
+def setup_check_certs(module, fakes):
+    """Check a domain with one valid certificate in ACM."""
+    fakes["acm"].add_certificate(BENCHMARK_DOMAIN, datetime.now(timezone.utc) + timedelta(days=60))
+    return lambda: {"domain": BENCHMARK_DOMAIN}
+
+
+def setup_generate_certs(module, fakes):
+    """Generate a certificate with certbot replaced by a local self-signed issuer."""
+    certificate, key_pem = make_self_signed_certificate(BENCHMARK_DOMAIN)
+
+    def run_certbot_command(domain, temp_dir, private_key, domains=None):
+        live_dir = Path(temp_dir) / "live" / domain
+        live_dir.mkdir(parents=True, exist_ok=True)
+        (live_dir / "cert.pem").write_text(certificate)
+        (live_dir / "privkey.pem").write_text(key_pem)
+        (live_dir / "chain.pem").write_text(certificate)
+
+    module.run_certbot_command = run_certbot_command
+    # A new transaction each call; a repeated one would reuse the stored bundle and skip issuance
+    transaction_ids = itertools.count(1)
+    return lambda: {"domain": BENCHMARK_DOMAIN, "transaction_id": f"benchmark-{next(transaction_ids)}"}
+
+
+def setup_replace_certs(module, fakes):
+    """Replace a certificate whose renewed bundle is already in S3."""
+    certificate, private_key = make_self_signed_certificate(BENCHMARK_DOMAIN)
+    write_bundle(fakes["s3"], BENCHMARK_ENV["S3_BUCKET"], BENCHMARK_DOMAIN, certificate, private_key, certificate, "benchmark")
+
+    def next_event():
+        # Every invocation replaces a fresh old certificate so warm calls do the same work
+        old_arn = fakes["acm"].add_certificate(BENCHMARK_DOMAIN, datetime.now(timezone.utc) + timedelta(days=5))
+        return {"domain": BENCHMARK_DOMAIN, "transaction_id": "benchmark", "certificate_arn": old_arn}
+
+    return next_event
+
+
+def setup_notification(module, fakes):
+    """Publish a renewal notification."""
+    return lambda: {
+        "notification_type": "certificates_updated",
+        "domain": BENCHMARK_DOMAIN,
+        "message": "Certificate renewed",
+    }
+
+
+SCENARIOS = {
+    "check-certs": setup_check_certs,
+    "generate-certs": setup_generate_certs,
+    "replace-certs": setup_replace_certs,
+    "notification": setup_notification,
+}
+
+
+def run_benchmark(name, warm_iterations=20, import_repeats=3):
+    """Benchmark one Lambda and return its metrics."""
+    import_ms = measure_import_time(name, import_repeats) if import_repeats else None
+
+    fakes = make_fakes()
+    counter = fakes["counter"]
+    module = load_lambda(name)
+    bind_fakes(module, fakes)
+    next_event = SCENARIOS[name](module, fakes)
+    counter.reset()
+
+    event = next_event()
+    started = time.perf_counter()
+    module.lambda_handler(event, None)
+    first_call_ms = (time.perf_counter() - started) * 1000
+    first_call_api_calls = counter.snapshot()
+
+    warm_timings = []
+    warm_call_api_calls = {}
+    for _ in range(warm_iterations):
+        event = next_event()
+        counter.reset()
+        started = time.perf_counter()
+        module.lambda_handler(event, None)
+        warm_timings.append((time.perf_counter() - started) * 1000)
+        warm_call_api_calls = counter.snapshot()
+
+    return {
+        "import_ms": round(import_ms, 2) if import_ms is not None else None,
+        "first_call_ms": round(first_call_ms, 2),
+        "warm_call_ms": round(statistics.median(warm_timings), 2) if warm_timings else None,
+        "warm_call_p95_ms": round(percentile(warm_timings, 95), 2) if warm_timings else None,
+        "api_calls": {"first_call": first_call_api_calls, "warm_call": warm_call_api_calls},
+    }
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of values."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def compare_with_baseline(results, baseline, tolerance=None, slack_ms=10.0):
+    """Return a list of regressions in results relative to baseline.
+
+    API call counts are always compared; timings only when a tolerance is given.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+
+        for metric in TIMING_METRICS if tolerance is not None else ():
+            if current.get(metric) is None or previous.get(metric) is None:
+                continue
+            limit = previous[metric] * tolerance + slack_ms
+            if current[metric] > limit:
+                regressions.append(
+                    f"{name} {metric}: {current[metric]:.2f} ms > {limit:.2f} ms (baseline {previous[metric]:.2f} ms)"
+                )
+
+        for phase, calls in current["api_calls"].items():
+            previous_calls = previous.get("api_calls", {}).get(phase, {})
+            for operation, count in calls.items():
+                if count > previous_calls.get(operation, 0):
+                    regressions.append(
+                        f"{name} {phase} {operation}: {count} calls (baseline {previous_calls.get(operation, 0)})"
+                    )
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lambdas", nargs="+", default=DEFAULT_LAMBDAS, choices=sorted(SCENARIOS))
+    parser.add_argument("--warm-iterations", type=int, default=20)
+    parser.add_argument("--import-repeats", type=int, default=3)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="write the API call counts as the new baseline")
+    parser.add_argument("--output", type=Path, help="also write the full results, timings included, to this file")
+    parser.add_argument("--tolerance", type=float, help="also gate timings at this ratio against the baseline")
+    parser.add_argument("--slack-ms", type=float, default=10.0, help="absolute timing slack in milliseconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.update(BENCHMARK_ENV)
+
+    results = {}
+    for name in args.lambdas:
+        results[name] = run_benchmark(name, args.warm_iterations, args.import_repeats)
+        print(
+            f"{name}: import {results[name]['import_ms']} ms, first call {results[name]['first_call_ms']} ms, "
+            f"warm call {results[name]['warm_call_ms']} ms, API calls {results[name]['api_calls']['warm_call']}"
+        )
+
+    document = json.dumps(results, indent=2, sort_keys=True) + "\n"
+    if args.output:
+        args.output.write_text(document)
+
+    if args.update_baseline:
+        api_calls = {name: {"api_calls": result["api_calls"]} for name, result in results.items()}
+        args.baseline.write_text(json.dumps(api_calls, indent=2, sort_keys=True) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline} - run with --update-baseline to record one")
+        return 0
+
+    regressions = compare_with_baseline(results, json.loads(args.baseline.read_text()), args.tolerance, args.slack_ms)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        return 1
+
+    print("No benchmark regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
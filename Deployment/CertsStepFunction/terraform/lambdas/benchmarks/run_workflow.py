@@ -0,0 +1,349 @@
+"""Run the certificate state machine locally against the in-process AWS fakes.
+
+function.json is interpreted state by state - Task, Choice, Pass, Succeed and
+Fail states, Parameters with ".$" paths (including "$$" context paths such as
+$$.State.EnteredTime), ResultPath, Retry and Catch - and each Task calls the
+Lambda's lambda_handler directly, with its clients bound to fakes.py as in
+run_benchmarks.py. Every execution reports the path it took; the run reports
+per-state latency and transition counts.
+
+    python benchmarks/run_workflow.py                       # one renewal end to end
+    python benchmarks/run_workflow.py --executions 20 --scenario valid
+"""
+import argparse
+import copy
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import run_benchmarks
+from fakes import make_fakes
+from run_benchmarks import BENCHMARK_DOMAIN, BENCHMARK_ENV, LAMBDAS_DIR, bind_fakes, load_lambda, percentile
+
+DEFAULT_DEFINITION = LAMBDAS_DIR / "function.json"
+# Task Resource placeholders in function.json and the Lambda each one runs
+TASK_LAMBDAS = {
+    "${check_certificate_lambda_arn}": "check-certs",
+    "${generate_certificate_lambda_arn}": "generate-certs",
+    "${replace_certificate_lambda_arn}": "replace-certs",
+    "${notification_lambda_arn}": "notification",
+}
+# Days until the seeded certificate expires; check-certs renews inside 30 days
+SCENARIOS = {"renewal": 5, "valid": 60, "missing": None}
+
+PATH_TOKEN = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+
+
+class WorkflowError(Exception):
+    """A state failed; error and cause follow Step Functions naming."""
+
+    def __init__(self, error, cause):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def load_definition(path=DEFAULT_DEFINITION, bucket_name=BENCHMARK_ENV["S3_BUCKET"]):
+    """Load a state machine definition, filling in the Terraform template variables it uses."""
+    return json.loads(Path(path).read_text().replace("${certificate_bucket_name}", bucket_name))
+
+
+def resolve_path(path, data, context):
+    """Resolve a "$.a.b[0]" or "$$.State.Name" reference; a missing field is a States.Runtime error."""
+    root, rest = (context, path[2:]) if path.startswith("$$") else (data, path[1:])
+    value = root
+    for key, index in PATH_TOKEN.findall(rest):
+        try:
+            value = value[int(index)] if index else value[key]
+        except (KeyError, IndexError, TypeError):
+            raise WorkflowError("States.Runtime", f"Path {path} could not be resolved against the state input")
+    return value
+
+
+def resolve_parameters(template, data, context):
+    """Build a Parameters payload, resolving every "key.$" field."""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith(".$"):
+                resolved[key[:-2]] = resolve_path(value, data, context)
+            else:
+                resolved[key] = resolve_parameters(value, data, context)
+        return resolved
+    if isinstance(template, list):
+        return [resolve_parameters(item, data, context) for item in template]
+    return template
+
+
+def apply_result_path(data, result, result_path="$"):
+    """Place a state's result into its input as ResultPath says."""
+    if result_path is None:
+        return data
+    if result_path == "$":
+        return result
+    output = copy.deepcopy(data)
+    target = output
+    keys = [key for key, _ in PATH_TOKEN.findall(result_path[1:])]
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = result
+    return output
+
+
+COMPARISONS = {
+    "BooleanEquals": lambda value, expected: value is expected,
+    "StringEquals": lambda value, expected: value == expected,
+    "NumericEquals": lambda value, expected: value == expected,
+    "NumericGreaterThan": lambda value, expected: value > expected,
+    "NumericGreaterThanEquals": lambda value, expected: value >= expected,
+    "NumericLessThan": lambda value, expected: value < expected,
+    "NumericLessThanEquals": lambda value, expected: value <= expected,
+    "IsNull": lambda value, expected: (value is None) is expected,
+}
+
+
+def evaluate_rule(rule, data, context):
+    """Whether a Choice rule matches the state input."""
+    if "And" in rule:
+        return all(evaluate_rule(inner, data, context) for inner in rule["And"])
+    if "Or" in rule:
+        return any(evaluate_rule(inner, data, context) for inner in rule["Or"])
+    if "Not" in rule:
+        return not evaluate_rule(rule["Not"], data, context)
+    if "IsPresent" in rule:
+        try:
+            resolve_path(rule["Variable"], data, context)
+            present = True
+        except WorkflowError:
+            present = False
+        return present is rule["IsPresent"]
+
+    value = resolve_path(rule["Variable"], data, context)
+    for operator, compare in COMPARISONS.items():
+        if operator in rule:
+            return compare(value, rule[operator])
+    raise WorkflowError("States.Runtime", f"Unsupported Choice rule: {sorted(rule)}")
+
+
+def error_matches(error_equals, error):
+    """Whether a Retry or Catch ErrorEquals list covers an error name."""
+    if error == "States.Runtime":
+        # Runtime errors are never retried or caught by States.ALL
+        return error in error_equals
+    return "States.ALL" in error_equals or "States.TaskFailed" in error_equals or error in error_equals
+
+
+class LocalStateMachine:
+    """Interprets a state machine definition in-process.
+
+    handlers maps each Task Resource to a callable taking (event, context).
+    Retry intervals are multiplied by retry_delay_scale, so runs can keep the
+    definition's backoff shape without waiting on it.
+    """
+
+    def __init__(self, definition, handlers, retry_delay_scale=0.0, clock=time.perf_counter, sleep=time.sleep):
+        self.definition = definition
+        self.handlers = handlers
+        self.retry_delay_scale = retry_delay_scale
+        self.clock = clock
+        self.sleep = sleep
+
+    def run(self, execution_input, name="local"):
+        """Run one execution and return its status, output, path and per-state timings."""
+        started_at = datetime.now(timezone.utc)
+        context = {"Execution": {"Id": f"local:{name}", "Name": name, "Input": execution_input,
+                                 "StartTime": _timestamp(started_at)}}
+        execution = {"name": name, "status": "RUNNING", "path": [], "states": [], "transitions": Counter()}
+        data = copy.deepcopy(execution_input)
+        state_name = self.definition["StartAt"]
+
+        while state_name:
+            state = self.definition["States"][state_name]
+            context["State"] = {"Name": state_name, "EnteredTime": _timestamp(datetime.now(timezone.utc)), "RetryCount": 0}
+            execution["path"].append(state_name)
+            entered = self.clock()
+            try:
+                data, next_state, retries = self.run_state(state, data, context)
+            except WorkflowError as e:
+                execution["states"].append({"state": state_name, "ms": (self.clock() - entered) * 1000, "retries": 0})
+                execution.update(status="FAILED", error=e.error, cause=e.cause)
+                return execution
+
+            execution["states"].append({"state": state_name, "ms": (self.clock() - entered) * 1000, "retries": retries})
+            if state["Type"] == "Fail":
+                execution.update(status="FAILED", error=state.get("Error", "States.Fail"), cause=state.get("Cause"))
+                return execution
+            if next_state:
+                execution["transitions"][f"{state_name} -> {next_state}"] += 1
+            state_name = next_state
+
+        execution.update(status="SUCCEEDED", output=data)
+        return execution
+
+    def run_state(self, state, data, context):
+        """Run one state; returns (output, next state or None at the end, retries taken)."""
+        state_type = state["Type"]
+        if state_type == "Choice":
+            for rule in state.get("Choices", []):
+                if evaluate_rule(rule, data, context):
+                    return data, rule["Next"], 0
+            if "Default" not in state:
+                raise WorkflowError("States.NoChoiceMatched", "No Choice rule matched and there is no Default")
+            return data, state["Default"], 0
+        if state_type in ("Succeed", "Fail"):
+            return data, None, 0
+        if state_type == "Pass":
+            result = resolve_parameters(state["Parameters"], data, context) if "Parameters" in state else state.get("Result", data)
+            return apply_result_path(data, result, state.get("ResultPath", "$")), state.get("Next"), 0
+        if state_type == "Task":
+            return self.run_task(state, data, context)
+        raise WorkflowError("States.Runtime", f"Unsupported state type: {state_type}")
+
+    def run_task(self, state, data, context):
+        """Invoke a Task's handler under its Retry and Catch rules."""
+        handler = self.handlers.get(state["Resource"])
+        if handler is None:
+            raise WorkflowError("States.Runtime", f"No local handler for resource {state['Resource']}")
+
+        retriers = state.get("Retry", [])
+        attempts = [0] * len(retriers)
+        retries = 0
+        while True:
+            payload = resolve_parameters(state["Parameters"], data, context) if "Parameters" in state else data
+            try:
+                result = handler(copy.deepcopy(payload), None)
+                break
+            except Exception as e:
+                error = e.error if isinstance(e, WorkflowError) else type(e).__name__
+                cause = e.cause if isinstance(e, WorkflowError) else str(e)
+
+            retrier = next((i for i, rule in enumerate(retriers) if error_matches(rule["ErrorEquals"], error)), None)
+            if retrier is not None and attempts[retrier] < retriers[retrier].get("MaxAttempts", 3):
+                rule = retriers[retrier]
+                delay = rule.get("IntervalSeconds", 1) * rule.get("BackoffRate", 2.0) ** attempts[retrier]
+                attempts[retrier] += 1
+                retries += 1
+                context["State"]["RetryCount"] = retries
+                self.sleep(min(delay, rule.get("MaxDelaySeconds", delay)) * self.retry_delay_scale)
+                continue
+
+            catcher = next((rule for rule in state.get("Catch", []) if error_matches(rule["ErrorEquals"], error)), None)
+            if catcher is None:
+                raise WorkflowError(error, cause)
+            output = apply_result_path(data, {"Error": error, "Cause": cause}, catcher.get("ResultPath", "$"))
+            return output, catcher["Next"], retries
+
+        next_state = None if state.get("End") else state["Next"]
+        return apply_result_path(data, result, state.get("ResultPath", "$")), next_state, retries
+
+
+def make_local_handlers(fakes):
+    """Load every Task's Lambda bound to the fakes, with certbot replaced as in the benchmarks."""
+    handlers = {}
+    for resource, name in TASK_LAMBDAS.items():
+        module = load_lambda(name)
+        bind_fakes(module, fakes)
+        if name == "generate-certs":
+            run_benchmarks.setup_generate_certs(module, fakes)
+        handlers[resource] = module.lambda_handler
+    return handlers
+
+
+def seed_scenario(fakes, scenario, domain):
+    """Put the certificate a scenario starts from into the ACM fake."""
+    days = SCENARIOS[scenario]
+    if days is not None:
+        fakes["acm"].add_certificate(domain, datetime.now(timezone.utc) + timedelta(days=days))
+
+
+def summarize(executions):
+    """Aggregate per-state latency, retries and transition counts over executions."""
+    timings = defaultdict(list)
+    retries = Counter()
+    transitions = Counter()
+    for execution in executions:
+        for entry in execution["states"]:
+            timings[entry["state"]].append(entry["ms"])
+            retries[entry["state"]] += entry["retries"]
+        transitions.update(execution["transitions"])
+
+    return {
+        "executions": len(executions),
+        "status": dict(Counter(execution["status"] for execution in executions)),
+        "states": {
+            state: {
+                "entered": len(values),
+                "retries": retries[state],
+                "mean_ms": round(sum(values) / len(values), 2),
+                "p95_ms": round(percentile(values, 95), 2),
+            }
+            for state, values in timings.items()
+        },
+        "transitions": dict(sorted(transitions.items())),
+    }
+
+
+def run_workflow(executions=1, scenario="renewal", definition_path=DEFAULT_DEFINITION):
+    """Run executions of the state machine against fresh fakes and return the summary."""
+    fakes = make_fakes()
+    machine = LocalStateMachine(load_definition(definition_path), make_local_handlers(fakes))
+
+    results = []
+    for number in range(1, executions + 1):
+        # A domain per execution so each one starts from the scenario's certificate
+        domain = f"wf{number}.{BENCHMARK_DOMAIN}"
+        seed_scenario(fakes, scenario, domain)
+        results.append(machine.run({"domain": domain}, name=f"{scenario}-{number}"))
+
+    summary = summarize(results)
+    summary["api_calls"] = fakes["counter"].snapshot()
+    summary["failures"] = [
+        {"name": r["name"], "state": r["path"][-1], "error": r["error"], "cause": r["cause"]}
+        for r in results if r["status"] == "FAILED"
+    ]
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'State':<36} {'Entered':>7} {'Retries':>7} {'Mean ms':>9} {'p95 ms':>9}")
+    for state, stats in summary["states"].items():
+        print(f"{state:<36} {stats['entered']:>7} {stats['retries']:>7} {stats['mean_ms']:>9.2f} {stats['p95_ms']:>9.2f}")
+    print("\nTransitions:")
+    for transition, count in summary["transitions"].items():
+        print(f"  {transition}: {count}")
+    print(f"\nExecutions: {summary['executions']} {summary['status']}; API calls: {summary['api_calls']}")
+    for failure in summary["failures"]:
+        print(f"FAILED {failure['name']} in {failure['state']}: {failure['error']}: {failure['cause']}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--executions", type=int, default=1)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="renewal")
+    parser.add_argument("--definition", type=Path, default=DEFAULT_DEFINITION)
+    parser.add_argument("--output", type=Path, help="also write the summary to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.update(BENCHMARK_ENV)
+
+    summary = run_workflow(args.executions, args.scenario, args.definition)
+    print_summary(summary)
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2, sort_keys=True) + "\n")
+    return 1 if summary["failures"] else 0
+
+
+def _timestamp(moment):
+    return moment.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
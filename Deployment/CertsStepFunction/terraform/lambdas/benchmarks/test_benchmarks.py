@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+import run_benchmarks
+from fakes import make_fakes
+
+
+def metrics(import_ms=100.0, first_call_ms=2.0, warm_call_ms=1.0, warm_calls=None):
+    """Return benchmark metrics in the shape run_benchmark produces."""
+    return {
+        "import_ms": import_ms,
+        "first_call_ms": first_call_ms,
+        "warm_call_ms": warm_call_ms,
+        "api_calls": {"first_call": {}, "warm_call": warm_calls or {"s3.put_object": 1}},
+    }
+
+
+class TestFakes:
+    """Test suite for the AWS fakes."""
+
+    def test_calls_counted_per_operation(self):
+        """Test every fake call is recorded against its service and operation."""
+        fakes = make_fakes()
+        fakes["s3"].put_object(Bucket="bucket", Key="a.json", Body="{}")
+        fakes["s3"].get_object(Bucket="bucket", Key="a.json")
+        fakes["s3"].get_object(Bucket="bucket", Key="a.json")
+
+        assert fakes["counter"].snapshot() == {"s3.get_object": 2, "s3.put_object": 1}
+
+    def test_missing_object_raises_no_such_key(self):
+        """Test reading a missing object raises the client's NoSuchKey."""
+        fakes = make_fakes()
+
+        with pytest.raises(fakes["s3"].exceptions.NoSuchKey):
+            fakes["s3"].get_object(Bucket="bucket", Key="missing.json")
+
+
+class TestCompareWithBaseline:
+    """Test suite for regression detection."""
+
+    def test_within_tolerance_passes(self):
+        """Test small timing differences are not regressions."""
+        baseline = {"check-certs": metrics()}
+        results = {"check-certs": metrics(import_ms=150.0, warm_call_ms=5.0)}
+
+        assert run_benchmarks.compare_with_baseline(results, baseline, tolerance=2.0, slack_ms=10.0) == []
+
+    def test_slower_timing_is_regression(self):
+        """Test a timing beyond baseline * tolerance + slack is reported."""
+        baseline = {"check-certs": metrics()}
+        results = {"check-certs": metrics(import_ms=250.0)}
+
+        regressions = run_benchmarks.compare_with_baseline(results, baseline, tolerance=2.0, slack_ms=10.0)
+
+        assert len(regressions) == 1
+        assert regressions[0].startswith("check-certs import_ms")
+
+    def test_timings_are_only_gated_on_request(self):
+        """Test timings are not compared unless a tolerance is given."""
+        baseline = {"check-certs": metrics()}
+        results = {"check-certs": metrics(import_ms=10000.0)}
+
+        assert run_benchmarks.compare_with_baseline(results, baseline) == []
+
+    def test_extra_api_calls_are_regressions(self):
+        """Test an invocation making more API calls than the baseline is reported."""
+        baseline = {"check-certs": metrics()}
+        results = {"check-certs": metrics(warm_calls={"s3.put_object": 2, "acm.describe_certificate": 1})}
+
+        regressions = run_benchmarks.compare_with_baseline(results, baseline)
+
+        assert len(regressions) == 2
+
+    def test_lambdas_missing_from_baseline_are_skipped(self):
+        """Test a Lambda without a baseline entry is not a regression."""
+        assert run_benchmarks.compare_with_baseline({"notification": metrics()}, {}) == []
+
+
+class TestRunBenchmark:
+    """Test suite for running the benchmarks against the fakes."""
+
+    def test_notification_benchmark(self):
+        """Test a notification run publishes once per invocation."""
+        result = run_benchmarks.run_benchmark("notification", warm_iterations=2, import_repeats=0)
+
+        assert result["import_ms"] is None
+        assert result["api_calls"]["warm_call"] == {"sns.publish": 1}
+
+    def test_generate_benchmark_reuses_stored_account_lookup(self):
+        """Test the certbot account lookup happens on the first call only and EC keys skip the key pool."""
+        result = run_benchmarks.run_benchmark("generate-certs", warm_iterations=1, import_repeats=0)
+
+        assert result["api_calls"]["first_call"]["s3.get_object"] == 1
+        assert "s3.get_object" not in result["api_calls"]["warm_call"]
+        assert "s3.list_objects_v2" not in result["api_calls"]["warm_call"]
+        assert "s3.delete_object" not in result["api_calls"]["warm_call"]
+
+    def test_main_records_then_compares(self, tmp_path):
+        """Test the baseline keeps only API call counts and a run against it has no regressions."""
+        baseline = tmp_path / "baseline.json"
+        args = ["--lambdas", "check-certs", "--import-repeats", "0", "--warm-iterations", "2", "--baseline", str(baseline)]
+
+        assert run_benchmarks.main([*args, "--update-baseline"]) == 0
+        assert json.loads(baseline.read_text()) == {"check-certs": {"api_calls": {
+            "first_call": {"acm.describe_certificate": 1, "acm.list_certificates": 1, "s3.put_object": 1},
+            "warm_call": {"acm.list_certificates": 1, "s3.put_object": 1},
+        }}}
+        assert run_benchmarks.main(args) == 0
+
+    def test_timings_compare_against_results_from_the_same_machine(self, tmp_path):
+        """Test --tolerance gates timings against a results file written with --output."""
+        results = tmp_path / "results.json"
+        args = ["--lambdas", "check-certs", "--import-repeats", "0", "--warm-iterations", "2"]
+
+        assert run_benchmarks.main([*args, "--output", str(results), "--baseline", str(tmp_path / "none.json")]) == 0
+        assert json.loads(results.read_text())["check-certs"]["warm_call_ms"] is not None
+        assert run_benchmarks.main([*args, "--baseline", str(results), "--tolerance", "2.0", "--slack-ms", "1000"]) == 0
@@ -0,0 +1,136 @@
+import pytest
+
+import run_workflow
+from errors import RetryableError
+
+
+def task_definition(retry=None, catch=None):
+    """A one-Task state machine whose Task feeds a Choice."""
+    task = {
+        "Type": "Task",
+        "Resource": "task",
+        "Parameters": {"domain.$": "$.domain", "entered.$": "$$.State.EnteredTime", "fixed": "value"},
+        "ResultPath": "$.result",
+        "Next": "Done?"
+    }
+    if retry:
+        task["Retry"] = retry
+    if catch:
+        task["Catch"] = catch
+    return {
+        "StartAt": "Task",
+        "States": {
+            "Task": task,
+            "Done?": {
+                "Type": "Choice",
+                "Choices": [{"Variable": "$.result.done", "BooleanEquals": True, "Next": "Succeeded"}],
+                "Default": "Failed"
+            },
+            "Succeeded": {"Type": "Succeed"},
+            "Failed": {"Type": "Fail", "Error": "NotDone", "Cause": "Task reported not done"},
+            "Caught": {"Type": "Pass", "End": True}
+        }
+    }
+
+
+def flaky_handler(errors):
+    """A handler raising each of errors in turn, then succeeding; records its events."""
+    events = []
+
+    def handler(event, context):
+        events.append(event)
+        if len(events) <= len(errors):
+            raise errors[len(events) - 1]
+        return {"done": True}
+
+    handler.events = events
+    return handler
+
+
+class TestLocalStateMachine:
+    """Test suite for the state machine interpreter."""
+
+    def test_parameters_result_path_and_choice(self):
+        """Test Parameters resolve input and context paths and ResultPath feeds the Choice."""
+        handler = flaky_handler([])
+        machine = run_workflow.LocalStateMachine(task_definition(), {"task": handler})
+
+        execution = machine.run({"domain": "example.com"})
+
+        assert execution["status"] == "SUCCEEDED"
+        assert execution["path"] == ["Task", "Done?", "Succeeded"]
+        assert execution["output"] == {"domain": "example.com", "result": {"done": True}}
+        assert handler.events[0]["domain"] == "example.com"
+        assert handler.events[0]["fixed"] == "value"
+        assert handler.events[0]["entered"].endswith("Z")
+
+    def test_only_listed_errors_are_retried(self):
+        """Test a RetryableError is retried with backoff while other errors fail the execution at once."""
+        retry = [{"ErrorEquals": ["RetryableError"], "IntervalSeconds": 2, "MaxAttempts": 3, "BackoffRate": 2}]
+        delays = []
+
+        transient = flaky_handler([RetryableError("throttled"), RetryableError("throttled")])
+        machine = run_workflow.LocalStateMachine(task_definition(retry), {"task": transient},
+                                                 retry_delay_scale=1.0, sleep=delays.append)
+        execution = machine.run({"domain": "example.com"})
+
+        assert execution["status"] == "SUCCEEDED"
+        assert execution["states"][0]["retries"] == 2
+        assert delays == [2, 4]
+
+        permanent = flaky_handler([ValueError("bad PEM")])
+        machine = run_workflow.LocalStateMachine(task_definition(retry), {"task": permanent}, sleep=delays.append)
+        execution = machine.run({"domain": "example.com"})
+
+        assert (execution["status"], execution["error"], execution["cause"]) == ("FAILED", "ValueError", "bad PEM")
+        assert len(permanent.events) == 1
+
+    def test_catch_routes_to_its_next_state(self):
+        """Test a caught error is placed at the Catch ResultPath and execution continues."""
+        catch = [{"ErrorEquals": ["States.ALL"], "ResultPath": "$.error", "Next": "Caught"}]
+        machine = run_workflow.LocalStateMachine(task_definition(catch=catch), {"task": flaky_handler([KeyError("domain")])})
+
+        execution = machine.run({"domain": "example.com"})
+
+        assert execution["path"] == ["Task", "Caught"]
+        assert execution["output"]["error"]["Error"] == "KeyError"
+
+    def test_missing_path_is_a_runtime_error(self):
+        """Test a Parameters path missing from the input fails the execution."""
+        machine = run_workflow.LocalStateMachine(task_definition(), {"task": flaky_handler([])})
+
+        execution = machine.run({})
+
+        assert execution["error"] == "States.Runtime"
+        assert "$.domain" in execution["cause"]
+
+
+class TestRunWorkflow:
+    """Test suite for running function.json against the Lambdas and fakes."""
+
+    def test_lambda_timeouts_are_retried(self):
+        """Test timed-out or crashed check, generate and replace invocations are retried."""
+        definition = run_workflow.load_definition()
+        tasks = ("CheckCertificate", "GenerateCertificate", "ReplaceCertificate")
+
+        for name in tasks:
+            retriers = definition["States"][name]["Retry"]
+            for error in ("States.Timeout", "Sandbox.Timedout", "Lambda.Unknown", "RetryableError"):
+                assert any(run_workflow.error_matches(rule["ErrorEquals"], error) for rule in retriers), (name, error)
+            assert not any(run_workflow.error_matches(rule["ErrorEquals"], "ValueError") for rule in retriers)
+
+    @pytest.mark.parametrize("scenario,final_state", [
+        ("renewal", "SendSuccessNotification"),
+        ("missing", "SendSuccessNotification"),
+        ("valid", "SendNoExpiringNotification"),
+    ])
+    def test_scenarios_end_to_end(self, scenario, final_state):
+        """Test each scenario walks the real definition to its notification."""
+        summary = run_workflow.run_workflow(executions=2, scenario=scenario)
+
+        assert summary["status"] == {"SUCCEEDED": 2}
+        assert summary["failures"] == []
+        assert summary["states"][final_state]["entered"] == 2
+        assert summary["states"]["CheckCertificate"]["mean_ms"] > 0
+        assert summary["transitions"]["CheckCertificate -> CertificateExpired?"] == 2
+        assert summary["api_calls"]["sns.publish"] == 2
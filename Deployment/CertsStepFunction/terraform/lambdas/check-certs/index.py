@@ -1,24 +1,163 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
+import gzip
 import json
 import logging
 import os
+import threading
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
-import boto3
+from acm_certificates import CertificateTrie, build_certificate_index, list_acm_certificates
+from aws_clients import get_client, lazy_client, log_import_time
+from botocore.config import Config
+from errors import MissingInputError, classify_error
 
 # Initialize AWS clients and environment variables
-s3 = boto3.client("s3")
-acm = boto3.client("acm")
+s3 = lazy_client("s3")
+acm = lazy_client("acm")
 bucket_name = os.environ.get("S3_BUCKET")
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+batch_max_workers = int(os.environ.get("BATCH_MAX_WORKERS", "8"))
+describe_cache_ttl = float(os.environ.get("DESCRIBE_CACHE_TTL_SECONDS", "300"))
+describe_cache_max_entries = int(os.environ.get("DESCRIBE_CACHE_MAX_ENTRIES", "1024"))
+run_log_compress = os.environ.get("RUN_LOG_COMPRESS", "true").lower() == "true"
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(getattr(logging, log_level, logging.INFO))
 
 
+class DescribeCertificateCache:
+    """TTL and size-bounded LRU cache of describe_certificate results keyed by ARN.
+
+    Lives at module level so entries survive across warm invocations. A TTL
+    of zero disables caching. Each entry also records the version it was
+    described at, taken from the ListCertificates summary; a re-import keeps
+    the ARN but changes the version, so the stale detail is not served.
+    """
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, certificate_arn, version=None):
+        """Return the cached detail for an ARN, or None if missing, expired or of another version."""
+        with self._lock:
+            entry = self._entries.get(certificate_arn)
+            if entry is None or entry[0] <= time.monotonic() or entry[1] != version:
+                if entry is not None:
+                    del self._entries[certificate_arn]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(certificate_arn)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, certificate_arn, detail, version=None):
+        """Cache the detail for an ARN at a version, evicting the least recently used entries."""
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[certificate_arn] = (time.monotonic() + self.ttl_seconds, version, detail)
+            self._entries.move_to_end(certificate_arn)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def log_stats(self):
+        """Log hit/miss counters for the cache."""
+        logger.info(
+            "describe_certificate cache - hits: %d, misses: %d, entries: %d",
+            self.hits,
+            self.misses,
+            len(self._entries),
+        )
+
+
+describe_cache = DescribeCertificateCache(describe_cache_ttl, describe_cache_max_entries)
+
+class RunLog:
+    """Buffer of batch check records flushed to S3 as one newline-delimited JSON object.
+
+    Replaces the per-domain check_metadata.json PUTs during batch runs, so a
+    run costs a single (KMS-encrypted) PUT regardless of the domain count.
+    """
+
+    def __init__(self, run_id, compress=True):
+        self.run_id = run_id
+        self.compress = compress
+        self.records = []
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """S3 key the run log is flushed to."""
+        suffix = ".ndjson.gz" if self.compress else ".ndjson"
+        return f"runs/{self.run_id}/check_results{suffix}"
+
+    def append(self, record):
+        """Buffer a record for the run."""
+        with self._lock:
+            self.records.append(record)
+
+    def flush(self):
+        """Write all buffered records to S3 in one PUT and return the key."""
+        with self._lock:
+            body = "".join(
+                json.dumps(record, separators=(",", ":"), default=str) + "\n" for record in self.records
+            ).encode("utf-8")
+            count = len(self.records)
+
+        if self.compress:
+            body = gzip.compress(body)
+
+        s3.put_object(
+            Bucket=bucket_name,
+            Key=self.key,
+            Body=body,
+            ContentType="application/x-ndjson",
+            ServerSideEncryption="aws:kms",
+        )
+        logger.info("Run log stored in S3: %s (%d records, %d bytes)", self.key, count, len(body))
+        return self.key
+
+
+def read_run_log(key):
+    """Stream records back out of a run log object in S3."""
+    body = s3.get_object(Bucket=bucket_name, Key=key)["Body"]
+    lines = gzip.GzipFile(fileobj=body) if key.endswith(".gz") else body.iter_lines()
+
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
 def lambda_handler(event, context):
     """Lambda handler to check for expiring certificates."""
+    if "regions" in event:
+        domains = event["domains"] if "domains" in event else [event.get("domain", "example.com")]
+        return handle_multi_region_check(domains, event["regions"])
+    if "domains" in event:
+        return handle_batch_check(event["domains"])
+
     domain = event.get("domain", "example.com")
     transaction_id = str(uuid.uuid4())
 
@@ -27,7 +166,7 @@ def lambda_handler(event, context):
 
     if not bucket_name:
         logger.error("S3_BUCKET environment variable is required but not set")
-        raise ValueError("S3_BUCKET environment variable is required")
+        raise MissingInputError("S3_BUCKET environment variable is required")
 
     try:
         certificate_data = get_certificate_details(domain)
@@ -40,34 +179,207 @@ def lambda_handler(event, context):
     except Exception as e:
         logger.error("Error during certificate check: %s", str(e), exc_info=True)
         store_error_metadata(transaction_id, domain, str(e))
-        raise e
+        # Only transient failures are retried by the state machine
+        error = classify_error(e)
+        if error is e:
+            raise
+        raise error from e
+
+    finally:
+        describe_cache.log_stats()
+
+
+def handle_batch_check(domains):
+    """Check a list of domains (or "all") against a single ACM listing."""
+    logger.info("Starting batch certificate check")
+
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    certificates = list_acm_certificates(acm)
+    certificate_index = build_certificate_index(certificates)
+
+    if domains == "all":
+        domains = sorted({cert["DomainName"] for cert in certificates})
+    if not isinstance(domains, list) or not domains:
+        raise MissingInputError("domains must be a non-empty list of domain names or \"all\"")
+
+    workers = max(1, min(batch_max_workers, len(domains)))
+    logger.info("Checking %d domains with %d workers", len(domains), workers)
+
+    run_log = RunLog(str(uuid.uuid4()), compress=run_log_compress)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda domain: check_domain(domain, certificate_index, run_log), domains))
+
+    response = {
+        "batch": True,
+        "bucket_name": bucket_name,
+        "run_id": run_log.run_id,
+        "run_log": run_log.flush(),
+        "domains_checked": len(results),
+        "expired_count": sum(1 for result in results if result.get("expired")),
+        "error_count": sum(1 for result in results if "error" in result),
+        "results": results,
+    }
+    logger.info(
+        "Batch certificate check completed - checked: %d, expired: %d, errors: %d",
+        response["domains_checked"],
+        response["expired_count"],
+        response["error_count"],
+    )
+    describe_cache.log_stats()
+    return response
+
+
+def handle_multi_region_check(domains, regions):
+    """Check domains across several regions concurrently, merging results per domain."""
+    logger.info("Starting multi-region certificate check for regions: %s", regions)
+
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+    if not isinstance(regions, list) or not regions:
+        raise MissingInputError("regions must be a non-empty list of region names")
+
+    # List every region concurrently; each region gets its own pooled client
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        listings = dict(zip(
+            regions,
+            executor.map(lambda region: list_acm_certificates(get_regional_acm_client(region)), regions),
+        ))
+
+    if domains == "all":
+        domains = sorted({cert["DomainName"] for certificates in listings.values() for cert in certificates})
+    if not isinstance(domains, list) or not domains:
+        raise MissingInputError("domains must be a non-empty list of domain names or \"all\"")
+
+    indexes = {region: build_certificate_index(certificates) for region, certificates in listings.items()}
+    checks = [(domain, region) for domain in domains for region in regions]
+    workers = max(1, min(batch_max_workers * len(regions), len(checks)))
+    logger.info("Checking %d domains in %d regions with %d workers", len(domains), len(regions), workers)
+
+    run_log = RunLog(str(uuid.uuid4()), compress=run_log_compress)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        region_results = list(executor.map(
+            lambda check: check_domain(
+                check[0], indexes[check[1]], run_log, get_regional_acm_client(check[1]), region=check[1]
+            ),
+            checks,
+        ))
+
+    merged = {domain: {"domain": domain, "expired": False, "regions": {}} for domain in domains}
+    for (domain, region), result in zip(checks, region_results):
+        merged[domain]["regions"][region] = result
+        merged[domain]["expired"] = merged[domain]["expired"] or bool(result.get("expired"))
+    results = [merged[domain] for domain in domains]
+
+    response = {
+        "batch": True,
+        "bucket_name": bucket_name,
+        "regions": regions,
+        "run_id": run_log.run_id,
+        "run_log": run_log.flush(),
+        "domains_checked": len(results),
+        "expired_count": sum(1 for result in results if result["expired"]),
+        "error_count": sum(1 for result in region_results if "error" in result),
+        "results": results,
+    }
+    logger.info(
+        "Multi-region certificate check completed - checked: %d, expired: %d, errors: %d",
+        response["domains_checked"],
+        response["expired_count"],
+        response["error_count"],
+    )
+    describe_cache.log_stats()
+    return response
+
+
+def get_regional_acm_client(region):
+    """Return the pooled ACM client for a region, creating it on first use."""
+    return get_client("acm", region_name=region, config=Config(max_pool_connections=max(10, batch_max_workers)))
+
+
+def check_domain(domain, certificate_index, run_log=None, client=None, region=None):
+    """Check a single domain within a batch, recording failures instead of raising."""
+    transaction_id = str(uuid.uuid4())
+    logger.debug("Batch check for domain: %s (transaction: %s)", domain, transaction_id)
+
+    try:
+        certificate_data = get_certificate_details(domain, certificate_index, client)
+
+        if certificate_data:
+            response = handle_existing_certificate(certificate_data, domain, transaction_id, run_log)
+        else:
+            response = handle_missing_certificate(domain, transaction_id, run_log)
+
+    except Exception as e:
+        logger.error("Error during batch check for domain %s: %s", domain, str(e), exc_info=True)
+        record_error_metadata(transaction_id, domain, str(e), run_log)
+        response = create_response(expired=False, domain=domain, transaction_id=transaction_id)
+        response["error"] = str(e)
+
+    if region:
+        response["region"] = region
+    return response
 
 
-def get_certificate_details(domain):
-    """Get certificate details from ACM for a specific domain."""
+def get_certificate_index(client=None):
+    """List ACM once and return the certificate index."""
+    return build_certificate_index(list_acm_certificates(client or acm))
+
+
+def get_certificate_details(domain, certificate_index=None, client=None):
+    """Get certificate details from ACM for a specific domain.
+
+    An index from get_certificate_index can be passed in so that batch
+    checks share one ACM listing instead of listing per domain, and a
+    regional client can be passed for multi-region checks.
+    """
     logger.debug("Searching ACM for certificate with domain: %s", domain)
 
     try:
-        certificates = acm.list_certificates()["CertificateSummaryList"]
-        logger.debug("Found %d certificates in ACM", len(certificates))
-
-        for cert in certificates:
-            if cert["DomainName"] == domain:
-                logger.debug("Found matching certificate: %s", cert["CertificateArn"])
-                cert_detail = acm.describe_certificate(CertificateArn=cert["CertificateArn"])
-                return {
-                    "certificate_arn": cert["CertificateArn"],
-                    "detail": cert_detail["Certificate"],
-                }
-
-        logger.debug("No certificate found for domain: %s", domain)
-        return None
+        if certificate_index is None:
+            certificate_index = get_certificate_index(client)
+
+        arns = certificate_index.match(domain)
+        if not arns:
+            logger.debug("No certificate found for domain: %s", domain)
+            return None
+
+        certificate_arn = arns[0]
+        logger.debug("Found matching certificate: %s", certificate_arn)
+        return {
+            "certificate_arn": certificate_arn,
+            "detail": describe_certificate(
+                certificate_arn, client, listing_version(certificate_index.summaries.get(certificate_arn))
+            ),
+        }
 
     except Exception as e:
         logger.error("Error retrieving certificate details for domain %s: %s", domain, str(e))
         raise
 
 
+def listing_version(summary):
+    """Version of a certificate as listed by ListCertificates; a re-import changes it."""
+    if not summary:
+        return None
+    return summary.get("ImportedAt"), summary.get("NotAfter")
+
+
+def describe_certificate(certificate_arn, client=None, version=None):
+    """Describe a certificate in ACM, served from the warm-container cache when fresh and of the same version."""
+    detail = describe_cache.get(certificate_arn, version)
+    if detail is not None:
+        logger.debug("describe_certificate cache hit: %s", certificate_arn)
+        return detail
+
+    detail = (client or acm).describe_certificate(CertificateArn=certificate_arn)["Certificate"]
+    describe_cache.put(certificate_arn, detail, version)
+    return detail
+
+
 def is_certificate_expired(certificate_detail):
     """Check if certificate is expired or expiring soon."""
     expiration = certificate_detail["NotAfter"]
@@ -92,10 +404,8 @@ def is_certificate_expired(certificate_detail):
     }
 
 
-def store_check_metadata(transaction_id, domain, certificate_data, check_result):
-    """Store certificate check metadata in S3."""
-    logger.debug("Storing check metadata for transaction: %s", transaction_id)
-
+def build_check_metadata(transaction_id, domain, certificate_data, check_result):
+    """Build the certificate check metadata record."""
     # Determine certificate status
     if certificate_data:
         certificate_arn = certificate_data.get("certificate_arn")
@@ -116,6 +426,14 @@ def store_check_metadata(transaction_id, domain, certificate_data, check_result)
         "is_expiring_soon": check_result.get("is_expiring_soon"),
     }
 
+    return metadata
+
+
+def store_check_metadata(transaction_id, domain, certificate_data, check_result):
+    """Store certificate check metadata in S3."""
+    logger.debug("Storing check metadata for transaction: %s", transaction_id)
+    metadata = build_check_metadata(transaction_id, domain, certificate_data, check_result)
+
     s3.put_object(
         Bucket=bucket_name,
         Key=f"transactions/{transaction_id}/check_metadata.json",
@@ -127,11 +445,19 @@ def store_check_metadata(transaction_id, domain, certificate_data, check_result)
     return metadata
 
 
-def store_error_metadata(transaction_id, domain, error_message):
-    """Store error metadata in S3."""
-    logger.error("Storing error metadata for transaction: %s", transaction_id)
+def record_check_metadata(transaction_id, domain, certificate_data, check_result, run_log=None):
+    """Buffer check metadata in the batch run log, or store it in S3 directly."""
+    if run_log is None:
+        return store_check_metadata(transaction_id, domain, certificate_data, check_result)
+
+    metadata = build_check_metadata(transaction_id, domain, certificate_data, check_result)
+    run_log.append(metadata)
+    return metadata
 
-    error_metadata = {
+
+def build_error_metadata(transaction_id, domain, error_message):
+    """Build the certificate check error record."""
+    return {
         "transaction_id": transaction_id,
         "domain": domain,
         "error_timestamp": datetime.utcnow().isoformat(),
@@ -139,6 +465,12 @@ def store_error_metadata(transaction_id, domain, error_message):
         "action": "certificate-check-error",
     }
 
+
+def store_error_metadata(transaction_id, domain, error_message):
+    """Store error metadata in S3."""
+    logger.error("Storing error metadata for transaction: %s", transaction_id)
+    error_metadata = build_error_metadata(transaction_id, domain, error_message)
+
     s3.put_object(
         Bucket=bucket_name,
         Key=f"transactions/{transaction_id}/errormetadata.json",
@@ -148,7 +480,16 @@ def store_error_metadata(transaction_id, domain, error_message):
     logger.info("Error metadata stored in S3: transactions/%s/errormetadata.json", transaction_id)
 
 
-def handle_existing_certificate(certificate_data, domain, transaction_id):
+def record_error_metadata(transaction_id, domain, error_message, run_log=None):
+    """Buffer error metadata in the batch run log, or store it in S3 directly."""
+    if run_log is None:
+        store_error_metadata(transaction_id, domain, error_message)
+        return
+
+    run_log.append(build_error_metadata(transaction_id, domain, error_message))
+
+
+def handle_existing_certificate(certificate_data, domain, transaction_id, run_log=None):
     """Handle logic when certificate exists in ACM."""
     cert_arn = certificate_data["certificate_arn"]
     logger.info("Found certificate: %s", cert_arn)
@@ -161,8 +502,8 @@ def handle_existing_certificate(certificate_data, domain, transaction_id):
     is_expiring_soon = check_result["is_expiring_soon"]
     expiration_date = check_result["expiration_date"]
 
-    # Store metadata in S3
-    store_check_metadata(transaction_id, domain, certificate_data, check_result)
+    # Store metadata in S3 (or the batch run log)
+    record_check_metadata(transaction_id, domain, certificate_data, check_result, run_log)
 
     if is_expired or is_expiring_soon:
         logger.warning(
@@ -192,10 +533,10 @@ def handle_existing_certificate(certificate_data, domain, transaction_id):
     return response
 
 
-def handle_missing_certificate(domain, transaction_id):
+def handle_missing_certificate(domain, transaction_id, run_log=None):
     """Handle logic when no certificate is found in ACM."""
     logger.warning("No certificate found in ACM for domain: %s", domain)
-    store_check_metadata(transaction_id, domain, None, {})
+    record_check_metadata(transaction_id, domain, None, {}, run_log)
 
     response = create_response(
         expired=True,
@@ -203,6 +544,8 @@ def handle_missing_certificate(domain, transaction_id):
         transaction_id=transaction_id,
         reason="No certificate found in ACM",
     )
+    # Later states read $.check_result.certificate_arn, which must exist even when there is none
+    response["certificate_arn"] = None
     
     logger.info("Certificate check completed - not found: %s", response)
     return response
@@ -227,4 +570,7 @@ def create_response(expired, domain, transaction_id, certificate_arn=None, expir
     if reason:
         response["reason"] = reason
 
-    return response
\ No newline at end of file
+    return response
+
+
+log_import_time(import_started)
@@ -1,15 +1,28 @@
+import io
 import json
 import logging
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, patch
 
+import aws_clients
 import pytest
+from botocore.exceptions import ClientError
+from errors import RetryableError
 
 # Import the module to test
 import index
 
 
+@pytest.fixture(autouse=True)
+def clear_describe_cache():
+    """Start every test with an empty describe_certificate cache."""
+    index.describe_cache.clear()
+    yield
+    index.describe_cache.clear()
+
+
 class TestCheckCertificateLambda:
     """Test suite for check certificate Lambda function."""
 
@@ -103,6 +116,15 @@ class TestCheckCertificateLambda:
             with pytest.raises(Exception, match="Test error"):
                 index.lambda_handler(sample_event, {})
 
+    def test_lambda_handler_throttling_is_retryable(
+        self, setup_env, mock_aws_clients, sample_event
+    ):
+        """Test a throttled ACM call is raised as RetryableError for the state machine to retry."""
+        throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "ListCertificates")
+        with patch("index.bucket_name", "test-bucket"), patch("index.get_certificate_details", side_effect=throttled):
+            with pytest.raises(RetryableError, match="ClientError"):
+                index.lambda_handler(sample_event, {})
+
 
 class TestGetCertificateDetails:
     """Test suite for get_certificate_details function."""
@@ -116,14 +138,14 @@ class TestGetCertificateDetails:
     def test_get_certificate_details_found(self, mock_acm):
         """Test getting certificate details when certificate exists."""
         future_date = datetime.utcnow() + timedelta(days=60)
-        mock_acm.list_certificates.return_value = {
+        mock_acm.get_paginator.return_value.paginate.return_value = [{
             "CertificateSummaryList": [
                 {
                     "CertificateArn": "arn:aws:acm:us-east-1:123456789012:certificate/12345678",
                     "DomainName": "example.com"
                 }
             ]
-        }
+        }]
         mock_acm.describe_certificate.return_value = {
             "Certificate": {
                 "NotAfter": future_date,
@@ -135,28 +157,382 @@ class TestGetCertificateDetails:
 
         assert result is not None
         assert result["certificate_arn"] == "arn:aws:acm:us-east-1:123456789012:certificate/12345678"
-        mock_acm.list_certificates.assert_called_once()
+        mock_acm.get_paginator.assert_called_once_with("list_certificates")
         mock_acm.describe_certificate.assert_called_once()
 
     def test_get_certificate_details_not_found(self, mock_acm):
         """Test getting certificate details when certificate doesn't exist."""
-        mock_acm.list_certificates.return_value = {
+        mock_acm.get_paginator.return_value.paginate.return_value = [{
             "CertificateSummaryList": []
-        }
+        }]
 
         result = index.get_certificate_details("example.com")
 
         assert result is None
-        mock_acm.list_certificates.assert_called_once()
+        mock_acm.get_paginator.assert_called_once_with("list_certificates")
+
+    def test_get_certificate_details_later_page(self, mock_acm):
+        """Test certificates beyond the first page of results are found."""
+        mock_acm.get_paginator.return_value.paginate.return_value = [
+            {"CertificateSummaryList": [{"CertificateArn": "arn:first", "DomainName": "first.example.com"}]},
+            {"CertificateSummaryList": [{"CertificateArn": "arn:second", "DomainName": "example.com"}]},
+        ]
+        mock_acm.describe_certificate.return_value = {"Certificate": {"Status": "ISSUED"}}
+
+        result = index.get_certificate_details("example.com")
+
+        assert result["certificate_arn"] == "arn:second"
+
+    def test_get_certificate_details_with_index(self, mock_acm):
+        """Test a prebuilt index is used without listing ACM again."""
+        mock_acm.describe_certificate.return_value = {"Certificate": {"Status": "ISSUED"}}
+
+        certificate_index = index.CertificateTrie()
+        certificate_index.insert("example.com", "arn:indexed")
+
+        result = index.get_certificate_details("example.com", certificate_index)
+
+        assert result["certificate_arn"] == "arn:indexed"
+        mock_acm.get_paginator.assert_not_called()
 
     def test_get_certificate_details_exception(self, mock_acm):
         """Test getting certificate details when ACM call fails."""
-        mock_acm.list_certificates.side_effect = Exception("ACM error")
+        mock_acm.get_paginator.side_effect = Exception("ACM error")
 
         with pytest.raises(Exception, match="ACM error"):
             index.get_certificate_details("example.com")
 
 
+class TestBatchCheck:
+    """Test suite for batch certificate checks."""
+
+    @pytest.fixture
+    def mock_aws_clients(self):
+        """Mock AWS clients and bucket name."""
+        with patch("index.s3") as mock_s3, patch("index.acm") as mock_acm, \
+             patch("index.bucket_name", "test-bucket"):
+            yield {"s3": mock_s3, "acm": mock_acm}
+
+    @pytest.fixture
+    def certificate_list(self):
+        """Return sample ACM certificate summary pages."""
+        return [{
+            "CertificateSummaryList": [
+                {"CertificateArn": "arn:valid", "DomainName": "valid.example.com"},
+                {"CertificateArn": "arn:expired", "DomainName": "expired.example.com"},
+            ]
+        }]
+
+    def describe(self, CertificateArn):
+        """Return a describe_certificate response based on the ARN."""
+        days = 60 if CertificateArn == "arn:valid" else -1
+        return {
+            "Certificate": {
+                "NotAfter": datetime.utcnow() + timedelta(days=days),
+                "Status": "ISSUED"
+            }
+        }
+
+    def test_batch_lists_acm_once(self, mock_aws_clients, certificate_list):
+        """Test batch check lists ACM once and returns one result per domain."""
+        mock_acm = mock_aws_clients["acm"]
+        mock_acm.get_paginator.return_value.paginate.return_value = certificate_list
+        mock_acm.describe_certificate.side_effect = self.describe
+
+        result = index.lambda_handler(
+            {"domains": ["valid.example.com", "expired.example.com", "missing.example.com"]}, {}
+        )
+
+        mock_acm.get_paginator.return_value.paginate.assert_called_once()
+        mock_aws_clients["s3"].put_object.assert_called_once()
+        assert mock_aws_clients["s3"].put_object.call_args[1]["Key"] == result["run_log"]
+        assert mock_acm.describe_certificate.call_count == 2
+        assert result["domains_checked"] == 3
+        assert result["expired_count"] == 2
+        assert [r["domain"] for r in result["results"]] == [
+            "valid.example.com", "expired.example.com", "missing.example.com"
+        ]
+        assert result["results"][0]["expired"] is False
+        assert result["results"][2]["reason"] == "No certificate found in ACM"
+
+    def test_batch_all_domains(self, mock_aws_clients, certificate_list):
+        """Test batch check with "all" checks every domain in ACM."""
+        mock_acm = mock_aws_clients["acm"]
+        mock_acm.get_paginator.return_value.paginate.return_value = certificate_list
+        mock_acm.describe_certificate.side_effect = self.describe
+
+        result = index.lambda_handler({"domains": "all"}, {})
+
+        assert result["domains_checked"] == 2
+        assert {r["domain"] for r in result["results"]} == {"valid.example.com", "expired.example.com"}
+
+    def test_batch_records_domain_errors(self, mock_aws_clients, certificate_list):
+        """Test a failing domain does not fail the whole batch."""
+        mock_acm = mock_aws_clients["acm"]
+        mock_acm.get_paginator.return_value.paginate.return_value = certificate_list
+        mock_acm.describe_certificate.side_effect = Exception("Describe failed")
+
+        result = index.lambda_handler({"domains": ["valid.example.com"]}, {})
+
+        assert result["error_count"] == 1
+        assert result["results"][0]["error"] == "Describe failed"
+        mock_aws_clients["s3"].put_object.assert_called_once()
+
+    def test_batch_rejects_empty_domains(self, mock_aws_clients):
+        """Test batch check rejects an empty domain list."""
+        mock_aws_clients["acm"].get_paginator.return_value.paginate.return_value = []
+
+        with pytest.raises(ValueError, match="non-empty list"):
+            index.lambda_handler({"domains": []}, {})
+
+
+class TestMultiRegionCheck:
+    """Test suite for multi-region certificate checks."""
+
+    @pytest.fixture
+    def regional_clients(self):
+        """Mock one ACM client per region."""
+        now = datetime.utcnow()
+        clients = {}
+        for region, days in (("us-east-1", 60), ("eu-west-1", 5)):
+            client = Mock()
+            arn = f"arn:aws:acm:{region}:123456789012:certificate/example"
+            client.get_paginator.return_value.paginate.return_value = [{
+                "CertificateSummaryList": [{"CertificateArn": arn, "DomainName": "example.com"}]
+            }]
+            client.describe_certificate.return_value = {
+                "Certificate": {"NotAfter": now + timedelta(days=days), "Status": "ISSUED"}
+            }
+            clients[region] = client
+
+        with patch("index.s3"), patch("index.bucket_name", "test-bucket"), \
+             patch("index.get_regional_acm_client", side_effect=clients.__getitem__):
+            yield clients
+
+    def test_results_merged_per_domain_and_region(self, regional_clients):
+        """Test each region is checked with its own client and merged per domain."""
+        result = index.lambda_handler(
+            {"domains": ["example.com", "missing.example.com"], "regions": ["us-east-1", "eu-west-1"]}, {}
+        )
+
+        assert result["regions"] == ["us-east-1", "eu-west-1"]
+        assert result["domains_checked"] == 2
+        example = result["results"][0]
+        assert example["domain"] == "example.com"
+        assert example["expired"] is True
+        assert example["regions"]["us-east-1"]["expired"] is False
+        assert example["regions"]["eu-west-1"]["expired"] is True
+        assert example["regions"]["eu-west-1"]["region"] == "eu-west-1"
+        for client in regional_clients.values():
+            client.get_paginator.return_value.paginate.assert_called_once()
+            client.describe_certificate.assert_called_once()
+
+    def test_single_domain_event(self, regional_clients):
+        """Test a single "domain" is accepted alongside "regions"."""
+        result = index.lambda_handler({"domain": "example.com", "regions": ["us-east-1"]}, {})
+
+        assert [r["domain"] for r in result["results"]] == ["example.com"]
+        assert result["expired_count"] == 0
+
+    def test_rejects_empty_regions(self, regional_clients):
+        """Test multi-region check rejects an empty region list."""
+        with pytest.raises(ValueError, match="regions must be a non-empty list"):
+            index.lambda_handler({"domain": "example.com", "regions": []}, {})
+
+    def test_regional_clients_are_reused(self):
+        """Test the pooled client for a region is created once."""
+        aws_clients.clear_clients()
+        with patch("aws_clients.boto3.client") as mock_client:
+            first = index.get_regional_acm_client("ap-southeast-2")
+            second = index.get_regional_acm_client("ap-southeast-2")
+
+        assert first is second
+        mock_client.assert_called_once()
+        assert mock_client.call_args[1]["region_name"] == "ap-southeast-2"
+
+
+class TestRunLog:
+    """Test suite for the batch run log."""
+
+    @pytest.fixture
+    def mock_s3(self):
+        """Mock S3 client and bucket name."""
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"):
+            yield mock_s3
+
+    def flushed_body(self, mock_s3):
+        """Return the body written by the last put_object call."""
+        return mock_s3.put_object.call_args[1]["Body"]
+
+    def test_flush_writes_single_ndjson_object(self, mock_s3):
+        """Test buffered records are written as one newline-delimited object."""
+        run_log = index.RunLog("run-1", compress=False)
+        run_log.append({"domain": "a.example.com"})
+        run_log.append({"domain": "b.example.com"})
+
+        key = run_log.flush()
+
+        assert key == "runs/run-1/check_results.ndjson"
+        mock_s3.put_object.assert_called_once()
+        lines = self.flushed_body(mock_s3).decode().splitlines()
+        assert [json.loads(line)["domain"] for line in lines] == ["a.example.com", "b.example.com"]
+
+    def test_compressed_run_log_round_trip(self, mock_s3):
+        """Test a gzip-compressed run log can be streamed back out."""
+        run_log = index.RunLog("run-2", compress=True)
+        for number in range(3):
+            run_log.append({"domain": f"{number}.example.com"})
+        key = run_log.flush()
+        mock_s3.get_object.return_value = {"Body": io.BytesIO(self.flushed_body(mock_s3))}
+
+        records = list(index.read_run_log(key))
+
+        assert key.endswith(".ndjson.gz")
+        assert [record["domain"] for record in records] == ["0.example.com", "1.example.com", "2.example.com"]
+
+    def test_uncompressed_run_log_read(self, mock_s3):
+        """Test an uncompressed run log is streamed line by line."""
+        body = Mock()
+        body.iter_lines.return_value = [b'{"domain": "a.example.com"}', b"", b'{"domain": "b.example.com"}']
+        mock_s3.get_object.return_value = {"Body": body}
+
+        records = list(index.read_run_log("runs/run-3/check_results.ndjson"))
+
+        assert records == [{"domain": "a.example.com"}, {"domain": "b.example.com"}]
+
+    def test_missing_certificate_buffered_in_run_log(self, mock_s3):
+        """Test batch metadata goes to the run log instead of S3."""
+        run_log = index.RunLog("run-4")
+
+        index.handle_missing_certificate("example.com", "test-transaction", run_log)
+
+        mock_s3.put_object.assert_not_called()
+        assert run_log.records[0]["certificate_status"] == "NOT_FOUND"
+
+
+class TestBuildCertificateIndex:
+    """Test suite for build_certificate_index and CertificateTrie."""
+
+    def test_index_includes_subject_alternative_names(self):
+        """Test SAN entries are indexed alongside the primary domain."""
+        certificates = [
+            {
+                "CertificateArn": "arn:san",
+                "DomainName": "example.com",
+                "SubjectAlternativeNameSummaries": ["example.com", "www.example.com"]
+            }
+        ]
+
+        result = index.build_certificate_index(certificates)
+
+        assert result.match("example.com") == ["arn:san"]
+        assert result.match("WWW.example.com") == ["arn:san"]
+        assert result.match("api.example.com") == []
+
+    def test_wildcard_covers_single_label(self):
+        """Test a wildcard certificate covers exactly one extra label."""
+        result = index.build_certificate_index([
+            {"CertificateArn": "arn:wildcard", "DomainName": "*.example.com"}
+        ])
+
+        assert result.match("api.example.com") == ["arn:wildcard"]
+        assert result.match("*.example.com") == ["arn:wildcard"]
+        assert result.match("example.com") == []
+        assert result.match("a.b.example.com") == []
+
+    def test_latest_expiring_match_preferred(self):
+        """Test the latest-expiring covering certificate is returned first."""
+        now = datetime.utcnow()
+        result = index.build_certificate_index([
+            {"CertificateArn": "arn:exact", "DomainName": "api.example.com",
+             "NotAfter": now + timedelta(days=10)},
+            {"CertificateArn": "arn:wildcard", "DomainName": "*.example.com",
+             "NotAfter": now + timedelta(days=80)},
+            {"CertificateArn": "arn:pending", "DomainName": "api.example.com"},
+        ])
+
+        assert result.match("api.example.com") == ["arn:wildcard", "arn:exact", "arn:pending"]
+
+    def test_primary_domain_wins_ties(self):
+        """Test primary DomainName matches rank ahead of SAN matches with equal expiry."""
+        certificates = [
+            {
+                "CertificateArn": "arn:san",
+                "DomainName": "other.example.com",
+                "SubjectAlternativeNameSummaries": ["www.example.com"]
+            },
+            {"CertificateArn": "arn:primary", "DomainName": "www.example.com"},
+        ]
+
+        result = index.build_certificate_index(certificates)
+
+        assert result.match("www.example.com") == ["arn:primary", "arn:san"]
+
+
+class TestDescribeCertificateCache:
+    """Test suite for the describe_certificate cache."""
+
+    @pytest.fixture
+    def mock_acm(self):
+        """Mock ACM client."""
+        with patch("index.acm") as mock_acm:
+            mock_acm.describe_certificate.return_value = {"Certificate": {"Status": "ISSUED"}}
+            yield mock_acm
+
+    def test_repeated_describe_served_from_cache(self, mock_acm):
+        """Test a second describe for the same ARN does not call ACM."""
+        first = index.describe_certificate("arn:cached")
+        second = index.describe_certificate("arn:cached")
+
+        assert first == second == {"Status": "ISSUED"}
+        mock_acm.describe_certificate.assert_called_once_with(CertificateArn="arn:cached")
+        assert index.describe_cache.hits == 1
+        assert index.describe_cache.misses == 1
+
+    def test_expired_entries_are_refreshed(self, mock_acm):
+        """Test entries older than the TTL are described again."""
+        cache = index.DescribeCertificateCache(ttl_seconds=60, max_entries=10)
+        cache.put("arn:old", {"Status": "ISSUED"})
+
+        with patch("index.time.monotonic", return_value=time.monotonic() + 120):
+            assert cache.get("arn:old") is None
+
+        assert cache.misses == 1
+
+    def test_least_recently_used_entry_evicted(self):
+        """Test the cache evicts the least recently used ARN when full."""
+        cache = index.DescribeCertificateCache(ttl_seconds=60, max_entries=2)
+        cache.put("arn:a", {"Status": "A"})
+        cache.put("arn:b", {"Status": "B"})
+        cache.get("arn:a")
+        cache.put("arn:c", {"Status": "C"})
+
+        assert cache.get("arn:b") is None
+        assert cache.get("arn:a") == {"Status": "A"}
+        assert cache.get("arn:c") == {"Status": "C"}
+
+    def test_reimported_certificate_is_described_again(self, mock_acm):
+        """Test a certificate re-imported under the same ARN is not served from the cache."""
+        listed = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        certificates = [{"CertificateArn": "arn:reimported", "DomainName": "example.com",
+                         "ImportedAt": listed, "NotAfter": listed + timedelta(days=10)}]
+        index.get_certificate_details("example.com", index.build_certificate_index(certificates))
+
+        certificates[0].update(ImportedAt=listed + timedelta(days=5), NotAfter=listed + timedelta(days=90))
+        mock_acm.describe_certificate.return_value = {"Certificate": {"Status": "RENEWED"}}
+        result = index.get_certificate_details("example.com", index.build_certificate_index(certificates))
+
+        assert result["detail"] == {"Status": "RENEWED"}
+        assert mock_acm.describe_certificate.call_count == 2
+
+    def test_zero_ttl_disables_cache(self, mock_acm):
+        """Test a TTL of zero never stores entries."""
+        cache = index.DescribeCertificateCache(ttl_seconds=0, max_entries=10)
+        cache.put("arn:a", {"Status": "A"})
+
+        assert cache.get("arn:a") is None
+
+
 class TestIsCertificateExpired:
     """Test suite for is_certificate_expired function."""
 
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Shared modules ship to Lambda through the layer (/opt/python); mirror that for tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "shared"))
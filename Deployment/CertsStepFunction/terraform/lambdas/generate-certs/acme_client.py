@@ -0,0 +1,344 @@
+import base64
+import hashlib
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.x509.oid import NameOID
+from errors import AcmeRejectedError, RetryableError
+
+logger = logging.getLogger()
+
+LETS_ENCRYPT_DIRECTORY = "https://acme-v02.api.letsencrypt.org/directory"
+JOSE_CONTENT_TYPE = "application/jose+json"
+PEM_CHAIN_CONTENT_TYPE = "application/pem-certificate-chain"
+BAD_NONCE = "urn:ietf:params:acme:error:badNonce"
+
+
+class AcmeError(AcmeRejectedError):
+    """ACME server returned a problem document or an order failed."""
+
+    def __init__(self, message, problem_type=None, status=None):
+        super().__init__(message)
+        self.problem_type = problem_type
+        self.status = status
+
+
+def b64url(data):
+    """Unpadded base64url encoding used throughout JOSE."""
+    if isinstance(data, str):
+        data = data.encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def generate_account_key():
+    """Generate a P-256 account key for ES256 signing."""
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def account_jwk(account_key):
+    """Public JWK for a P-256 account key, members in canonical order."""
+    numbers = account_key.public_key().public_numbers()
+    return {
+        "crv": "P-256",
+        "kty": "EC",
+        "x": b64url(numbers.x.to_bytes(32, "big")),
+        "y": b64url(numbers.y.to_bytes(32, "big")),
+    }
+
+
+def jwk_thumbprint(jwk):
+    """RFC 7638 thumbprint of a JWK."""
+    return b64url(hashlib.sha256(json.dumps(jwk, sort_keys=True, separators=(",", ":")).encode()).digest())
+
+
+def dns01_txt_value(token, thumbprint):
+    """TXT record value answering a dns-01 challenge."""
+    return b64url(hashlib.sha256(f"{token}.{thumbprint}".encode()).digest())
+
+
+def challenge_record_name(identifier):
+    """Record name for a dns-01 challenge; wildcards validate at their base name."""
+    return f"_acme-challenge.{identifier.removeprefix('*.')}"
+
+
+def build_csr(names, private_key):
+    """DER-encoded CSR for names, first name as the subject CN."""
+    csr = (
+        x509.CertificateSigningRequestBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])]))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(name) for name in names]), critical=False)
+        .sign(private_key, hashes.SHA256())
+    )
+    return csr.public_bytes(serialization.Encoding.DER)
+
+
+def split_pem_chain(pem_chain):
+    """Split a downloaded chain into the leaf certificate and the remaining chain."""
+    marker = "-----END CERTIFICATE-----"
+    blocks = [block.strip() + "\n" + marker + "\n" for block in pem_chain.split(marker) if block.strip()]
+    return blocks[0], "".join(blocks[1:])
+
+
+class AcmeClient:
+    """Minimal RFC 8555 client that issues certificates using dns-01 challenges.
+
+    All work happens in-process: the account key signs JWS requests, dns01
+    publishes every challenge record of an order in one batch, and the
+    certificate, key and chain come back as PEM strings.
+    """
+
+    def __init__(self, directory_url, account_key, dns01, kid=None, timeout=30,
+                 poll_interval=2.0, poll_timeout=300.0):
+        self.directory_url = directory_url
+        self.account_key = account_key
+        self.dns01 = dns01
+        self.kid = kid
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.jwk = account_jwk(account_key)
+        self.thumbprint = jwk_thumbprint(self.jwk)
+        self._directory = None
+        self._nonces = []
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            _, _, body = self._http("GET", self.directory_url)
+            self._directory = json.loads(body)
+        return self._directory
+
+    def register(self, email=None):
+        """Create or look up the ACME account for the account key and return its URL."""
+        payload = {"termsOfServiceAgreed": True}
+        if email:
+            payload["contact"] = [f"mailto:{email}"]
+        status, headers, _ = self._signed_request(self.directory["newAccount"], payload, use_jwk=True)
+        self.kid = headers["Location"]
+        logger.info("ACME account %s: %s", "registered" if status == 201 else "found", self.kid)
+        return self.kid
+
+    def issue_certificate(self, names, private_key=None):
+        """Issue a certificate for names and return (certificate, private_key, chain) PEMs."""
+        if self.kid is None:
+            self.register()
+
+        private_key = private_key or ec.generate_private_key(ec.SECP256R1())
+        started = time.perf_counter()
+
+        _, headers, body = self._signed_request(
+            self.directory["newOrder"], {"identifiers": [{"type": "dns", "value": name} for name in names]}
+        )
+        order_url = headers["Location"]
+        order = json.loads(body)
+        logger.info("ACME order created for %d names: %s", len(names), order_url)
+
+        if order["status"] == "pending":
+            self._complete_authorizations(order["authorizations"])
+
+        _, _, body = self._signed_request(order["finalize"], {"csr": b64url(build_csr(names, private_key))})
+        order = self._poll(order_url, json.loads(body), pending=("pending", "ready", "processing"))
+        if order["status"] != "valid":
+            raise AcmeError(f"Order {order_url} ended in status {order['status']}")
+
+        _, _, body = self._signed_request(order["certificate"], None, accept=PEM_CHAIN_CONTENT_TYPE)
+        certificate, chain = split_pem_chain(body.decode())
+        key_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode()
+
+        logger.info("ACME certificate issued for %s in %.1fs", names[0], time.perf_counter() - started)
+        return certificate, key_pem, chain
+
+    def _complete_authorizations(self, authorization_urls):
+        """Publish every dns-01 record, wait once for propagation, then answer all challenges."""
+        pending = []
+        records = {}
+        for url in authorization_urls:
+            authorization = self._post_as_get(url)
+            if authorization["status"] == "valid":
+                continue
+            challenge = next((c for c in authorization["challenges"] if c["type"] == "dns-01"), None)
+            if challenge is None:
+                raise AcmeError(f"No dns-01 challenge offered for {authorization['identifier']['value']}")
+            record_name = challenge_record_name(authorization["identifier"]["value"])
+            records.setdefault(record_name, []).append(dns01_txt_value(challenge["token"], self.thumbprint))
+            pending.append((url, challenge["url"]))
+
+        if not pending:
+            return
+
+        change = self.dns01.set_records(records)
+        try:
+            self.dns01.wait(change)
+            for _, challenge_url in pending:
+                self._signed_request(challenge_url, {})
+            for url, _ in pending:
+                authorization = self._poll(url, self._post_as_get(url), pending=("pending",))
+                if authorization["status"] != "valid":
+                    detail = next(
+                        (c.get("error", {}).get("detail") for c in authorization.get("challenges", []) if c.get("error")),
+                        authorization["status"],
+                    )
+                    raise AcmeError(
+                        f"Authorization for {authorization['identifier']['value']} failed: {detail}"
+                    )
+        finally:
+            self.dns01.delete_records(records)
+
+    def _poll(self, url, resource, pending):
+        deadline = time.monotonic() + self.poll_timeout
+        while resource["status"] in pending:
+            if time.monotonic() > deadline:
+                raise AcmeError(f"Timed out waiting for {url} (status: {resource['status']})")
+            time.sleep(self.poll_interval)
+            resource = self._post_as_get(url)
+        return resource
+
+    def _post_as_get(self, url):
+        _, _, body = self._signed_request(url, None)
+        return json.loads(body)
+
+    def _signed_request(self, url, payload, use_jwk=False, accept=None):
+        """POST a JWS to url, retrying once when the server rejects the nonce."""
+        for attempt in range(2):
+            protected = {"alg": "ES256", "nonce": self._nonce(), "url": url}
+            if use_jwk:
+                protected["jwk"] = self.jwk
+            else:
+                protected["kid"] = self.kid
+            encoded_protected = b64url(json.dumps(protected))
+            encoded_payload = "" if payload is None else b64url(json.dumps(payload))
+            body = json.dumps({
+                "protected": encoded_protected,
+                "payload": encoded_payload,
+                "signature": self._sign(f"{encoded_protected}.{encoded_payload}".encode()),
+            }).encode()
+            try:
+                return self._http("POST", url, body, {"Content-Type": JOSE_CONTENT_TYPE, "Accept": accept})
+            except AcmeError as e:
+                if e.problem_type != BAD_NONCE or attempt:
+                    raise
+                logger.debug("ACME server rejected nonce, retrying request to %s", url)
+
+    def _sign(self, message):
+        r, s = decode_dss_signature(self.account_key.sign(message, ec.ECDSA(hashes.SHA256())))
+        return b64url(r.to_bytes(32, "big") + s.to_bytes(32, "big"))
+
+    def _nonce(self):
+        if self._nonces:
+            return self._nonces.pop()
+        _, headers, _ = self._http("HEAD", self.directory["newNonce"])
+        return self._nonces.pop() if self._nonces else headers["Replay-Nonce"]
+
+    def _http(self, method, url, body=None, headers=None):
+        request = urllib.request.Request(
+            url, data=body, method=method, headers={k: v for k, v in (headers or {}).items() if v}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                status, response_headers, response_body = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            status, response_headers, response_body = e.code, e.headers, e.read()
+        except (urllib.error.URLError, OSError) as e:
+            # Unreachable server, timeout or reset connection - retried by the state machine
+            raise RetryableError(f"ACME {method} {url} failed: {e}") from e
+
+        if response_headers.get("Replay-Nonce"):
+            self._nonces.append(response_headers["Replay-Nonce"])
+        if status >= 400:
+            try:
+                problem = json.loads(response_body)
+            except ValueError:
+                problem = {"detail": response_body.decode(errors="replace")}
+            raise AcmeError(
+                f"ACME {method} {url} failed ({status}): {problem.get('detail')}",
+                problem_type=problem.get("type"),
+                status=status,
+            )
+        return status, response_headers, response_body
+
+
+class Route53Dns01:
+    """Publishes dns-01 TXT records in Route53, one change batch per hosted zone."""
+
+    def __init__(self, route53, ttl=60, poll_interval=5.0, propagation_timeout=300.0):
+        self.route53 = route53
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.propagation_timeout = propagation_timeout
+        self._zones = None
+
+    def set_records(self, records):
+        """UPSERT TXT records {name: [values]} and return the Route53 change IDs."""
+        return [
+            self._change(zone_id, "UPSERT", zone_records)
+            for zone_id, zone_records in self._by_zone(records).items()
+        ]
+
+    def wait(self, change_ids):
+        """Wait until every change has propagated to all Route53 name servers."""
+        deadline = time.monotonic() + self.propagation_timeout
+        for change_id in change_ids:
+            while self.route53.get_change(Id=change_id)["ChangeInfo"]["Status"] != "INSYNC":
+                if time.monotonic() > deadline:
+                    raise AcmeError(f"Timed out waiting for Route53 change {change_id}")
+                time.sleep(self.poll_interval)
+
+    def delete_records(self, records):
+        """Remove challenge records; failures are logged, not raised."""
+        for zone_id, zone_records in self._by_zone(records).items():
+            try:
+                self._change(zone_id, "DELETE", zone_records)
+            except Exception as e:
+                logger.warning("Failed to clean up dns-01 records in zone %s: %s", zone_id, str(e))
+
+    def _change(self, zone_id, action, records):
+        response = self.route53.change_resource_record_sets(
+            HostedZoneId=zone_id,
+            ChangeBatch={
+                "Comment": "ACME dns-01 challenge",
+                "Changes": [
+                    {
+                        "Action": action,
+                        "ResourceRecordSet": {
+                            "Name": name,
+                            "Type": "TXT",
+                            "TTL": self.ttl,
+                            "ResourceRecords": [{"Value": f'"{value}"'} for value in values],
+                        },
+                    }
+                    for name, values in sorted(records.items())
+                ],
+            },
+        )
+        return response["ChangeInfo"]["Id"]
+
+    def _by_zone(self, records):
+        grouped = {}
+        for name, values in records.items():
+            grouped.setdefault(self._zone_for(name), {})[name] = values
+        return grouped
+
+    def _zone_for(self, name):
+        """Hosted zone with the longest name that is a suffix of name."""
+        if self._zones is None:
+            self._zones = {}
+            for page in self.route53.get_paginator("list_hosted_zones").paginate():
+                for zone in page["HostedZones"]:
+                    if not zone.get("Config", {}).get("PrivateZone"):
+                        self._zones[zone["Name"].rstrip(".").lower()] = zone["Id"]
+
+        labels = name.rstrip(".").lower().split(".")
+        for i in range(len(labels)):
+            zone_id = self._zones.get(".".join(labels[i:]))
+            if zone_id:
+                return zone_id
+        raise AcmeError(f"No Route53 hosted zone found for {name}")
@@ -1,19 +1,83 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
 import json
 import logging
 import os
+import random
 import tempfile
 import subprocess
-from datetime import datetime
-
-import boto3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from acme_client import LETS_ENCRYPT_DIRECTORY, AcmeClient, AcmeError, Route53Dns01, build_csr, generate_account_key
+from aws_clients import is_missing_object, is_write_conflict, lazy_client, log_import_time
+from cert_bundle import bundle_key, head_bundle, write_bundle
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from errors import CertificateValidationError, MissingInputError, RetryableError, classify_error
+from key_pool import KeyPool, private_key_pem, validate_key_type
+from metadata_writer import MetadataWriter
+from rate_limiter import KeyedTokenBuckets, TokenBucket
 
 # Initialize AWS clients and environment variables
-s3 = boto3.client("s3")
+s3 = lazy_client("s3")
+route53 = lazy_client("route53")
 bucket_name = os.environ.get("S3_BUCKET")
 certbot_email = os.environ.get("CERTBOT_EMAIL", "admin@example.com")
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+metadata_writer = MetadataWriter(int(os.environ.get("METADATA_WRITER_WORKERS", "4")))
+# "certbot" runs the certbot CLI, "acme" issues in-process with acme_client
+cert_engine = os.environ.get("CERT_ENGINE", "certbot").lower()
+acme_directory_url = os.environ.get("ACME_DIRECTORY_URL", LETS_ENCRYPT_DIRECTORY)
+san_group_max_names = int(os.environ.get("SAN_GROUP_MAX_NAMES", "100"))
+generation_concurrency = int(os.environ.get("GENERATION_CONCURRENCY", "4"))
+generation_max_wait = float(os.environ.get("GENERATION_MAX_WAIT_SECONDS", "60"))
+# Let's Encrypt limits: new orders per account and certificates per registered domain
+acme_account_orders = int(os.environ.get("ACME_ACCOUNT_ORDERS", "300"))
+acme_account_window = float(os.environ.get("ACME_ACCOUNT_WINDOW_SECONDS", "10800"))
+acme_domain_certificates = int(os.environ.get("ACME_DOMAIN_CERTIFICATES", "50"))
+acme_domain_window = float(os.environ.get("ACME_DOMAIN_WINDOW_SECONDS", "604800"))
+# Certificate key type, with optional per-domain overrides as a JSON {domain: key type} map
+default_key_type = validate_key_type(os.environ.get("KEY_TYPE", "ec-p256").lower())
+domain_key_types = json.loads(os.environ.get("DOMAIN_KEY_TYPES") or "{}")
+# Pre-generated keys kept per RSA key type; 0 generates every key inline
+key_pool_size = int(os.environ.get("KEY_POOL_SIZE", "5"))
+# A retried transaction reuses the bundle it already uploaded while it has at least this much validity left
+reuse_min_validity_days = float(os.environ.get("REUSE_MIN_VALIDITY_DAYS", "30"))
+
+# Let's Encrypt accepts at most 100 names on one certificate
+ACME_MAX_NAMES = 100
+CERTIFICATE_GROUPS_FILE = "certificate_groups.json"
+RATE_LIMITS_KEY = "rate-limits/acme.json"
+RATE_LIMITS_ATTEMPTS = 5
+# Multi-label public suffixes, so example.co.uk rather than co.uk is the registered domain
+PUBLIC_SUFFIXES = frozenset({
+    "co.uk", "org.uk", "me.uk", "ltd.uk", "plc.uk", "net.uk", "ac.uk", "gov.uk", "nhs.uk",
+    "com.au", "net.au", "org.au", "edu.au", "gov.au", "asn.au", "id.au",
+    "co.nz", "net.nz", "org.nz", "govt.nz", "ac.nz",
+    "co.jp", "ne.jp", "or.jp", "ac.jp", "go.jp",
+    "co.kr", "or.kr", "co.in", "net.in", "org.in", "gov.in",
+    "com.br", "net.br", "org.br", "gov.br", "com.mx", "com.ar", "com.co",
+    "com.cn", "net.cn", "org.cn", "gov.cn", "com.hk", "com.tw", "com.sg", "com.my",
+    "co.za", "org.za", "co.il", "org.il", "com.tr", "com.ua", "co.id", "com.ph",
+}) | frozenset(suffix.strip().lower() for suffix in os.environ.get("PUBLIC_SUFFIXES", "").split(",") if suffix.strip())
+ISSUANCE_ERRORS = (subprocess.CalledProcessError, AcmeError)
+ACME_ACCOUNTS_PREFIX = "acme/accounts"
+# Certbot's config-dir accounts/ tree, restored into every fresh config dir
+CERTBOT_ACCOUNTS_KEY = "acme/certbot_accounts.json"
+
+# In-process ACME client, reused across warm invocations
+acme_client = None
+acme_client_lock = threading.Lock()
+# Certbot account files {relative path: content}, reused across warm invocations
+certbot_accounts = None
+certbot_accounts_lock = threading.Lock()
 
 # Configure logging
 logger = logging.getLogger()
@@ -22,62 +86,526 @@ logger.setLevel(getattr(logging, log_level, logging.INFO))
 
 def lambda_handler(event, context):
     """Lambda handler to generate certificates using Certbot."""
+    if "domains" in event:
+        return handle_group_generation(
+            event["domains"], event["transaction_id"], event.get("certificate_arns") or {}, event.get("key_type")
+        )
+
     domain = event["domain"]
     transaction_id = event["transaction_id"]
     old_cert_arn = event.get("certificate_arn")
+    key_type = resolve_key_type([domain], event.get("key_type"))
 
     logger.info("Starting certificate generation for domain: %s", domain)
     logger.debug("Event: %s", event)
 
     if not bucket_name:
         logger.error("S3_BUCKET environment variable is required but not set")
-        raise ValueError("S3_BUCKET environment variable is required")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    existing = find_existing_generation(domain, transaction_id)
+    if existing:
+        response = create_success_response(domain, transaction_id, existing["expiration_date"], existing["version_id"])
+        response["reused_existing"] = True
+        return response
 
     with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            run_certbot_command(domain, temp_dir)
-            certificate, private_key, chain = read_certificate_files(domain, temp_dir)
+            certificate, private_key, chain = issue_certificate(domain, temp_dir, key_type=key_type)
             expiration_date = get_certificate_expiration(certificate)
-            
-            upload_certificate_to_s3(domain, certificate, private_key, chain, transaction_id, expiration_date)
-            store_generation_metadata(transaction_id, domain, old_cert_arn, expiration_date)
-
-            response = {
-                "success": True,
-                "domain": domain,
-                "transaction_id": transaction_id,
-                "bucket_name": bucket_name,
-                "expiration_date": expiration_date,
-                "s3_location": f"s3://{bucket_name}/certificates/{domain}/"
-            }
+
+            # The metadata PUT overlaps with the certificate upload
+            metadata_writer.submit(store_generation_metadata, transaction_id, domain, old_cert_arn, expiration_date)
+            version_id = upload_certificate_to_s3(domain, certificate, private_key, chain, transaction_id, expiration_date)
+            metadata_errors = metadata_writer.drain()
+
+            response = create_success_response(domain, transaction_id, expiration_date, version_id)
+            if metadata_errors:
+                response["metadata_errors"] = metadata_errors
 
             logger.info("Certificate generation completed successfully: %s", response)
             return response
 
-        except subprocess.CalledProcessError as e:
-            logger.error("Certbot command failed: %s", e.stderr)
-            store_generation_error(transaction_id, domain, old_cert_arn, e.stderr)
-            return create_error_response(domain, transaction_id, e.stderr)
+        except ISSUANCE_ERRORS as e:
+            error_message = issuance_error_message(e)
+            logger.error("Certificate issuance failed: %s", error_message)
+            metadata_writer.drain()
+            store_generation_error(transaction_id, domain, old_cert_arn, error_message)
+            if is_transient_issuance_error(e):
+                raise RetryableError(error_message) from e
+            return create_error_response(domain, transaction_id, error_message)
 
         except Exception as e:
             logger.error("Unexpected error during certificate generation: %s", str(e), exc_info=True)
+            metadata_writer.drain()
             store_generation_error(transaction_id, domain, old_cert_arn, str(e))
-            raise e
+            # Only transient failures are retried by the state machine
+            error = classify_error(e)
+            if error is e:
+                raise
+            raise error from e
 
 
-def run_certbot_command(domain, temp_dir):
-    """Run certbot command to generate certificate."""
-    logger.info("Executing Certbot command for domain: %s", domain)
-    
+def handle_group_generation(domains, transaction_id, old_cert_arns, key_type=None):
+    """Issue SAN certificates for groups of related domains, running orders concurrently.
+
+    Orders are admitted through token buckets matching the ACME account and
+    registered-domain limits. Orders that could not start within
+    GENERATION_MAX_WAIT_SECONDS are reported as queued with their expected start.
+    """
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    groups = group_domains(domains, san_group_max_names)
+    logger.info("Generating %d SAN certificates for %d domains (concurrency: %d)",
+                len(groups), sum(len(g["domains"]) for g in groups), generation_concurrency)
+
+    runnable, queued = reserve_orders(groups, generation_max_wait)
+
+    results = {entry["group"]: entry for entry in queued}
+    with ThreadPoolExecutor(max_workers=max(1, generation_concurrency), thread_name_prefix="certbot") as executor:
+        futures = {
+            group["group"]: executor.submit(run_order, group, delay, transaction_id, old_cert_arns, key_type)
+            for group, delay in runnable
+        }
+        for group_name, future in futures.items():
+            results[group_name] = future.result()
+    # Key pool refills queued by the orders
+    metadata_writer.drain()
+
+    ordered_results = [results[group["group"]] for group in groups]
+    groups_key = store_certificate_groups(transaction_id, ordered_results)
+
+    response = {
+        "success": all(result["success"] for result in ordered_results),
+        "transaction_id": transaction_id,
+        "bucket_name": bucket_name,
+        "certificate_groups_key": groups_key,
+        "groups": ordered_results,
+        "queued": [{key: entry[key] for key in ("group", "domains", "expected_start")} for entry in queued]
+    }
+    logger.info("SAN certificate generation completed: %d/%d groups issued, %d queued",
+                sum(1 for result in ordered_results if result["success"]), len(ordered_results), len(queued))
+    return response
+
+
+def reserve_orders(groups, max_wait, attempts=RATE_LIMITS_ATTEMPTS, backoff=0.2):
+    """Plan orders against the stored rate limits with optimistic concurrency.
+
+    Each attempt loads the buckets, reserves tokens and writes them back
+    conditionally; a lost race with another invocation reloads and retries
+    with jittered backoff so neither invocation's reservations are lost.
+    """
+    for attempt in range(1, attempts + 1):
+        account_bucket, domain_buckets, etag = load_rate_limits()
+        runnable, queued = plan_orders(groups, account_bucket, domain_buckets, max_wait)
+        try:
+            store_rate_limits(account_bucket, domain_buckets, etag)
+            return runnable, queued
+        except Exception as e:
+            if not is_write_conflict(e):
+                raise
+            logger.warning("ACME rate-limit state changed during planning (attempt %d/%d)", attempt, attempts)
+            time.sleep(random.uniform(0, backoff * attempt))
+
+    raise RetryableError(f"ACME rate-limit state {RATE_LIMITS_KEY} could not be updated after {attempts} attempts")
+
+
+def plan_orders(groups, account_bucket, domain_buckets, max_wait):
+    """Reserve rate-limit tokens for each order and split them into runnable and queued.
+
+    Reservations are taken for every order first so queued orders get
+    cumulative expected start times; tokens for queued orders are then released.
+    """
+    now = time.time()
+    reservations = []
+    for group in groups:
+        domain_bucket = domain_buckets.bucket(registered_domain(group["domains"][0]))
+        delay = max(account_bucket.reserve(now=now), domain_bucket.reserve(now=now))
+        reservations.append((group, delay, domain_bucket))
+
+    runnable = []
+    queued = []
+    for group, delay, domain_bucket in reservations:
+        if delay <= max_wait:
+            runnable.append((group, delay))
+            continue
+        account_bucket.release()
+        domain_bucket.release()
+        expected_start = datetime.utcfromtimestamp(now + delay).isoformat()
+        logger.info("Order for %s queued by ACME rate limits until %s", group["group"], expected_start)
+        queued.append({
+            "group": group["group"],
+            "domains": group["domains"],
+            "success": False,
+            "queued": True,
+            "expected_start": expected_start,
+            "error": "Deferred by ACME rate limits"
+        })
+
+    return runnable, queued
+
+
+def run_order(group, delay, transaction_id, old_cert_arns, key_type=None):
+    """Wait for a rate-limit reservation, then issue one group; failures are returned, not raised."""
+    if delay > 0:
+        logger.info("Waiting %.1fs for ACME rate limits before ordering %s", delay, group["group"])
+        time.sleep(delay)
+
+    try:
+        return generate_group_certificate(group, transaction_id, old_cert_arns, key_type)
+    except Exception as e:
+        logger.error("Unexpected error generating group %s: %s", group["group"], str(e), exc_info=True)
+        return {"group": group["group"], "domains": group["domains"], "success": False, "error": str(e)}
+
+
+def load_rate_limits():
+    """Load ACME rate-limit buckets from S3 so limits hold across invocations.
+
+    Returns the account bucket, the registered-domain buckets and the ETag
+    of the stored state (None when nothing is stored yet).
+    """
+    account_bucket = TokenBucket.per_window(acme_account_orders, acme_account_window)
+    domain_buckets = KeyedTokenBuckets(acme_domain_certificates, acme_domain_window)
+
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=RATE_LIMITS_KEY)
+    except Exception as e:
+        if not is_missing_object(e):
+            raise
+        logger.debug("No ACME rate-limit state found at %s", RATE_LIMITS_KEY)
+        return account_bucket, domain_buckets, None
+
+    state = json.loads(response["Body"].read())
+    account_bucket.load(state["account"])
+    domain_buckets.load(state["registered_domains"])
+    return account_bucket, domain_buckets, response.get("ETag")
+
+
+def store_rate_limits(account_bucket, domain_buckets, etag=None):
+    """Persist ACME rate-limit buckets to S3, only if nobody else has written them since etag was loaded."""
+    state = {"account": account_bucket.to_dict(), "registered_domains": domain_buckets.to_dict()}
+    condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=RATE_LIMITS_KEY,
+        Body=json.dumps(state, separators=(",", ":")),
+        ContentType="application/json",
+        ServerSideEncryption="aws:kms",
+        **condition
+    )
+    logger.debug("ACME rate-limit state stored in S3: %s", RATE_LIMITS_KEY)
+
+
+def group_domains(domains, max_names=ACME_MAX_NAMES):
+    """Pack domains into SAN groups by registered domain, at most max_names per certificate."""
+    max_names = max(1, min(max_names, ACME_MAX_NAMES))
+    by_registered_domain = {}
+    for domain in sorted({domain.lower() for domain in domains}):
+        by_registered_domain.setdefault(registered_domain(domain), []).append(domain)
+
+    groups = []
+    for registered, names in sorted(by_registered_domain.items()):
+        chunks = [names[i:i + max_names] for i in range(0, len(names), max_names)]
+        for number, chunk in enumerate(chunks, 1):
+            # Prefixed so a group never shares an S3 prefix with a single-domain certificate
+            group_name = f"san-{registered}" if len(chunks) == 1 else f"san-{registered}-{number}"
+            groups.append({"group": group_name, "domains": chunk})
+    return groups
+
+
+def registered_domain(domain):
+    """Return the public suffix plus one label of a domain, ignoring any wildcard label."""
+    labels = domain.lower().removeprefix("*.").rstrip(".").split(".")
+    suffix_labels = max(
+        (length for length in range(2, len(labels)) if ".".join(labels[-length:]) in PUBLIC_SUFFIXES), default=1
+    )
+    return ".".join(labels[-(suffix_labels + 1):])
+
+
+def generate_group_certificate(group, transaction_id, old_cert_arns, key_type=None):
+    """Issue and upload one SAN certificate; issuance failures are recorded on the group."""
+    group_name = group["group"]
+    key_type = resolve_key_type(group["domains"], key_type)
+    result = {
+        "group": group_name,
+        "domains": group["domains"],
+        "key_type": key_type,
+        "old_certificate_arns": {domain: old_cert_arns[domain] for domain in group["domains"] if old_cert_arns.get(domain)}
+    }
+
+    existing = find_existing_generation(group_name, transaction_id)
+    if existing:
+        result.update(
+            success=True,
+            reused_existing=True,
+            expiration_date=existing["expiration_date"],
+            s3_location=f"s3://{bucket_name}/certificates/{group_name}/",
+            bundle_version_id=existing["version_id"]
+        )
+        return result
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            certificate, private_key, chain = issue_certificate(group_name, temp_dir, group["domains"], key_type)
+        except ISSUANCE_ERRORS as e:
+            error_message = issuance_error_message(e)
+            logger.error("Certificate issuance failed for group %s: %s", group_name, error_message)
+            result.update(success=False, error=error_message)
+            return result
+
+        expiration_date = get_certificate_expiration(certificate)
+        version_id = upload_certificate_to_s3(group_name, certificate, private_key, chain, transaction_id, expiration_date)
+
+    result.update(
+        success=True,
+        expiration_date=expiration_date,
+        s3_location=f"s3://{bucket_name}/certificates/{group_name}/",
+        bundle_version_id=version_id
+    )
+    return result
+
+
+def find_existing_generation(name, transaction_id):
+    """Return the bundle an earlier attempt of this transaction uploaded, if it is still worth keeping.
+
+    One HEAD on the bundle reads the transaction ID and expiry it was written
+    with, so a retried or re-run transaction skips issuance entirely.
+    """
+    try:
+        bundle = head_bundle(s3, bucket_name, name)
+    except Exception as e:
+        logger.warning("Unable to check for an existing certificate bundle for %s: %s", name, str(e))
+        return None
+
+    if not bundle or not transaction_id or bundle["transaction_id"] != transaction_id:
+        return None
+    try:
+        expiration = datetime.fromisoformat(bundle["expiration_date"]).replace(tzinfo=None)
+    except (TypeError, ValueError):
+        logger.warning("Existing bundle for %s has no readable expiration date - issuing again", name)
+        return None
+    if expiration < datetime.utcnow() + timedelta(days=reuse_min_validity_days):
+        logger.info("Existing bundle for %s expires %s - issuing again", name, bundle["expiration_date"])
+        return None
+
+    logger.info("Certificate for %s already generated by transaction %s - skipping issuance", name, transaction_id)
+    return bundle
+
+
+def store_certificate_groups(transaction_id, groups):
+    """Store the group to domains mapping so replacement imports each certificate once."""
+    key = f"transactions/{transaction_id}/{CERTIFICATE_GROUPS_FILE}"
+    document = {
+        "transaction_id": transaction_id,
+        "generation_timestamp": datetime.utcnow().isoformat(),
+        "groups": groups
+    }
+
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=json.dumps(document, indent=2, default=str),
+        ServerSideEncryption="aws:kms"
+    )
+    logger.info("Certificate groups stored in S3: %s", key)
+    return key
+
+
+def issue_certificate(cert_name, temp_dir, domains=None, key_type=None):
+    """Issue a certificate with the configured engine and return its PEM contents.
+
+    RSA private keys come from the key pool, which gets one key back in the
+    background while the order runs; EC keys are generated inline.
+    """
+    key_type = key_type or default_key_type
+    pool = KeyPool(s3, bucket_name, key_pool_size)
+    private_key = pool.take(key_type)
+    if pool.is_pooled(key_type):
+        metadata_writer.submit(pool.refill, key_type)
+
+    if cert_engine == "acme":
+        return get_acme_client().issue_certificate(domains or [cert_name], private_key=private_key)
+
+    restore_certbot_accounts(temp_dir)
+    run_certbot_command(cert_name, temp_dir, private_key=private_key, domains=domains)
+    save_certbot_accounts(temp_dir)
+    return read_certificate_files(cert_name, temp_dir)
+
+
+def resolve_key_type(names, requested=None):
+    """Key type for a certificate: the requested type, else the first per-domain override, else KEY_TYPE."""
+    if requested:
+        return validate_key_type(requested.lower())
+    for name in names:
+        if name in domain_key_types:
+            return validate_key_type(domain_key_types[name].lower())
+    return default_key_type
+
+
+def issuance_error_message(error):
+    """Readable message for a certbot or ACME failure."""
+    if isinstance(error, subprocess.CalledProcessError):
+        return error.stderr
+    return str(error)
+
+
+def is_transient_issuance_error(error):
+    """Whether an issuance failure was the ACME server's fault rather than a rejection of the order."""
+    return isinstance(error, AcmeError) and (error.status or 0) >= 500
+
+
+def get_acme_client():
+    """Return the in-process ACME client, restoring the stored account on first use.
+
+    A new account is only registered (and stored) when none exists for the
+    configured directory.
+    """
+    global acme_client
+    with acme_client_lock:
+        if acme_client is None:
+            account = load_acme_account(acme_directory_url)
+            if account:
+                account_key = serialization.load_pem_private_key(account["private_key"].encode(), password=None)
+                acme_client = AcmeClient(acme_directory_url, account_key, Route53Dns01(route53), kid=account["kid"])
+                logger.info("Restored ACME account: %s", account["kid"])
+            else:
+                acme_client = AcmeClient(acme_directory_url, generate_account_key(), Route53Dns01(route53))
+                acme_client.register(certbot_email)
+                store_acme_account(acme_directory_url, acme_client.account_key, acme_client.kid)
+        return acme_client
+
+
+def acme_account_key(directory_url):
+    """S3 key of the stored account for an ACME directory."""
+    return f"{ACME_ACCOUNTS_PREFIX}/{urlparse(directory_url).netloc}.json"
+
+
+def load_acme_account(directory_url):
+    """Load the stored ACME account for a directory, or None if there is none.
+
+    Only a missing object means there is no account; any other failure
+    (InvalidObjectState, AccessDenied, ...) is raised rather than silently
+    registering a second account.
+    """
+    key = acme_account_key(directory_url)
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=key)
+    except Exception as e:
+        if not is_missing_object(e):
+            logger.error("Unable to load ACME account from %s: %s", key, str(e))
+            raise
+        logger.info("No stored ACME account at %s", key)
+        return None
+    account = json.loads(response["Body"].read())
+
+    if account.get("directory_url") != directory_url:
+        logger.warning("Stored ACME account at %s belongs to %s - ignoring", key, account.get("directory_url"))
+        return None
+    return account
+
+
+def store_acme_account(directory_url, account_key, kid):
+    """Store the ACME account key and registration, KMS-encrypted."""
+    key = acme_account_key(directory_url)
+    account = {
+        "directory_url": directory_url,
+        "kid": kid,
+        "private_key": account_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        ).decode(),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=json.dumps(account, indent=2),
+        ServerSideEncryption="aws:kms"
+    )
+    logger.info("ACME account stored in S3: %s", key)
+
+
+def restore_certbot_accounts(temp_dir):
+    """Write the stored certbot account into a fresh config dir so certbot skips registration."""
+    global certbot_accounts
+    with certbot_accounts_lock:
+        if certbot_accounts is None:
+            try:
+                response = s3.get_object(Bucket=bucket_name, Key=CERTBOT_ACCOUNTS_KEY)
+                certbot_accounts = json.loads(response["Body"].read())
+            except Exception as e:
+                if not is_missing_object(e):
+                    # An unreadable account must not be replaced by a freshly registered one
+                    logger.error("Unable to load certbot account: %s", str(e))
+                    raise
+                logger.info("No stored certbot account - certbot will register one")
+                certbot_accounts = {}
+        files = dict(certbot_accounts)
+
+    for relative_path, content in files.items():
+        path = os.path.join(temp_dir, relative_path)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        with open(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            f.write(content)
+    if files:
+        logger.debug("Restored %d certbot account files", len(files))
+
+
+def save_certbot_accounts(temp_dir):
+    """Store the account certbot registered in this config dir, if none is stored yet."""
+    global certbot_accounts
+    accounts_dir = os.path.join(temp_dir, "accounts")
+    with certbot_accounts_lock:
+        if certbot_accounts or not os.path.isdir(accounts_dir):
+            return
+
+        files = {}
+        for root, _, filenames in os.walk(accounts_dir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                with open(path, "r") as f:
+                    files[os.path.relpath(path, temp_dir)] = f.read()
+        if not files:
+            return
+
+        s3.put_object(
+            Bucket=bucket_name,
+            Key=CERTBOT_ACCOUNTS_KEY,
+            Body=json.dumps(files),
+            ServerSideEncryption="aws:kms"
+        )
+        certbot_accounts = files
+        logger.info("Certbot account stored in S3: %s", CERTBOT_ACCOUNTS_KEY)
+
+
+def run_certbot_command(domain, temp_dir, private_key, domains=None):
+    """Run certbot command to generate certificate.
+
+    With domains, every name goes on one SAN certificate named after domain,
+    so all DNS-01 challenges are answered in a single order. certbot signs a
+    CSR for private_key rather than generating a key, writing into the same
+    live/ layout read_certificate_files expects.
+    """
+    names = domains or [domain]
+    logger.info("Executing Certbot command for %s (%d names)", domain, len(names))
+
+    domain_args = []
+    for name in names:
+        domain_args += ["--domains", name]
+
     result = subprocess.run([
         "certbot", "certonly",
         "--dns-route53",
-        "--domains", domain,
+        *write_certbot_csr(domain, temp_dir, names, private_key),
+        *domain_args,
         "--non-interactive",
         "--agree-tos",
         "--config-dir", temp_dir,
-        "--work-dir", "/tmp",
-        "--logs-dir", "/tmp",
+        # Per-order work and log dirs so concurrent certbot runs do not share a lock
+        "--work-dir", f"{temp_dir}/work",
+        "--logs-dir", f"{temp_dir}/logs",
         "--email", certbot_email
     ], check=True, capture_output=True, text=True)
 
@@ -85,6 +613,23 @@ def run_certbot_command(domain, temp_dir):
     return result
 
 
+def write_certbot_csr(domain, temp_dir, names, private_key):
+    """Write the key and its CSR under live/{domain}/ and return the certbot --csr arguments."""
+    live_dir = f"{temp_dir}/live/{domain}"
+    os.makedirs(live_dir, mode=0o700, exist_ok=True)
+    with open(os.open(f"{live_dir}/privkey.pem", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(private_key_pem(private_key))
+    with open(f"{live_dir}/csr.der", "wb") as f:
+        f.write(build_csr(names, private_key))
+
+    return [
+        "--csr", f"{live_dir}/csr.der",
+        "--cert-path", f"{live_dir}/cert.pem",
+        "--chain-path", f"{live_dir}/chain.pem",
+        "--fullchain-path", f"{live_dir}/fullchain.pem"
+    ]
+
+
 def read_certificate_files(domain, temp_dir):
     """Read certificate files from filesystem."""
     logger.debug("Reading certificate files from: %s/live/%s/", temp_dir, domain)
@@ -110,10 +655,13 @@ def get_certificate_expiration(certificate_content):
     """Extract expiration date from certificate."""
     logger.debug("Parsing certificate to extract expiration date")
     
-    cert_obj = x509.load_pem_x509_certificate(
-        certificate_content.encode(),
-        default_backend()
-    )
+    try:
+        cert_obj = x509.load_pem_x509_certificate(
+            certificate_content.encode(),
+            default_backend()
+        )
+    except ValueError as e:
+        raise CertificateValidationError(f"Issued certificate could not be parsed: {e}") from e
     expiration = cert_obj.not_valid_after.isoformat()
     
     logger.debug("Certificate expiration date: %s", expiration)
@@ -121,34 +669,9 @@ def get_certificate_expiration(certificate_content):
 
 
 def upload_certificate_to_s3(domain, certificate, private_key, chain, transaction_id, expiration_date):
-    """Upload certificate files to S3 with metadata."""
-    logger.info("Uploading certificate files to S3 bucket: %s", bucket_name)
-
-    metadata = {
-        "domain": domain,
-        "expiration-date": expiration_date,
-        "transaction-id": transaction_id,
-        "generated-at": datetime.utcnow().isoformat()
-    }
-
-    # Upload certificate files
-    certificate_files = [
-        ("cert.pem", certificate),
-        ("privkey.pem", private_key),
-        ("chain.pem", chain)
-    ]
-
-    for filename, content in certificate_files:
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=f"certificates/{domain}/{filename}",
-            Body=content,
-            ServerSideEncryption="aws:kms",
-            Metadata=metadata
-        )
-        logger.debug("Uploaded %s to: certificates/%s/%s", filename, domain, filename)
-
-    logger.info("All certificate files uploaded to S3 successfully")
+    """Upload the certificate, key and chain to S3 as a single bundle; returns its VersionId."""
+    logger.info("Uploading certificate bundle to S3 bucket: %s", bucket_name)
+    return write_bundle(s3, bucket_name, domain, certificate, private_key, chain, transaction_id, expiration_date)
 
 
 def store_generation_metadata(transaction_id, domain, old_cert_arn, expiration_date):
@@ -197,6 +720,20 @@ def store_generation_error(transaction_id, domain, old_cert_arn, error_message):
     logger.info("Generation error metadata stored in S3: transactions/%s/generationerror.json", transaction_id)
 
 
+def create_success_response(domain, transaction_id, expiration_date, version_id):
+    """Create success response for certificate generation."""
+    return {
+        "success": True,
+        "domain": domain,
+        "transaction_id": transaction_id,
+        "bucket_name": bucket_name,
+        "expiration_date": expiration_date,
+        "s3_location": f"s3://{bucket_name}/certificates/{domain}/",
+        "bundle_key": bundle_key(domain),
+        "bundle_version_id": version_id
+    }
+
+
 def create_error_response(domain, transaction_id, error_message):
     """Create error response for certificate generation failure."""
     return {
@@ -204,4 +741,7 @@ def create_error_response(domain, transaction_id, error_message):
         "error": f"Certificate generation failed: {error_message}",
         "domain": domain,
         "transaction_id": transaction_id
-    }
\ No newline at end of file
+    }
+
+
+log_import_time(import_started)
@@ -0,0 +1,144 @@
+import logging
+import random
+import uuid
+
+from aws_clients import is_write_conflict
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+logger = logging.getLogger()
+
+KEY_POOL_PREFIX = "key-pool"
+# Claim markers; a key belongs to whoever creates its marker first
+KEY_POOL_CLAIMS_PREFIX = f"{KEY_POOL_PREFIX}/claims"
+
+# Supported certificate key types; the key is always generated here and certbot signs its CSR
+KEY_TYPES = {
+    "ec-p256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "ec-p384": lambda: ec.generate_private_key(ec.SECP384R1()),
+    "rsa-2048": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "rsa-3072": lambda: rsa.generate_private_key(public_exponent=65537, key_size=3072),
+    "rsa-4096": lambda: rsa.generate_private_key(public_exponent=65537, key_size=4096),
+}
+# EC keys generate in well under a millisecond - pooling them only adds S3 round trips
+POOLED_KEY_TYPES = ("rsa-2048", "rsa-3072", "rsa-4096")
+
+
+def validate_key_type(key_type):
+    """Raise ValueError for an unsupported key type."""
+    if key_type not in KEY_TYPES:
+        raise ValueError(f"Unsupported key type {key_type!r}; expected one of: {', '.join(sorted(KEY_TYPES))}")
+    return key_type
+
+
+def generate_private_key(key_type):
+    """Generate a private key of the given type."""
+    return KEY_TYPES[validate_key_type(key_type)]()
+
+
+def private_key_pem(private_key):
+    """Unencrypted PKCS#8 PEM for a private key."""
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+
+class KeyPool:
+    """Pre-generated RSA private keys kept KMS-encrypted in S3, one prefix per key type.
+
+    take() hands out a pooled key, falling back to generating one inline when
+    the pool is empty; refill() adds a key back and is meant to run in the
+    background while the order waits on DNS. Other key types are always
+    generated inline.
+    """
+
+    def __init__(self, s3, bucket_name, target_size=5):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.target_size = target_size
+
+    def is_pooled(self, key_type):
+        """Whether keys of key_type come from the pool."""
+        return self.target_size > 0 and key_type in POOLED_KEY_TYPES
+
+    def take(self, key_type):
+        """Claim a pooled key of key_type, or generate one if none are available."""
+        validate_key_type(key_type)
+        if self.is_pooled(key_type):
+            keys = self._list(key_type)
+            # Random order spreads concurrent invocations over the pool; the claim decides
+            random.shuffle(keys)
+            for key in keys:
+                pem = self._claim(key)
+                if pem:
+                    logger.info("Using pooled %s key: %s", key_type, key)
+                    return serialization.load_pem_private_key(pem, password=None)
+
+        logger.info("No pooled %s key - generating key inline", key_type)
+        return generate_private_key(key_type)
+
+    def refill(self, key_type, limit=1):
+        """Generate and store up to limit keys while the pool for key_type is below target_size.
+
+        One key per invocation replaces the one taken without making the
+        invocation wait on several RSA generations. Returns the number of keys
+        added. Failures are logged, not raised - the next take() falls back to
+        generating inline.
+        """
+        if not self.is_pooled(key_type):
+            return 0
+        added = 0
+        try:
+            missing = min(limit, self.target_size - len(self._list(key_type)))
+            for _ in range(missing):
+                key = f"{KEY_POOL_PREFIX}/{key_type}/{uuid.uuid4()}.pem"
+                self.s3.put_object(
+                    Bucket=self.bucket_name,
+                    Key=key,
+                    Body=private_key_pem(generate_private_key(key_type)),
+                    ServerSideEncryption="aws:kms"
+                )
+                added += 1
+        except Exception as e:
+            logger.warning("Unable to refill %s key pool: %s", key_type, str(e))
+
+        if added:
+            logger.info("Added %d %s keys to the key pool", added, key_type)
+        return added
+
+    def _claim(self, key):
+        """Atomically claim a pooled key and return its PEM, or None if another invocation got it.
+
+        The claim is a conditional create of a marker object, so exactly one
+        caller wins each key; the key and its marker are removed afterwards.
+        """
+        marker = f"{KEY_POOL_CLAIMS_PREFIX}/{key[len(KEY_POOL_PREFIX) + 1:]}"
+        try:
+            self.s3.put_object(Bucket=self.bucket_name, Key=marker, Body=b"", IfNoneMatch="*")
+        except Exception as e:
+            if not is_write_conflict(e):
+                logger.warning("Unable to claim pooled key %s: %s", key, str(e))
+            return None
+
+        try:
+            pem = self.s3.get_object(Bucket=self.bucket_name, Key=key)["Body"].read()
+            self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            # Gone because an earlier claimant already used it; never use a key we could not remove
+            logger.warning("Unable to read claimed key %s: %s", key, str(e))
+            return None
+        finally:
+            self._delete_quietly(marker)
+        return pem
+
+    def _delete_quietly(self, key):
+        try:
+            self.s3.delete_object(Bucket=self.bucket_name, Key=key)
+        except Exception as e:
+            logger.warning("Unable to delete %s: %s", key, str(e))
+
+    def _list(self, key_type):
+        response = self.s3.list_objects_v2(
+            Bucket=self.bucket_name, Prefix=f"{KEY_POOL_PREFIX}/{key_type}/", MaxKeys=self.target_size + 10
+        )
+        return [item["Key"] for item in response.get("Contents", [])]
@@ -0,0 +1,397 @@
+import base64
+import json
+import socket
+import threading
+import urllib.error
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock, patch
+
+import pytest
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.x509.oid import NameOID
+
+import acme_client
+from errors import RetryableError, classify_error
+
+
+def b64decode(value):
+    """Decode unpadded base64url."""
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def jwk_public_key(jwk):
+    """Load a P-256 public key from a JWK."""
+    numbers = ec.EllipticCurvePublicNumbers(
+        int.from_bytes(b64decode(jwk["x"]), "big"), int.from_bytes(b64decode(jwk["y"]), "big"), ec.SECP256R1()
+    )
+    return numbers.public_key()
+
+
+class FakeDns:
+    """In-memory TXT records standing in for Route53."""
+
+    def __init__(self):
+        self.records = {}
+        self.batches = []
+        self.waits = 0
+
+    def set_records(self, records):
+        self.batches.append(dict(records))
+        for name, values in records.items():
+            self.records.setdefault(name, set()).update(values)
+        return len(self.batches)
+
+    def wait(self, change):
+        self.waits += 1
+
+    def delete_records(self, records):
+        for name in records:
+            self.records.pop(name, None)
+
+
+class FakeAcmeServer:
+    """Local ACME directory that verifies JWS signatures and dns-01 records before issuing."""
+
+    def __init__(self, dns):
+        self.dns = dns
+        self.accounts = {}
+        self.orders = {}
+        self.nonces = set()
+        self.nonce_counter = 0
+        self.reject_next_nonce = False
+        self.requests = []
+        self.ca_key = ec.generate_private_key(ec.SECP256R1())
+        self.ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Fake ACME CA")])
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def directory_url(self):
+        return f"{self.base}/directory"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def new_nonce(self):
+        self.nonce_counter += 1
+        nonce = f"nonce-{self.nonce_counter}"
+        self.nonces.add(nonce)
+        return nonce
+
+    def _handler(self):
+        acme = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._reply(200, b"")
+
+            def do_GET(self):
+                if self.path == "/directory":
+                    self._json(200, {
+                        "newNonce": f"{acme.base}/new-nonce",
+                        "newAccount": f"{acme.base}/new-account",
+                        "newOrder": f"{acme.base}/new-order",
+                    })
+                else:
+                    self._problem(404, "malformed", "Not found")
+
+            def do_POST(self):
+                jws = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                protected = json.loads(b64decode(jws["protected"]))
+                payload = json.loads(b64decode(jws["payload"])) if jws["payload"] else None
+                acme.requests.append(self.path)
+
+                if protected["nonce"] not in acme.nonces or acme.reject_next_nonce:
+                    acme.reject_next_nonce = False
+                    return self._problem(400, "badNonce", "Invalid nonce")
+                acme.nonces.discard(protected["nonce"])
+
+                jwk = protected.get("jwk") or acme.accounts.get(protected.get("kid"))
+                if jwk is None:
+                    return self._problem(400, "accountDoesNotExist", "Unknown account")
+                raw = b64decode(jws["signature"])
+                signature = encode_dss_signature(int.from_bytes(raw[:32], "big"), int.from_bytes(raw[32:], "big"))
+                try:
+                    jwk_public_key(jwk).verify(
+                        signature, f"{jws['protected']}.{jws['payload']}".encode(), ec.ECDSA(hashes.SHA256())
+                    )
+                except InvalidSignature:
+                    return self._problem(400, "malformed", "Bad signature")
+
+                parts = self.path.strip("/").split("/")
+                route = getattr(self, f"_route_{parts[0].replace('-', '_')}", None)
+                if route is None:
+                    return self._problem(404, "malformed", "Not found")
+                return route(parts[1:], payload, jwk)
+
+            def _route_new_account(self, parts, payload, jwk):
+                kid = f"{acme.base}/acct/{acme_client.jwk_thumbprint(jwk)}"
+                existed = kid in acme.accounts
+                acme.accounts[kid] = jwk
+                self._json(200 if existed else 201, {"status": "valid"}, {"Location": kid})
+
+            def _route_new_order(self, parts, payload, jwk):
+                order_id = str(len(acme.orders) + 1)
+                names = [identifier["value"] for identifier in payload["identifiers"]]
+                acme.orders[order_id] = {
+                    "jwk": jwk,
+                    "status": "pending",
+                    "names": names,
+                    "authorizations": [
+                        {"name": name, "token": f"token-{order_id}-{i}", "status": "pending"}
+                        for i, name in enumerate(names)
+                    ],
+                }
+                self._json(201, self._order(order_id), {"Location": f"{acme.base}/order/{order_id}"})
+
+            def _route_authz(self, parts, payload, jwk):
+                self._json(200, self._authorization(*parts))
+
+            def _route_chall(self, parts, payload, jwk):
+                order_id, index = parts
+                order = acme.orders[order_id]
+                authorization = order["authorizations"][int(index)]
+                expected = acme_client.dns01_txt_value(
+                    authorization["token"], acme_client.jwk_thumbprint(order["jwk"])
+                )
+                record = acme_client.challenge_record_name(authorization["name"])
+                authorization["status"] = "valid" if expected in acme.dns.records.get(record, set()) else "invalid"
+                self._json(200, self._authorization(order_id, index)["challenges"][0])
+
+            def _route_order(self, parts, payload, jwk):
+                order_id = parts[0]
+                order = acme.orders[order_id]
+                if len(parts) == 2:
+                    if any(a["status"] != "valid" for a in order["authorizations"]):
+                        return self._problem(403, "orderNotReady", "Authorizations are not valid")
+                    csr = x509.load_der_x509_csr(b64decode(payload["csr"]))
+                    order["certificate"] = acme.sign(csr)
+                    # Report processing once so the client has to poll
+                    order["status"] = "processing"
+                    response = self._order(order_id)
+                    order["status"] = "valid"
+                    return self._json(200, response)
+                self._json(200, self._order(order_id))
+
+            def _route_cert(self, parts, payload, jwk):
+                self._reply(200, acme.orders[parts[0]]["certificate"].encode(), "application/pem-certificate-chain")
+
+            def _order(self, order_id):
+                order = acme.orders[order_id]
+                if order["status"] == "pending" and all(a["status"] == "valid" for a in order["authorizations"]):
+                    order["status"] = "ready"
+                document = {
+                    "status": order["status"],
+                    "identifiers": [{"type": "dns", "value": name} for name in order["names"]],
+                    "authorizations": [f"{acme.base}/authz/{order_id}/{i}" for i in range(len(order["names"]))],
+                    "finalize": f"{acme.base}/order/{order_id}/finalize",
+                }
+                if order["status"] == "valid":
+                    document["certificate"] = f"{acme.base}/cert/{order_id}"
+                return document
+
+            def _authorization(self, order_id, index):
+                authorization = acme.orders[order_id]["authorizations"][int(index)]
+                return {
+                    "status": authorization["status"],
+                    "identifier": {"type": "dns", "value": authorization["name"].removeprefix("*.")},
+                    "challenges": [{
+                        "type": "dns-01",
+                        "url": f"{acme.base}/chall/{order_id}/{index}",
+                        "token": authorization["token"],
+                        "status": authorization["status"],
+                    }],
+                }
+
+            def _problem(self, status, problem_type, detail):
+                self._json(status, {"type": f"urn:ietf:params:acme:error:{problem_type}", "detail": detail})
+
+            def _json(self, status, document, headers=None):
+                self._reply(status, json.dumps(document).encode(), "application/json", headers)
+
+            def _reply(self, status, body, content_type="application/json", headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Replay-Nonce", acme.new_nonce())
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def sign(self, csr):
+        """Issue a leaf for the CSR and return leaf + CA as a PEM chain."""
+        now = datetime.now(timezone.utc)
+        ca_certificate = (
+            x509.CertificateBuilder()
+            .subject_name(self.ca_name)
+            .issuer_name(self.ca_name)
+            .public_key(self.ca_key.public_key())
+            .serial_number(1)
+            .not_valid_before(now)
+            .not_valid_after(now + timedelta(days=365))
+            .sign(self.ca_key, hashes.SHA256())
+        )
+        leaf = (
+            x509.CertificateBuilder()
+            .subject_name(csr.subject)
+            .issuer_name(self.ca_name)
+            .public_key(csr.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + timedelta(days=90))
+            .add_extension(csr.extensions.get_extension_for_class(x509.SubjectAlternativeName).value, critical=False)
+            .sign(self.ca_key, hashes.SHA256())
+        )
+        return "".join(cert.public_bytes(serialization.Encoding.PEM).decode() for cert in (leaf, ca_certificate))
+
+
+@pytest.fixture
+def dns():
+    return FakeDns()
+
+
+@pytest.fixture
+def acme_server(dns):
+    server = FakeAcmeServer(dns)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(acme_server, dns):
+    return acme_client.AcmeClient(
+        acme_server.directory_url, acme_client.generate_account_key(), dns, poll_interval=0.01, poll_timeout=5
+    )
+
+
+class TestAcmeClient:
+    """End-to-end tests of AcmeClient against the fake ACME server."""
+
+    def test_issue_certificate_for_san_names(self, client, dns):
+        """Test a multi-name order is validated in one DNS batch and returns in-memory PEMs."""
+        certificate, private_key, chain = client.issue_certificate(["example.com", "*.example.com", "www.example.com"])
+
+        leaf = x509.load_pem_x509_certificate(certificate.encode())
+        names = leaf.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+        assert names == ["example.com", "*.example.com", "www.example.com"]
+        assert x509.load_pem_x509_certificate(chain.encode()).subject.rfc4514_string() == "CN=Fake ACME CA"
+        key = serialization.load_pem_private_key(private_key.encode(), password=None)
+        assert key.public_key().public_numbers() == leaf.public_key().public_numbers()
+
+        # The apex and wildcard share one record name with two values, all published in one batch
+        assert len(dns.batches) == 1
+        assert len(dns.batches[0]["_acme-challenge.example.com"]) == 2
+        assert dns.waits == 1
+        assert dns.records == {}
+
+    def test_account_registered_once(self, client, acme_server):
+        """Test the account is registered before the first order and reused after."""
+        client.issue_certificate(["example.com"])
+        client.issue_certificate(["example.org"])
+
+        assert acme_server.requests.count("/new-account") == 1
+        assert client.kid in acme_server.accounts
+
+    def test_bad_nonce_is_retried(self, client, acme_server):
+        """Test a badNonce problem is retried once with a fresh nonce."""
+        client.register()
+        acme_server.reject_next_nonce = True
+
+        client.issue_certificate(["example.com"])
+
+        assert acme_server.requests.count("/new-order") == 2
+
+    def test_failed_challenge_raises(self, client, dns):
+        """Test an authorization that fails validation raises AcmeError and cleans up DNS."""
+        dns.set_records = Mock(return_value=1)
+
+        with pytest.raises(acme_client.AcmeError, match="Authorization for example.com failed"):
+            client.issue_certificate(["example.com"])
+
+        assert dns.records == {}
+
+    @pytest.mark.parametrize("failure", [
+        urllib.error.URLError(ConnectionRefusedError(111, "Connection refused")),
+        socket.timeout("timed out"),
+        ConnectionResetError(104, "Connection reset by peer"),
+    ], ids=["url-error", "timeout", "reset"])
+    def test_network_failures_are_retryable(self, client, failure):
+        """Test an unreachable or dropped ACME server surfaces as a retryable error."""
+        with patch("acme_client.urllib.request.urlopen", side_effect=failure):
+            with pytest.raises(RetryableError, match="ACME GET") as raised:
+                client.register()
+
+        assert classify_error(raised.value) is raised.value
+
+    def test_split_pem_chain(self):
+        """Test a downloaded chain splits into leaf and intermediates."""
+        chain = "-----BEGIN CERTIFICATE-----\nLEAF\n-----END CERTIFICATE-----\n" \
+                "-----BEGIN CERTIFICATE-----\nCA\n-----END CERTIFICATE-----\n"
+
+        leaf, rest = acme_client.split_pem_chain(chain)
+
+        assert leaf == "-----BEGIN CERTIFICATE-----\nLEAF\n-----END CERTIFICATE-----\n"
+        assert rest == "-----BEGIN CERTIFICATE-----\nCA\n-----END CERTIFICATE-----\n"
+
+
+class TestRoute53Dns01:
+    """Test suite for the Route53 dns-01 publisher."""
+
+    @pytest.fixture
+    def route53(self):
+        route53 = Mock()
+        route53.get_paginator.return_value.paginate.return_value = [{"HostedZones": [
+            {"Id": "/hostedzone/COM", "Name": "example.com.", "Config": {"PrivateZone": False}},
+            {"Id": "/hostedzone/SUB", "Name": "sub.example.com.", "Config": {"PrivateZone": False}},
+            {"Id": "/hostedzone/PRIVATE", "Name": "example.org.", "Config": {"PrivateZone": True}},
+        ]}]
+        route53.change_resource_record_sets.side_effect = lambda **kwargs: {
+            "ChangeInfo": {"Id": f"change-{kwargs['HostedZoneId']}"}
+        }
+        return route53
+
+    def test_records_batched_per_most_specific_zone(self, route53):
+        """Test records go to the longest matching public zone, one batch per zone."""
+        dns01 = acme_client.Route53Dns01(route53)
+
+        changes = dns01.set_records({
+            "_acme-challenge.example.com": ["a", "b"],
+            "_acme-challenge.www.example.com": ["c"],
+            "_acme-challenge.api.sub.example.com": ["d"],
+        })
+
+        assert sorted(changes) == ["change-/hostedzone/COM", "change-/hostedzone/SUB"]
+        batches = {call[1]["HostedZoneId"]: call[1]["ChangeBatch"]["Changes"] for call in route53.change_resource_record_sets.call_args_list}
+        assert len(batches["/hostedzone/COM"]) == 2
+        assert batches["/hostedzone/COM"][0]["ResourceRecordSet"]["ResourceRecords"] == [{"Value": '"a"'}, {"Value": '"b"'}]
+
+    def test_wait_polls_until_insync(self, route53):
+        """Test wait polls each change until Route53 reports INSYNC."""
+        route53.get_change.side_effect = [
+            {"ChangeInfo": {"Status": "PENDING"}},
+            {"ChangeInfo": {"Status": "INSYNC"}},
+        ]
+        dns01 = acme_client.Route53Dns01(route53, poll_interval=0)
+
+        dns01.wait(["change-1"])
+
+        assert route53.get_change.call_count == 2
+
+    def test_private_zone_not_used(self, route53):
+        """Test names only covered by a private zone are rejected."""
+        with pytest.raises(acme_client.AcmeError, match="No Route53 hosted zone"):
+            acme_client.Route53Dns01(route53).set_records({"_acme-challenge.example.org": ["a"]})
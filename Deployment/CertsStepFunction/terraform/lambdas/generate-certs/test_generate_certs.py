@@ -2,11 +2,43 @@ import json
 import os
 import subprocess
 import tempfile
+import time
+from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, patch
 
 import pytest
+from botocore.exceptions import ClientError
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import NameOID
 
 import index
+from errors import CertificateValidationError, RetryableError
+
+
+def self_signed_certificate(domain):
+    """Return a PEM self-signed certificate for domain."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domain)])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=90))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(domain)]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def no_such_key():
+    """Return the ClientError S3 raises for a missing object."""
+    return ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
 
 
 class TestGenerateCertificateLambda:
@@ -24,8 +56,9 @@ class TestGenerateCertificateLambda:
 
     @pytest.fixture
     def mock_aws_clients(self):
-        """Mock AWS clients."""
-        with patch("index.s3") as mock_s3:
+        """Mock AWS clients over a bucket with no stored certbot account."""
+        with patch("index.s3") as mock_s3, patch("index.certbot_accounts", None):
+            mock_s3.get_object.side_effect = no_such_key()
             yield {"s3": mock_s3}
 
     @pytest.fixture
@@ -102,6 +135,81 @@ class TestGenerateCertificateLambda:
 
             mock_store_error.assert_called_once()
 
+    @pytest.mark.parametrize("status,retried", [(503, True), (403, False)])
+    def test_lambda_handler_acme_errors(self, setup_env, mock_aws_clients, sample_event, status, retried):
+        """Test ACME server errors are retryable while rejected orders fail with an error response."""
+        error = index.AcmeError(f"ACME POST failed ({status})", status=status)
+        with patch("index.bucket_name", "test-bucket"), patch("index.find_existing_generation", return_value=None), \
+             patch("index.issue_certificate", side_effect=error), \
+             patch("index.store_generation_error") as mock_store_error:
+
+            if retried:
+                with pytest.raises(RetryableError):
+                    index.lambda_handler(sample_event, {})
+            else:
+                assert index.lambda_handler(sample_event, {})["success"] is False
+
+        mock_store_error.assert_called_once()
+
+
+class TestIdempotentGeneration:
+    """Test suite for reusing a bundle an earlier attempt of the transaction uploaded."""
+
+    @pytest.fixture
+    def mock_s3(self):
+        """Mock S3 and the bucket name."""
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"):
+            yield mock_s3
+
+    def existing_bundle(self, mock_s3, transaction_id="test-transaction", days_left=89):
+        """Make HEAD on the bundle return what write_bundle stored."""
+        expiration = (datetime.utcnow() + timedelta(days=days_left)).isoformat()
+        mock_s3.head_object.return_value = {
+            "Metadata": {"transaction-id": transaction_id, "expiration-date": expiration},
+            "VersionId": "v1"
+        }
+        return expiration
+
+    def test_retry_reuses_uploaded_bundle(self, mock_s3):
+        """Test a retried transaction returns the stored bundle without issuing."""
+        expiration = self.existing_bundle(mock_s3)
+        event = {"domain": "example.com", "transaction_id": "test-transaction"}
+
+        with patch("index.issue_certificate") as mock_issue:
+            result = index.lambda_handler(event, {})
+
+        mock_issue.assert_not_called()
+        mock_s3.put_object.assert_not_called()
+        assert result["success"] is True
+        assert result["reused_existing"] is True
+        assert result["bundle_version_id"] == "v1"
+        assert result["expiration_date"] == expiration
+
+    @pytest.mark.parametrize("transaction_id,days_left", [("other-transaction", 89), ("test-transaction", 5)])
+    def test_other_transaction_or_expiring_bundle_issues_again(self, mock_s3, transaction_id, days_left):
+        """Test a bundle from another transaction, or one close to expiry, is not reused."""
+        self.existing_bundle(mock_s3, transaction_id, days_left)
+
+        with patch("index.issue_certificate", side_effect=subprocess.CalledProcessError(1, "certbot", stderr="failed")) as mock_issue, \
+             patch("index.store_generation_error"):
+            index.lambda_handler({"domain": "example.com", "transaction_id": "test-transaction"}, {})
+
+        mock_issue.assert_called_once()
+
+    def test_group_retry_reuses_uploaded_bundle(self, mock_s3):
+        """Test a SAN group already issued by this transaction is not ordered again."""
+        self.existing_bundle(mock_s3)
+        group = {"group": "san-example.com", "domains": ["a.example.com", "b.example.com"]}
+
+        with patch("index.issue_certificate") as mock_issue:
+            result = index.generate_group_certificate(group, "test-transaction", {"a.example.com": "old-arn"})
+
+        mock_issue.assert_not_called()
+        assert result["success"] is True
+        assert result["reused_existing"] is True
+        assert result["bundle_version_id"] == "v1"
+        assert result["old_certificate_arns"] == {"a.example.com": "old-arn"}
+
 
 class TestRunCertbotCommand:
     """Test suite for run_certbot_command function."""
@@ -114,9 +222,9 @@ class TestRunCertbotCommand:
 
     def test_run_certbot_command_success(self, setup_env):
         """Test successful Certbot command execution."""
-        with patch("subprocess.run") as mock_subprocess:
+        with tempfile.TemporaryDirectory() as temp_dir, patch("subprocess.run") as mock_subprocess:
             mock_subprocess.return_value.returncode = 0
-            result = index.run_certbot_command("example.com", "/tmp/certbot")
+            result = index.run_certbot_command("example.com", temp_dir, ec.generate_private_key(ec.SECP256R1()))
 
         mock_subprocess.assert_called_once()
         call_args = mock_subprocess.call_args[0][0]
@@ -126,13 +234,13 @@ class TestRunCertbotCommand:
 
     def test_run_certbot_command_failure(self, setup_env):
         """Test Certbot command failure."""
-        with patch("subprocess.run") as mock_subprocess:
+        with tempfile.TemporaryDirectory() as temp_dir, patch("subprocess.run") as mock_subprocess:
             mock_subprocess.side_effect = subprocess.CalledProcessError(
                 1, "certbot", stderr="Validation failed"
             )
 
             with pytest.raises(subprocess.CalledProcessError):
-                index.run_certbot_command("example.com", "/tmp/certbot")
+                index.run_certbot_command("example.com", temp_dir, ec.generate_private_key(ec.SECP256R1()))
 
 
 class TestReadCertificateFiles:
@@ -187,6 +295,11 @@ MIIESTCCAzGgAwIBAgITB...MOCK_CERTIFICATE_CONTENT...
         assert expiration == "2024-12-31T23:59:59"
         mock_load_cert.assert_called_once()
 
+    def test_unparsable_certificate_is_a_validation_error(self):
+        """Test a malformed certificate raises CertificateValidationError."""
+        with pytest.raises(CertificateValidationError):
+            index.get_certificate_expiration("not a certificate")
+
 
 class TestUploadCertificateToS3:
     """Test suite for upload_certificate_to_s3 function."""
@@ -204,32 +317,24 @@ class TestUploadCertificateToS3:
             yield mock_s3
 
     def test_upload_certificate_to_s3_success(self, setup_env, mock_s3):
-        """Test successful certificate upload to S3."""
-        certificate = "MOCK_CERT"
-        private_key = "MOCK_KEY"
-        chain = "MOCK_CHAIN"
+        """Test the certificate, key and chain are uploaded as one bundle."""
+        certificate = self_signed_certificate("example.com")
+        mock_s3.put_object.return_value = {"VersionId": "v1"}
 
-        index.upload_certificate_to_s3(
-            "example.com", certificate, private_key, chain, "test-transaction", "2024-01-01T00:00:00"
+        version_id = index.upload_certificate_to_s3(
+            "example.com", certificate, "MOCK_KEY", "MOCK_CHAIN", "test-transaction", "2024-01-01T00:00:00"
         )
 
-        # Should upload 3 files
-        assert mock_s3.put_object.call_count == 3
-
-        # Verify certificate upload
-        cert_call = mock_s3.put_object.call_args_list[0]
-        assert "cert.pem" in cert_call[1]["Key"]
-        assert cert_call[1]["Body"] == "MOCK_CERT"
+        assert version_id == "v1"
+        assert mock_s3.put_object.call_count == 1
+        call_args = mock_s3.put_object.call_args[1]
+        assert call_args["Key"] == "certificates/example.com/bundle.json"
+        assert call_args["ServerSideEncryption"] == "aws:kms"
 
-        # Verify private key upload
-        key_call = mock_s3.put_object.call_args_list[1]
-        assert "privkey.pem" in key_call[1]["Key"]
-        assert key_call[1]["Body"] == "MOCK_KEY"
-
-        # Verify chain upload
-        chain_call = mock_s3.put_object.call_args_list[2]
-        assert "chain.pem" in chain_call[1]["Key"]
-        assert chain_call[1]["Body"] == "MOCK_CHAIN"
+        bundle = json.loads(call_args["Body"])
+        assert (bundle["certificate"], bundle["private_key"], bundle["chain"]) == (certificate, "MOCK_KEY", "MOCK_CHAIN")
+        assert bundle["metadata"]["expiration_date"] == "2024-01-01T00:00:00"
+        assert bundle["metadata"]["subject_alternative_names"] == ["example.com"]
 
 
 class TestStoreGenerationMetadata:
@@ -307,4 +412,364 @@ class TestCreateErrorResponse:
             "error": "Certificate generation failed: DNS failed",
             "domain": "example.com",
             "transaction_id": "test-transaction"
-        }
\ No newline at end of file
+        }
+
+def fresh_rate_limits(account_orders=300, domain_certificates=50):
+    """Return full ACME rate-limit buckets with no stored ETag."""
+    return (
+        index.TokenBucket.per_window(account_orders, 10800),
+        index.KeyedTokenBuckets(domain_certificates, 604800),
+        None
+    )
+
+
+class TestGroupDomains:
+    """Test suite for SAN grouping."""
+
+    def test_groups_by_registered_domain(self):
+        """Test related domains share a group and unrelated domains do not."""
+        groups = index.group_domains(["b.example.com", "A.example.com", "*.example.com", "www.example.org"])
+
+        assert groups == [
+            {"group": "san-example.com", "domains": ["*.example.com", "a.example.com", "b.example.com"]},
+            {"group": "san-example.org", "domains": ["www.example.org"]}
+        ]
+
+    def test_multi_label_public_suffixes(self):
+        """Test domains under a multi-label public suffix group by their own registered domain."""
+        groups = index.group_domains(["www.example.co.uk", "api.example.co.uk", "www.other.co.uk"])
+
+        assert groups == [
+            {"group": "san-example.co.uk", "domains": ["api.example.co.uk", "www.example.co.uk"]},
+            {"group": "san-other.co.uk", "domains": ["www.other.co.uk"]}
+        ]
+        assert index.registered_domain("*.example.co.uk") == "example.co.uk"
+
+    def test_groups_split_at_name_limit(self):
+        """Test a group never exceeds the name limit."""
+        domains = [f"host{i:03d}.example.com" for i in range(250)]
+
+        groups = index.group_domains(domains)
+
+        assert [len(group["domains"]) for group in groups] == [100, 100, 50]
+        assert [group["group"] for group in groups] == [
+            "san-example.com-1", "san-example.com-2", "san-example.com-3"
+        ]
+
+    def test_run_certbot_command_with_san_names(self):
+        """Test every group name is passed to a single certbot run."""
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        with tempfile.TemporaryDirectory() as temp_dir, patch("subprocess.run") as mock_subprocess:
+            index.run_certbot_command("san-example.com", temp_dir, private_key, ["a.example.com", "b.example.com"])
+
+            with open(f"{temp_dir}/live/san-example.com/csr.der", "rb") as f:
+                csr = x509.load_der_x509_csr(f.read())
+
+        call_args = mock_subprocess.call_args[0][0]
+        assert call_args[call_args.index("--cert-path") + 1].endswith("/live/san-example.com/cert.pem")
+        assert csr.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(
+            x509.DNSName
+        ) == ["a.example.com", "b.example.com"]
+        assert [call_args[i + 1] for i, arg in enumerate(call_args) if arg == "--domains"] == [
+            "a.example.com", "b.example.com"
+        ]
+
+    def test_lambda_handler_group_mode(self):
+        """Test grouped generation issues one certificate per group and records the mapping."""
+        event = {
+            "domains": ["a.example.com", "b.example.com", "c.example.org"],
+            "transaction_id": "test-transaction",
+            "certificate_arns": {"a.example.com": "old-arn"}
+        }
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"), \
+             patch("index.certbot_accounts", {}), \
+             patch("index.load_rate_limits", return_value=fresh_rate_limits()), \
+             patch("index.run_certbot_command") as mock_certbot, \
+             patch("index.read_certificate_files", return_value=("CERT", "KEY", "CHAIN")), \
+             patch("index.get_certificate_expiration", return_value="2030-01-01T00:00:00"), \
+             patch("index.upload_certificate_to_s3") as mock_upload:
+
+            result = index.lambda_handler(event, {})
+
+        assert result["success"] is True
+        assert mock_certbot.call_count == 2
+        assert sorted(call[0][0] for call in mock_upload.call_args_list) == ["san-example.com", "san-example.org"]
+        assert result["groups"][0]["old_certificate_arns"] == {"a.example.com": "old-arn"}
+
+        writes = {call[1]["Key"]: call[1]["Body"] for call in mock_s3.put_object.call_args_list}
+        assert "rate-limits/acme.json" in writes
+        stored = json.loads(writes["transactions/test-transaction/certificate_groups.json"])
+        assert [group["domains"] for group in stored["groups"]] == [["a.example.com", "b.example.com"], ["c.example.org"]]
+
+
+class TestConcurrentGeneration:
+    """Test suite for the concurrent, rate-limited generation engine."""
+
+    def test_orders_beyond_rate_limits_are_queued(self):
+        """Test orders past the registered-domain limit are queued with cumulative start times."""
+        groups = [{"group": f"san-example.com-{i}", "domains": [f"h{i}.example.com"]} for i in range(1, 5)]
+        account_bucket, domain_buckets, _ = fresh_rate_limits(domain_certificates=2)
+
+        runnable, queued = index.plan_orders(groups, account_bucket, domain_buckets, max_wait=60)
+
+        assert [group["group"] for group, delay in runnable] == ["san-example.com-1", "san-example.com-2"]
+        assert [entry["group"] for entry in queued] == ["san-example.com-3", "san-example.com-4"]
+        assert queued[0]["expected_start"] < queued[1]["expected_start"]
+        # Released tokens leave the bucket exhausted rather than in debt
+        assert domain_buckets.bucket("example.com").tokens == pytest.approx(0.0, abs=1e-3)
+
+    def test_rate_limits_are_written_conditionally(self):
+        """Test stored rate limits are replaced only if unchanged since they were read."""
+        account_bucket, domain_buckets, _ = fresh_rate_limits()
+        stored = {"account": account_bucket.to_dict(), "registered_domains": domain_buckets.to_dict()}
+        groups = [{"group": "san-example.com", "domains": ["www.example.com"]}]
+        with patch("index.s3") as mock_s3:
+            mock_s3.get_object.return_value = {"Body": Mock(read=Mock(return_value=json.dumps(stored))), "ETag": '"v1"'}
+
+            runnable, queued = index.reserve_orders(groups, max_wait=60)
+
+        assert [group["group"] for group, _ in runnable] == ["san-example.com"]
+        assert mock_s3.put_object.call_args[1]["IfMatch"] == '"v1"'
+
+    def test_lost_rate_limit_race_is_retried(self):
+        """Test a conflicting write reloads the rate limits and plans again."""
+        conflict = ClientError({"Error": {"Code": "PreconditionFailed", "Message": "changed"}}, "PutObject")
+        groups = [{"group": "san-example.com", "domains": ["www.example.com"]}]
+        with patch("index.s3") as mock_s3, patch("index.time.sleep"):
+            mock_s3.get_object.side_effect = no_such_key()
+            mock_s3.put_object.side_effect = [conflict, {}]
+
+            runnable, queued = index.reserve_orders(groups, max_wait=60)
+
+        assert len(runnable) == 1 and queued == []
+        assert mock_s3.get_object.call_count == 2
+        assert mock_s3.put_object.call_args[1]["IfNoneMatch"] == "*"
+
+    def test_rate_limit_conflicts_give_up_as_retryable(self):
+        """Test persistent write conflicts surface as a retryable error."""
+        conflict = ClientError({"Error": {"Code": "PreconditionFailed", "Message": "changed"}}, "PutObject")
+        with patch("index.s3") as mock_s3, patch("index.time.sleep"):
+            mock_s3.get_object.side_effect = no_such_key()
+            mock_s3.put_object.side_effect = conflict
+
+            with pytest.raises(RetryableError):
+                index.reserve_orders([{"group": "san-example.com", "domains": ["www.example.com"]}], max_wait=60)
+
+        assert mock_s3.put_object.call_count == index.RATE_LIMITS_ATTEMPTS
+
+    def test_orders_run_concurrently(self):
+        """Test independent orders overlap instead of running one after another."""
+        groups = [{"group": f"san-example{i}.com", "domains": [f"www.example{i}.com"]} for i in range(4)]
+        running = []
+        peak = []
+
+        def slow_order(group, transaction_id, old_cert_arns, key_type=None):
+            running.append(group["group"])
+            peak.append(len(running))
+            time.sleep(0.1)
+            running.remove(group["group"])
+            return {"group": group["group"], "domains": group["domains"], "success": True}
+
+        with patch("index.s3"), patch("index.bucket_name", "test-bucket"), \
+             patch("index.generation_concurrency", 4), \
+             patch("index.load_rate_limits", return_value=fresh_rate_limits()), \
+             patch("index.group_domains", return_value=groups), \
+             patch("index.generate_group_certificate", side_effect=slow_order):
+
+            result = index.lambda_handler({"domains": [], "transaction_id": "test-transaction"}, {})
+
+        assert result["success"] is True
+        assert result["queued"] == []
+        assert max(peak) > 1
+        assert [group["group"] for group in result["groups"]] == [group["group"] for group in groups]
+
+
+class TestCertificateEngine:
+    """Test suite for selecting the certificate engine."""
+
+    def test_acme_engine_issues_in_process(self):
+        """Test CERT_ENGINE=acme uses the ACME client instead of certbot."""
+        mock_client = Mock()
+        mock_client.issue_certificate.return_value = ("CERT", "KEY", "CHAIN")
+        with patch("index.cert_engine", "acme"), patch("index.key_pool_size", 0), \
+             patch("index.get_acme_client", return_value=mock_client), \
+             patch("index.run_certbot_command") as mock_certbot:
+
+            result = index.issue_certificate("san-example.com", "/tmp/unused", ["a.example.com", "b.example.com"])
+            index.metadata_writer.drain()
+
+        assert result == ("CERT", "KEY", "CHAIN")
+        call_args = mock_client.issue_certificate.call_args
+        assert call_args[0][0] == ["a.example.com", "b.example.com"]
+        assert isinstance(call_args[1]["private_key"], ec.EllipticCurvePrivateKey)
+        mock_certbot.assert_not_called()
+
+    def test_acme_failure_returns_error_response(self):
+        """Test an ACME rejection is stored and returned like a certbot failure."""
+        event = {"domain": "example.com", "transaction_id": "test-transaction"}
+        with patch("index.bucket_name", "test-bucket"), \
+             patch("index.issue_certificate", side_effect=index.AcmeError("Authorization for example.com failed")), \
+             patch("index.store_generation_error") as mock_store_error:
+
+            result = index.lambda_handler(event, {})
+
+        assert result["success"] is False
+        assert "Authorization for example.com failed" in result["error"]
+        mock_store_error.assert_called_once()
+
+
+class TestAcmeAccountPersistence:
+    """Test suite for reusing the ACME account across invocations."""
+
+    @pytest.fixture
+    def mock_s3(self):
+        """Mock S3 and reset the cached ACME client and certbot account."""
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"), \
+             patch("index.acme_client", None), patch("index.certbot_accounts", None):
+            yield mock_s3
+
+    def test_stored_account_restored_without_registering(self, mock_s3):
+        """Test a stored account key and kid are reused and nothing is registered."""
+        account_key = index.generate_account_key()
+        stored = {
+            "directory_url": index.acme_directory_url,
+            "kid": "https://acme.example/acct/1",
+            "private_key": account_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+            ).decode()
+        }
+        mock_s3.get_object.return_value = {"Body": Mock(read=Mock(return_value=json.dumps(stored).encode()))}
+
+        with patch("index.AcmeClient") as mock_client_class:
+            client = index.get_acme_client()
+            assert index.get_acme_client() is client
+
+        mock_s3.get_object.assert_called_once_with(
+            Bucket="test-bucket", Key="acme/accounts/acme-v02.api.letsencrypt.org.json"
+        )
+        assert mock_client_class.call_args[1]["kid"] == "https://acme.example/acct/1"
+        client.register.assert_not_called()
+        mock_s3.put_object.assert_not_called()
+
+    def test_new_account_registered_and_stored(self, mock_s3):
+        """Test an account is registered and stored KMS-encrypted when none exists."""
+        mock_s3.get_object.side_effect = no_such_key()
+
+        with patch("index.AcmeClient") as mock_client_class:
+            mock_client_class.return_value.account_key = index.generate_account_key()
+            mock_client_class.return_value.kid = "https://acme.example/acct/2"
+            client = index.get_acme_client()
+
+        client.register.assert_called_once()
+        call_args = mock_s3.put_object.call_args[1]
+        assert call_args["Key"] == "acme/accounts/acme-v02.api.letsencrypt.org.json"
+        assert call_args["ServerSideEncryption"] == "aws:kms"
+        assert json.loads(call_args["Body"])["kid"] == "https://acme.example/acct/2"
+
+    def test_certbot_account_saved_then_restored(self, mock_s3):
+        """Test the account certbot registers is stored once and written into later config dirs."""
+        mock_s3.get_object.side_effect = no_such_key()
+        account_file = os.path.join("accounts", "acme-v02.api.letsencrypt.org", "directory", "abc", "regr.json")
+
+        with tempfile.TemporaryDirectory() as first_run:
+            index.restore_certbot_accounts(first_run)
+            os.makedirs(os.path.dirname(os.path.join(first_run, account_file)))
+            with open(os.path.join(first_run, account_file), "w") as f:
+                f.write('{"uri": "https://acme.example/acct/3"}')
+            index.save_certbot_accounts(first_run)
+
+        mock_s3.put_object.assert_called_once()
+        assert mock_s3.put_object.call_args[1]["Key"] == "acme/certbot_accounts.json"
+
+        with tempfile.TemporaryDirectory() as second_run:
+            index.restore_certbot_accounts(second_run)
+            index.save_certbot_accounts(second_run)
+            with open(os.path.join(second_run, account_file)) as f:
+                assert "acct/3" in f.read()
+
+        # Loaded once, stored once
+        mock_s3.get_object.assert_called_once()
+        mock_s3.put_object.assert_called_once()
+
+    def test_archived_account_is_an_error_not_missing(self, mock_s3):
+        """Test an account object S3 cannot return is raised instead of registering a new account."""
+        mock_s3.get_object.side_effect = ClientError(
+            {"Error": {"Code": "InvalidObjectState", "Message": "The operation is not valid for the object's storage class"}},
+            "GetObject"
+        )
+
+        with patch("index.AcmeClient") as mock_client_class, pytest.raises(ClientError, match="InvalidObjectState"):
+            index.get_acme_client()
+        with tempfile.TemporaryDirectory() as temp_dir, pytest.raises(ClientError, match="InvalidObjectState"):
+            index.restore_certbot_accounts(temp_dir)
+
+        mock_client_class.return_value.register.assert_not_called()
+        mock_s3.put_object.assert_not_called()
+
+
+class TestKeyTypes:
+    """Test suite for certificate key types and pooled keys."""
+
+    def test_certbot_signs_csr_for_pooled_key(self):
+        """Test a supplied key is written to live/ and certbot is given its CSR."""
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch("subprocess.run") as mock_subprocess:
+            index.run_certbot_command("example.com", temp_dir, private_key)
+
+            call_args = mock_subprocess.call_args[0][0]
+            with open(f"{temp_dir}/live/example.com/privkey.pem", "rb") as f:
+                written = serialization.load_pem_private_key(f.read(), password=None)
+
+        assert call_args[call_args.index("--csr") + 1] == f"{temp_dir}/live/example.com/csr.der"
+        assert call_args[call_args.index("--cert-path") + 1] == f"{temp_dir}/live/example.com/cert.pem"
+        assert "--cert-name" not in call_args
+        assert written.private_numbers() == private_key.private_numbers()
+
+    def test_resolve_key_type(self):
+        """Test the requested type wins, then per-domain overrides, then KEY_TYPE."""
+        with patch("index.domain_key_types", {"legacy.example.com": "RSA-2048"}), \
+             patch("index.default_key_type", "ec-p256"):
+            assert index.resolve_key_type(["legacy.example.com"], "ec-p384") == "ec-p384"
+            assert index.resolve_key_type(["www.example.com", "legacy.example.com"]) == "rsa-2048"
+            assert index.resolve_key_type(["www.example.com"]) == "ec-p256"
+            with pytest.raises(ValueError, match="Unsupported key type"):
+                index.resolve_key_type(["www.example.com"], "dsa-1024")
+
+    def test_issuance_takes_pooled_key_and_refills(self):
+        """Test issuance claims a pooled RSA key and adds one back before the handler returns."""
+        pooled = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"), \
+             patch("index.key_pool_size", 2), \
+             patch("index.run_certbot_command") as mock_certbot, \
+             patch("index.restore_certbot_accounts"), patch("index.save_certbot_accounts"), \
+             patch("index.read_certificate_files", return_value=("CERT", "KEY", "CHAIN")):
+            mock_s3.list_objects_v2.return_value = {"Contents": [{"Key": "key-pool/rsa-2048/a.pem"}]}
+            mock_s3.get_object.return_value = {
+                "Body": Mock(read=Mock(return_value=index.private_key_pem(pooled).encode()))
+            }
+
+            index.issue_certificate("example.com", "/tmp/unused", key_type="rsa-2048")
+            assert index.metadata_writer.drain() == []
+
+        used = mock_certbot.call_args[1]["private_key"]
+        assert used.private_numbers() == pooled.private_numbers()
+        mock_s3.delete_object.assert_any_call(Bucket="test-bucket", Key="key-pool/rsa-2048/a.pem")
+        # The claim marker, then the one key added back to the pool
+        puts = [call[1] for call in mock_s3.put_object.call_args_list]
+        assert puts[0]["Key"] == "key-pool/claims/rsa-2048/a.pem" and puts[0]["IfNoneMatch"] == "*"
+        assert len(puts) == 2 and puts[1]["ServerSideEncryption"] == "aws:kms"
+
+    def test_ec_keys_are_generated_without_the_pool(self):
+        """Test EC issuance never touches S3 for its key."""
+        with patch("index.s3") as mock_s3, patch("index.bucket_name", "test-bucket"), \
+             patch("index.key_pool_size", 5), \
+             patch("index.run_certbot_command") as mock_certbot, \
+             patch("index.restore_certbot_accounts"), patch("index.save_certbot_accounts"), \
+             patch("index.read_certificate_files", return_value=("CERT", "KEY", "CHAIN")):
+
+            index.issue_certificate("example.com", "/tmp/unused", key_type="ec-p256")
+            assert index.metadata_writer.drain() == []
+
+        assert isinstance(mock_certbot.call_args[1]["private_key"].curve, ec.SECP256R1)
+        assert mock_s3.method_calls == []
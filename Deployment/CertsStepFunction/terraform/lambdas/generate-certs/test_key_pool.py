@@ -0,0 +1,104 @@
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+from key_pool import KeyPool, generate_private_key
+
+
+class TestGeneratePrivateKey:
+    """Test suite for key generation per key type."""
+
+    @pytest.mark.parametrize("key_type,key_class,size", [
+        ("ec-p256", ec.EllipticCurvePrivateKey, 256),
+        ("ec-p384", ec.EllipticCurvePrivateKey, 384),
+        ("rsa-2048", rsa.RSAPrivateKey, 2048),
+    ])
+    def test_key_types(self, key_type, key_class, size):
+        """Test each key type produces the matching algorithm and size."""
+        key = generate_private_key(key_type)
+
+        assert isinstance(key, key_class)
+        assert key.key_size == size
+
+    def test_unsupported_key_type(self):
+        """Test an unknown key type is rejected."""
+        with pytest.raises(ValueError, match="Unsupported key type"):
+            generate_private_key("dsa-1024")
+
+
+class TestKeyPool:
+    """Test suite for the S3-backed key pool."""
+
+    def test_empty_pool_generates_inline(self):
+        """Test take() generates a key when the pool has none."""
+        s3 = Mock()
+        s3.list_objects_v2.return_value = {"KeyCount": 0}
+
+        key = KeyPool(s3, "test-bucket").take("rsa-2048")
+
+        assert key.key_size == 2048
+        s3.get_object.assert_not_called()
+
+    @pytest.mark.parametrize("key_type,target_size", [("ec-p256", 5), ("rsa-2048", 0)])
+    def test_unpooled_keys_never_touch_s3(self, key_type, target_size):
+        """Test EC keys and a pool size of zero generate inline without calling S3."""
+        s3 = Mock()
+        pool = KeyPool(s3, "test-bucket", target_size=target_size)
+
+        pool.take(key_type)
+
+        assert pool.refill(key_type) == 0
+        assert s3.method_calls == []
+
+    def test_key_claimed_by_another_invocation_is_skipped(self):
+        """Test a key whose claim marker already exists is never read."""
+        s3 = Mock()
+        s3.list_objects_v2.return_value = {"Contents": [{"Key": "key-pool/rsa-2048/taken.pem"}]}
+        s3.put_object.side_effect = ClientError({"Error": {"Code": "PreconditionFailed", "Message": "exists"}}, "PutObject")
+
+        key = KeyPool(s3, "test-bucket").take("rsa-2048")
+
+        assert key.key_size == 2048
+        s3.put_object.assert_called_once_with(
+            Bucket="test-bucket", Key="key-pool/claims/rsa-2048/taken.pem", Body=b"", IfNoneMatch="*"
+        )
+        s3.get_object.assert_not_called()
+
+    def test_claimed_key_that_is_gone_is_skipped(self):
+        """Test a key used up by an earlier claimant is skipped and the marker removed."""
+        s3 = Mock()
+        s3.list_objects_v2.return_value = {"Contents": [{"Key": "key-pool/rsa-2048/gone.pem"}]}
+        s3.get_object.side_effect = Exception("NoSuchKey")
+
+        key = KeyPool(s3, "test-bucket").take("rsa-2048")
+
+        assert key.key_size == 2048
+        s3.delete_object.assert_called_once_with(Bucket="test-bucket", Key="key-pool/claims/rsa-2048/gone.pem")
+
+    def test_refill_adds_one_key_encrypted(self):
+        """Test refill() adds one key per call, KMS-encrypted under the type's prefix."""
+        s3 = Mock()
+        s3.list_objects_v2.return_value = {"Contents": [{"Key": "key-pool/rsa-2048/a.pem"}]}
+
+        added = KeyPool(s3, "test-bucket", target_size=3).refill("rsa-2048")
+
+        assert added == 1
+        assert s3.put_object.call_args[1]["Key"].startswith("key-pool/rsa-2048/")
+        assert s3.put_object.call_args[1]["ServerSideEncryption"] == "aws:kms"
+
+    def test_full_pool_is_not_refilled(self):
+        """Test refill() adds nothing once the pool holds target_size keys."""
+        s3 = Mock()
+        s3.list_objects_v2.return_value = {"Contents": [{"Key": f"key-pool/rsa-2048/{n}.pem"} for n in range(3)]}
+
+        assert KeyPool(s3, "test-bucket", target_size=3).refill("rsa-2048") == 0
+        s3.put_object.assert_not_called()
+
+    def test_refill_failure_is_logged_not_raised(self):
+        """Test a failing refill leaves the pool for the next invocation to fill."""
+        s3 = Mock()
+        s3.list_objects_v2.side_effect = Exception("AccessDenied")
+
+        assert KeyPool(s3, "test-bucket").refill("rsa-2048") == 0
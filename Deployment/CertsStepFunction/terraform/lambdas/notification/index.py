@@ -1,9 +1,14 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
 import json
 import logging
 import os
 from datetime import datetime, timezone
 
-import boto3
+from aws_clients import lazy_client, log_import_time
 
 # Constants
 DEFAULT_LOG_LEVEL = "INFO"
@@ -34,8 +39,7 @@ EMAIL_SUBJECT_PREFIXES = {
 }
 
 # Initialize AWS clients
-sns = boto3.client("sns")
-s3 = boto3.client("s3")
+sns = lazy_client("sns")
 
 # Environment variables
 sns_topic_arn = os.environ.get("SNS_TOPIC_ARN")
@@ -462,3 +466,6 @@ def send_to_sns_from_other_lambdas(notification_data):
         return {"status": STATUS_CODES["SNS_DISABLED"]}
     
     return send_sns_notification(notification_data)
+
+
+log_import_time(import_started)
@@ -24,7 +24,7 @@ class TestNotificationLambda:
     @pytest.fixture
     def mock_aws_clients(self):
         """Mock AWS clients."""
-        with patch("index.sns") as mock_sns, patch("index.s3"):
+        with patch("index.sns") as mock_sns:
             # Set up proper mock for SNS exceptions
             mock_sns.exceptions.NotFoundException = type('NotFoundException', (Exception,), {})
             mock_sns.exceptions.InvalidParameterException = type('InvalidParameterException', (Exception,), {})
@@ -0,0 +1,202 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
+import asyncio
+import hashlib
+import logging
+import os
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+
+from acm_certificates import build_certificate_index, list_acm_certificates
+from aws_clients import lazy_client, log_import_time
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import Encoding
+from errors import MissingInputError
+
+# Initialize AWS clients and environment variables
+acm = lazy_client("acm")
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+probe_timeout = float(os.environ.get("PROBE_TIMEOUT_SECONDS", "5"))
+probe_concurrency = int(os.environ.get("PROBE_CONCURRENCY", "200"))
+acm_max_workers = int(os.environ.get("ACM_MAX_WORKERS", "8"))
+
+PROBE_STATUS = {
+    "MATCH": "MATCH",
+    "MISMATCH": "MISMATCH",
+    "NO_ACM_CERTIFICATE": "NO_ACM_CERTIFICATE",
+    "TIMEOUT": "TIMEOUT",
+    "ERROR": "ERROR",
+}
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(getattr(logging, log_level, logging.INFO))
+
+
+def lambda_handler(event, context):
+    """Lambda handler to verify the certificates endpoints actually serve against ACM."""
+    targets = [parse_target(target) for target in event.get("targets", [])]
+    if not targets:
+        raise MissingInputError("targets must be a non-empty list of host:port entries")
+
+    timeout = float(event.get("timeout", probe_timeout))
+    concurrency = int(event.get("concurrency", probe_concurrency))
+    logger.info("Probing %d TLS endpoints (concurrency: %d, timeout: %ss)", len(targets), concurrency, timeout)
+
+    started = time.perf_counter()
+    probes = asyncio.run(probe_endpoints(targets, timeout, concurrency))
+    probe_seconds = time.perf_counter() - started
+
+    results = compare_with_acm(targets, probes)
+
+    response = {
+        "endpoints_probed": len(results),
+        "probe_seconds": round(probe_seconds, 3),
+        "summary": {status: sum(1 for r in results if r["status"] == status) for status in PROBE_STATUS},
+        "results": results,
+    }
+    logger.info("TLS probe completed: %s", response["summary"])
+    return response
+
+
+def parse_target(target):
+    """Normalise a "host:port" string or target dict.
+
+    IPv6 addresses take a port only in brackets ("[::1]:8443"); a bare
+    address with several colons ("::1") is a host on port 443.
+    """
+    if isinstance(target, str):
+        if target.startswith("["):
+            host, _, rest = target[1:].partition("]")
+            port = rest[1:] if rest.startswith(":") else "443"
+        elif target.count(":") == 1:
+            host, _, port = target.partition(":")
+        else:
+            host, port = target, "443"
+        target = {"host": host, "port": port}
+
+    host = target["host"]
+    return {
+        "host": host,
+        "port": int(target.get("port", 443)),
+        "server_name": target.get("server_name", host),
+        "certificate_arn": target.get("certificate_arn"),
+    }
+
+
+async def probe_endpoints(targets, timeout, concurrency):
+    """Probe every target concurrently, bounded by a semaphore."""
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(probe_endpoint(target, timeout, semaphore) for target in targets))
+
+
+async def probe_endpoint(target, timeout, semaphore):
+    """Complete a TLS handshake with one target and read its leaf certificate."""
+    # Verification is off on purpose: expired or mismatched certificates are what we want to see
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    target["host"], target["port"], ssl=context, server_hostname=target["server_name"]
+                ),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            return {"status": PROBE_STATUS["TIMEOUT"], "error": f"Handshake timed out after {timeout}s"}
+        except (OSError, ssl.SSLError) as e:
+            return {"status": PROBE_STATUS["ERROR"], "error": str(e)}
+
+        try:
+            der = writer.get_extra_info("ssl_object").getpeercert(binary_form=True)
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+        if not der:
+            return {"status": PROBE_STATUS["ERROR"], "error": "Endpoint presented no certificate"}
+        try:
+            probe = parse_served_certificate(der)
+        except ValueError as e:
+            return {"status": PROBE_STATUS["ERROR"], "error": f"Served certificate could not be parsed: {e}"}
+        probe["handshake_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return probe
+
+
+def parse_served_certificate(der):
+    """Extract expiry and fingerprint from a DER-encoded leaf certificate."""
+    certificate = x509.load_der_x509_certificate(der, default_backend())
+    return {
+        "served_not_after": certificate.not_valid_after_utc.replace(tzinfo=None).isoformat(),
+        "served_fingerprint": hashlib.sha256(der).hexdigest(),
+    }
+
+
+def certificate_fingerprint(pem):
+    """Return the SHA-256 fingerprint of a PEM certificate."""
+    certificate = x509.load_pem_x509_certificate(pem.encode(), default_backend())
+    return hashlib.sha256(certificate.public_bytes(Encoding.DER)).hexdigest()
+
+
+def compare_with_acm(targets, probes):
+    """Compare served certificates with the certificates ACM holds for each target."""
+    if any(not target["certificate_arn"] for target in targets):
+        certificate_index = build_certificate_index(list_acm_certificates(acm))
+        for target in targets:
+            if not target["certificate_arn"]:
+                covering = certificate_index.match(target["server_name"])
+                target["certificate_arn"] = covering[0] if covering else None
+
+    arns = sorted({target["certificate_arn"] for target in targets if target["certificate_arn"]})
+    with ThreadPoolExecutor(max_workers=max(1, min(acm_max_workers, len(arns) or 1))) as executor:
+        acm_certificates = dict(zip(arns, executor.map(get_acm_certificate, arns)))
+
+    results = []
+    for target, probe in zip(targets, probes):
+        result = {
+            "host": target["host"],
+            "port": target["port"],
+            "server_name": target["server_name"],
+            "certificate_arn": target["certificate_arn"],
+            **probe,
+        }
+        if "served_fingerprint" in probe:
+            expected = acm_certificates.get(target["certificate_arn"])
+            if expected is None:
+                result["status"] = PROBE_STATUS["NO_ACM_CERTIFICATE"]
+            else:
+                result.update(expected)
+                matches = expected["acm_fingerprint"] == probe["served_fingerprint"]
+                result["status"] = PROBE_STATUS["MATCH"] if matches else PROBE_STATUS["MISMATCH"]
+        results.append(result)
+
+    return results
+
+
+def get_acm_certificate(certificate_arn):
+    """Return the expiry and fingerprint ACM holds for a certificate ARN."""
+    try:
+        detail = acm.describe_certificate(CertificateArn=certificate_arn)["Certificate"]
+        pem = acm.get_certificate(CertificateArn=certificate_arn)["Certificate"]
+    except Exception as e:
+        logger.warning("Unable to read ACM certificate %s: %s", certificate_arn, str(e))
+        return None
+
+    return {
+        "acm_not_after": detail["NotAfter"].replace(tzinfo=None).isoformat(),
+        "acm_fingerprint": certificate_fingerprint(pem),
+    }
+
+
+log_import_time(import_started)
@@ -0,0 +1,237 @@
+import asyncio
+import socket
+import ssl
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+import index
+
+
+def create_certificate(common_name, days):
+    """Return a self-signed certificate PEM and key PEM."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=days))
+        .sign(key, hashes.SHA256())
+    )
+    cert_pem = certificate.public_bytes(serialization.Encoding.PEM).decode()
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    return cert_pem, key_pem
+
+
+class LocalServer:
+    """Background asyncio server used as a probe target."""
+
+    def __init__(self, ssl_context=None, handshake=True):
+        self.ssl_context = ssl_context
+        self.handshake = handshake
+        self.loop = asyncio.new_event_loop()
+        self.port = None
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl_context)
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self.loop.run_forever()
+        server.close()
+        self.loop.close()
+
+    async def _handle(self, reader, writer):
+        if not self.handshake:
+            await asyncio.sleep(30)
+        writer.close()
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait(timeout=5)
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def served_certificate(tmp_path_factory):
+    """Create the certificate served by the local TLS server."""
+    cert_pem, key_pem = create_certificate("api.example.com", 45)
+    directory = tmp_path_factory.mktemp("tls")
+    (directory / "cert.pem").write_text(cert_pem)
+    (directory / "key.pem").write_text(key_pem)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(directory / "cert.pem", directory / "key.pem")
+    return {"pem": cert_pem, "context": context}
+
+
+@pytest.fixture
+def tls_server(served_certificate):
+    """Run a local TLS server presenting the served certificate."""
+    with LocalServer(served_certificate["context"]) as server:
+        yield server
+
+
+def unused_port():
+    """Return a local port with nothing listening on it."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestProbeEndpoints:
+    """Test suite for the asyncio TLS prober."""
+
+    def test_probe_reads_served_certificate(self, tls_server, served_certificate):
+        """Test the leaf certificate's expiry and fingerprint are read from the handshake."""
+        target = index.parse_target(f"127.0.0.1:{tls_server.port}")
+
+        probes = asyncio.run(index.probe_endpoints([target], timeout=5, concurrency=10))
+
+        assert probes[0]["served_fingerprint"] == index.certificate_fingerprint(served_certificate["pem"])
+        served = datetime.fromisoformat(probes[0]["served_not_after"])
+        assert timedelta(days=44) < served - datetime.utcnow() < timedelta(days=46)
+
+    def test_many_probes_share_concurrency_cap(self, tls_server):
+        """Test many concurrent probes against one server all complete."""
+        targets = [index.parse_target(f"127.0.0.1:{tls_server.port}") for _ in range(50)]
+
+        probes = asyncio.run(index.probe_endpoints(targets, timeout=5, concurrency=8))
+
+        assert len({probe["served_fingerprint"] for probe in probes}) == 1
+
+    def test_probe_timeout(self):
+        """Test a server that never completes the handshake times out."""
+        with LocalServer(handshake=False) as server:
+            target = index.parse_target(f"127.0.0.1:{server.port}")
+            probes = asyncio.run(index.probe_endpoints([target], timeout=0.2, concurrency=1))
+
+        assert probes[0]["status"] == "TIMEOUT"
+
+    def test_probe_connection_refused(self):
+        """Test a closed port is reported as an error."""
+        target = index.parse_target(f"127.0.0.1:{unused_port()}")
+
+        probes = asyncio.run(index.probe_endpoints([target], timeout=2, concurrency=1))
+
+        assert probes[0]["status"] == "ERROR"
+
+    def test_unparsable_certificate_is_reported_per_endpoint(self, tls_server):
+        """Test a certificate that cannot be parsed fails only its own endpoint."""
+        targets = [index.parse_target(f"127.0.0.1:{tls_server.port}") for _ in range(2)]
+        load = index.x509.load_der_x509_certificate
+        failures = [ValueError("bad DER")]
+
+        def load_once_bad(der, backend=None):
+            if failures:
+                raise failures.pop()
+            return load(der, backend)
+
+        with patch("index.x509.load_der_x509_certificate", side_effect=load_once_bad):
+            probes = asyncio.run(index.probe_endpoints(targets, timeout=5, concurrency=1))
+
+        assert probes[0]["status"] == "ERROR"
+        assert "could not be parsed" in probes[0]["error"]
+        assert "served_fingerprint" in probes[1]
+
+
+class TestProbeCertificateLambda:
+    """Test suite for probe certificate Lambda function."""
+
+    @pytest.fixture
+    def mock_acm(self):
+        """Mock ACM client."""
+        with patch("index.acm") as mock_acm:
+            yield mock_acm
+
+    def test_lambda_handler_requires_targets(self):
+        """Test Lambda handler rejects an event without targets."""
+        with pytest.raises(index.MissingInputError, match="targets must be a non-empty list"):
+            index.lambda_handler({}, {})
+
+    def test_served_certificate_matches_acm(self, mock_acm, tls_server, served_certificate):
+        """Test a served certificate identical to ACM's is reported as a match."""
+        mock_acm.get_paginator.return_value.paginate.return_value = [{
+            "CertificateSummaryList": [{"CertificateArn": "arn:wildcard", "DomainName": "*.example.com"}]
+        }]
+        mock_acm.describe_certificate.return_value = {
+            "Certificate": {"NotAfter": datetime.now(timezone.utc) + timedelta(days=45)}
+        }
+        mock_acm.get_certificate.return_value = {"Certificate": served_certificate["pem"]}
+
+        result = index.lambda_handler({"targets": [
+            {"host": "127.0.0.1", "port": tls_server.port, "server_name": "api.example.com"}
+        ]}, {})
+
+        assert result["summary"]["MATCH"] == 1
+        assert result["results"][0]["certificate_arn"] == "arn:wildcard"
+
+    def test_stale_certificate_is_mismatch(self, mock_acm, tls_server):
+        """Test an endpoint still serving an old certificate is reported as a mismatch."""
+        renewed_pem, _ = create_certificate("api.example.com", 90)
+        mock_acm.describe_certificate.return_value = {
+            "Certificate": {"NotAfter": datetime.now(timezone.utc) + timedelta(days=90)}
+        }
+        mock_acm.get_certificate.return_value = {"Certificate": renewed_pem}
+
+        result = index.lambda_handler({"targets": [
+            {"host": "127.0.0.1", "port": tls_server.port, "certificate_arn": "arn:renewed"}
+        ]}, {})
+
+        assert result["results"][0]["status"] == "MISMATCH"
+        mock_acm.get_paginator.assert_not_called()
+
+    def test_no_acm_certificate(self, mock_acm, tls_server):
+        """Test an endpoint without a covering ACM certificate is reported."""
+        mock_acm.get_paginator.return_value.paginate.return_value = [{"CertificateSummaryList": []}]
+
+        result = index.lambda_handler({"targets": [f"127.0.0.1:{tls_server.port}"]}, {})
+
+        assert result["results"][0]["status"] == "NO_ACM_CERTIFICATE"
+
+
+class TestParseTarget:
+    """Test suite for parse_target function."""
+
+    def test_host_only_defaults_to_443(self):
+        """Test a bare host defaults to port 443."""
+        assert index.parse_target("example.com") == {
+            "host": "example.com", "port": 443, "server_name": "example.com", "certificate_arn": None
+        }
+
+    def test_host_and_port(self):
+        """Test host:port strings are split."""
+        assert index.parse_target("example.com:8443")["port"] == 8443
+
+    @pytest.mark.parametrize("target,host,port", [
+        ("::1", "::1", 443),
+        ("[::1]", "::1", 443),
+        ("[2001:db8::1]:8443", "2001:db8::1", 8443),
+    ])
+    def test_ipv6_targets(self, target, host, port):
+        """Test bare IPv6 addresses keep every colon and bracketed ones take a port."""
+        parsed = index.parse_target(target)
+
+        assert (parsed["host"], parsed["port"]) == (host, port)
@@ -1,15 +1,52 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-import boto3
+from aws_clients import is_throttling_error, lazy_client, log_import_time
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from cert_bundle import ACM_KEY_ALGORITHMS, certificate_metadata, read_bundle
+from errors import MissingInputError, RetryableError, classify_error
+from inventory_index import update_index
+from metadata_writer import MetadataWriter
+from rate_limiter import AdaptiveRateLimiter
 
 # Initialize AWS clients and environment variables
-s3 = boto3.client("s3")
-acm = boto3.client("acm")
+s3 = lazy_client("s3")
+acm = lazy_client("acm")
+# Batch mode retries throttles itself, so its client must not retry them as well
+acm_batch = lazy_client("acm", config=Config(retries={"total_max_attempts": 1, "mode": "standard"}), name="batch")
 bucket_name = os.environ.get("S3_BUCKET")
 log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+metadata_writer = MetadataWriter(int(os.environ.get("METADATA_WRITER_WORKERS", "4")))
+# "reimport" overwrites the old certificate's ARN in place; "new" imports a new ARN and deletes the old one
+import_mode = os.environ.get("CERTIFICATE_IMPORT_MODE", "reimport").lower()
+batch_concurrency = int(os.environ.get("REPLACE_BATCH_CONCURRENCY", "4"))
+# "deferred" leaves superseded certificates queued as pending_deletion for sweep-certs;
+# "inline" deletes them during replacement
+deletion_mode = os.environ.get("OLD_CERTIFICATE_DELETION", "deferred").lower()
+
+# ACM per-account request rates shared by every batch in this container; the learned
+# rate carries over to warm invocations
+import_limiter = AdaptiveRateLimiter(
+    float(os.environ.get("ACM_IMPORT_RATE", "1")), is_throttle=is_throttling_error
+)
+describe_limiter = AdaptiveRateLimiter(
+    float(os.environ.get("ACM_DESCRIBE_RATE", "10")), is_throttle=is_throttling_error
+)
+delete_limiter = AdaptiveRateLimiter(
+    float(os.environ.get("ACM_DELETE_RATE", "5")), is_throttle=is_throttling_error
+)
+
+# Group to domains mapping written by generate-certs for SAN issuance
+CERTIFICATE_GROUPS_FILE = "certificate_groups.json"
 
 # Configure logging
 logger = logging.getLogger()
@@ -18,6 +55,11 @@ logger.setLevel(getattr(logging, log_level, logging.INFO))
 
 def lambda_handler(event, context):
     """Lambda handler to replace certificates in ACM."""
+    if "domains" in event:
+        return handle_group_replacement(event["transaction_id"])
+    if "certificates" in event:
+        return handle_batch_replacement(event["certificates"], event.get("transaction_id"))
+
     domain = event["domain"]
     transaction_id = event["transaction_id"]
     old_cert_arn = event.get("certificate_arn")
@@ -27,50 +69,265 @@ def lambda_handler(event, context):
 
     if not bucket_name:
         logger.error("S3_BUCKET environment variable is required but not set")
-        raise ValueError("S3_BUCKET environment variable is required")
+        raise MissingInputError("S3_BUCKET environment variable is required")
 
     try:
-        certificate, private_key, chain, expiration_date = retrieve_certificate_from_s3(domain)
-        new_cert_arn = import_certificate_to_acm(certificate, private_key, chain)
-        
-        old_cert_deleted, deletion_error = delete_old_certificate(old_cert_arn)
-        update_certificate_inventories(domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted)
+        certificate, private_key, chain, expiration_date = retrieve_certificate_from_s3(
+            domain, event.get("bundle_version_id"), event.get("certificate_version_ids")
+        )
+        reimport_arn = old_cert_arn if import_mode == "reimport" else None
+        new_cert_arn = import_certificate_to_acm(certificate, private_key, chain, reimport_arn)
+        reimported = bool(reimport_arn) and new_cert_arn == reimport_arn
+
+        # Artifact and inventory PUTs are queued in the background while ACM deletes the old certificate
         store_replacement_artifacts(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
+        # Same ARN when re-imported, so attached resources already serve the new certificate
+        superseded_arn = superseded_certificate_arn(old_cert_arn, certificate, reimported)
+        old_cert_deleted, deletion_error = retire_old_certificate(superseded_arn)
+        deletion_pending = is_deletion_deferred(superseded_arn)
+        update_certificate_inventories(
+            domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted, deletion_pending
+        )
+        metadata_errors = metadata_writer.drain()
 
         response = create_success_response(domain, transaction_id, new_cert_arn, old_cert_arn, expiration_date, old_cert_deleted, deletion_error)
+        response["reimported_in_place"] = reimported
+        response["old_certificate_deletion_pending"] = deletion_pending
+        if metadata_errors:
+            response["metadata_errors"] = metadata_errors
         logger.info("Certificate replacement completed successfully: %s", response)
         return response
 
     except Exception as e:
         logger.error("Error during certificate replacement: %s", str(e), exc_info=True)
+        metadata_writer.drain()
         store_replacement_error(transaction_id, domain, old_cert_arn, str(e))
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Let the state machine retry throttling and AWS-side failures
+            raise error from e
         return create_error_response(domain, transaction_id, str(e))
 
 
-def retrieve_certificate_from_s3(domain):
-    """Retrieve certificate files from S3."""
-    logger.info("Retrieving certificate from S3 for domain: %s", domain)
+def handle_group_replacement(transaction_id):
+    """Import each SAN certificate recorded by a grouped generation run exactly once."""
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    groups = load_certificate_groups(transaction_id)
+    logger.info("Replacing %d SAN certificates for transaction: %s", len(groups), transaction_id)
+
+    results = []
+    for group in groups:
+        if not group.get("success"):
+            results.append({
+                "group": group["group"],
+                "success": False,
+                "error": group.get("error", "Certificate generation failed")
+            })
+            continue
+        try:
+            results.append(replace_group_certificate(group, transaction_id))
+        except Exception as e:
+            logger.error("Error replacing certificate group %s: %s", group["group"], str(e), exc_info=True)
+            results.append({"group": group["group"], "success": False, "error": str(e)})
+
+    metadata_errors = metadata_writer.drain()
+
+    response = {
+        "success": all(result["success"] for result in results),
+        "transaction_id": transaction_id,
+        "bucket_name": bucket_name,
+        "groups": results
+    }
+    if metadata_errors:
+        response["metadata_errors"] = metadata_errors
+    logger.info("SAN certificate replacement completed: %d/%d groups imported",
+                sum(1 for result in results if result["success"]), len(results))
+    return response
 
-    cert_response = s3.get_object(Bucket=bucket_name, Key=f"certificates/{domain}/cert.pem")
-    key_response = s3.get_object(Bucket=bucket_name, Key=f"certificates/{domain}/privkey.pem")
-    chain_response = s3.get_object(Bucket=bucket_name, Key=f"certificates/{domain}/chain.pem")
 
-    certificate = cert_response["Body"].read().decode("utf-8")
-    private_key = key_response["Body"].read().decode("utf-8")
-    chain = chain_response["Body"].read().decode("utf-8")
+def handle_batch_replacement(certificates, transaction_id=None):
+    """Replace many domains' certificates in one invocation within ACM's request rates.
 
-    cert_metadata = cert_response.get("Metadata", {})
-    expiration_date = cert_metadata.get("expiration-date", "")
+    Each entry is {"domain", "certificate_arn", "transaction_id", "bundle_version_id"};
+    entries without a transaction_id use the event's. ACM calls from every worker
+    go through shared adaptive rate limiters, and the inventory index is updated
+    once for the whole batch.
+    """
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    logger.info("Replacing %d certificates in batch (concurrency: %d, import rate: %.2f/s)",
+                len(certificates), batch_concurrency, import_limiter.rate)
+
+    with ThreadPoolExecutor(max_workers=max(1, batch_concurrency), thread_name_prefix="replace") as executor:
+        results = list(executor.map(lambda item: replace_batch_item(item, transaction_id), certificates))
+
+    records = [record for result in results for record in result.pop("inventory_records", [])]
+    if records:
+        metadata_writer.submit(store_inventory_records, records)
+    metadata_errors = metadata_writer.drain()
+
+    response = {
+        "success": all(result["success"] for result in results),
+        "transaction_id": transaction_id,
+        "bucket_name": bucket_name,
+        "results": results,
+        "import_rate": import_limiter.rate,
+        "throttles": import_limiter.throttles + describe_limiter.throttles + delete_limiter.throttles
+    }
+    if metadata_errors:
+        response["metadata_errors"] = metadata_errors
+    logger.info("Batch replacement completed: %d/%d certificates replaced",
+                sum(1 for result in results if result["success"]), len(results))
+    return response
 
-    logger.debug("Certificate files retrieved successfully from S3")
-    return certificate, private_key, chain, expiration_date
 
+def replace_batch_item(item, transaction_id=None):
+    """Replace one batch entry; failures are returned as the entry's outcome."""
+    domain = item["domain"]
+    transaction_id = item.get("transaction_id") or transaction_id
+    old_cert_arn = item.get("certificate_arn")
+
+    try:
+        certificate, private_key, chain, expiration_date = retrieve_certificate_from_s3(
+            domain, item.get("bundle_version_id"), item.get("certificate_version_ids")
+        )
+        reimport_arn = old_cert_arn if import_mode == "reimport" else None
+        new_cert_arn = import_certificate_to_acm(
+            certificate, private_key, chain, reimport_arn, limiter=import_limiter, describe_limiter=describe_limiter
+        )
+        reimported = bool(reimport_arn) and new_cert_arn == reimport_arn
+
+        store_replacement_artifacts(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
+        superseded_arn = superseded_certificate_arn(old_cert_arn, certificate, reimported, limiter=describe_limiter)
+        old_cert_deleted, deletion_error = retire_old_certificate(superseded_arn, limiter=delete_limiter)
+        deletion_pending = is_deletion_deferred(superseded_arn)
+
+        response = create_success_response(domain, transaction_id, new_cert_arn, old_cert_arn, expiration_date, old_cert_deleted, deletion_error)
+        response["reimported_in_place"] = reimported
+        response["old_certificate_deletion_pending"] = deletion_pending
+        response["inventory_records"] = inventory_records(
+            domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted, deletion_pending
+        )
+        return response
+
+    except Exception as e:
+        logger.error("Error replacing certificate for %s: %s", domain, str(e), exc_info=True)
+        metadata_writer.submit(store_replacement_error, transaction_id, domain, old_cert_arn, str(e))
+        return create_error_response(domain, transaction_id, str(e))
+
+
+def call_acm(operation, limiter=None, **kwargs):
+    """Call an ACM operation, through an adaptive rate limiter when one is given."""
+    if limiter is None:
+        return getattr(acm, operation)(**kwargs)
+    return limiter.call(getattr(acm_batch, operation), **kwargs)
+
+
+def load_certificate_groups(transaction_id):
+    """Load the group to domains mapping written by generate-certs."""
+    key = f"transactions/{transaction_id}/{CERTIFICATE_GROUPS_FILE}"
+    response = s3.get_object(Bucket=bucket_name, Key=key)
+    return json.loads(response["Body"].read())["groups"]
+
+
+def replace_group_certificate(group, transaction_id):
+    """Import one SAN certificate and retire the certificates its domains used before."""
+    group_name = group["group"]
+    old_cert_arns = group.get("old_certificate_arns", {})
+
+    certificate, private_key, chain, expiration_date = retrieve_certificate_from_s3(
+        group_name, group.get("bundle_version_id")
+    )
+    # Re-import in place only when every domain used the same old certificate
+    distinct_arns = sorted(set(old_cert_arns.values()))
+    reimport_arn = distinct_arns[0] if import_mode == "reimport" and len(distinct_arns) == 1 else None
+    new_cert_arn = import_certificate_to_acm(certificate, private_key, chain, reimport_arn)
+    reimported = bool(reimport_arn) and new_cert_arn == reimport_arn
+    metadata_writer.submit(
+        store_replacement_summary, transaction_id, group_name, old_cert_arns, new_cert_arn, expiration_date
+    )
+
+    # Several domains may share one old certificate - retire each ARN once
+    superseded_arns = [arn for arn in distinct_arns if superseded_certificate_arn(arn, certificate, reimported)]
+    pending_arns = [arn for arn in superseded_arns if is_deletion_deferred(arn)]
+    deletions = {arn: retire_old_certificate(arn) for arn in superseded_arns if arn not in pending_arns}
+    records = []
+    for domain in group["domains"]:
+        old_cert_arn = old_cert_arns.get(domain)
+        old_cert_deleted = deletions.get(old_cert_arn, (False, None))[0]
+        records += inventory_records(
+            domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted,
+            old_cert_arn in pending_arns
+        )
+    # One conditional index write for the whole group
+    metadata_writer.submit(store_inventory_records, records)
+
+    return {
+        "group": group_name,
+        "domains": group["domains"],
+        "success": True,
+        "new_certificate_arn": new_cert_arn,
+        "reimported_in_place": reimported,
+        "expiration_date": expiration_date,
+        "deleted_certificate_arns": [arn for arn, (deleted, _) in deletions.items() if deleted],
+        "pending_deletion_arns": pending_arns,
+        "deletion_errors": {arn: error for arn, (_, error) in deletions.items() if error}
+    }
+
+
+def retrieve_certificate_from_s3(domain, version_id=None, legacy_version_ids=None):
+    """Retrieve the certificate bundle (or legacy certificate files) from S3.
+
+    version_id pins the bundle; legacy_version_ids pins each legacy file by name.
+    """
+    logger.info("Retrieving certificate from S3 for domain: %s", domain)
+
+    bundle = read_bundle(s3, bucket_name, domain, version_id, legacy_version_ids)
+
+    logger.debug("Certificate retrieved successfully from S3")
+    return bundle["certificate"], bundle["private_key"], bundle["chain"], bundle["metadata"].get("expiration_date", "")
+
+
+def import_certificate_to_acm(certificate, private_key, chain, certificate_arn=None, limiter=None, describe_limiter=None):
+    """Import certificate to AWS ACM.
+
+    With certificate_arn the existing certificate is re-imported in place and
+    keeps its ARN when it is an imported certificate for the same names and key
+    algorithm; otherwise, or if it no longer exists, a new one is imported.
+    """
+    if certificate_arn:
+        blocker = reimport_blocker(certificate_arn, certificate, describe_limiter)
+        if blocker:
+            logger.warning("Not re-importing into %s (%s) - importing a new certificate",
+                           certificate_arn, blocker["reason"])
+        else:
+            logger.info("Re-importing certificate in place: %s", certificate_arn)
+            try:
+                response = call_acm(
+                    "import_certificate",
+                    limiter,
+                    CertificateArn=certificate_arn,
+                    Certificate=certificate,
+                    PrivateKey=private_key,
+                    CertificateChain=chain
+                )
+                logger.info("Certificate re-imported to ACM: %s", response["CertificateArn"])
+                return response["CertificateArn"]
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "ResourceNotFoundException":
+                    raise
+                logger.warning("Certificate %s no longer exists - importing a new certificate", certificate_arn)
 
-def import_certificate_to_acm(certificate, private_key, chain):
-    """Import certificate to AWS ACM."""
     logger.info("Importing certificate to ACM")
 
-    response = acm.import_certificate(
+    response = call_acm(
+        "import_certificate",
+        limiter,
         Certificate=certificate,
         PrivateKey=private_key,
         CertificateChain=chain
@@ -81,7 +338,71 @@ def import_certificate_to_acm(certificate, private_key, chain):
     return new_cert_arn
 
 
-def delete_old_certificate(old_cert_arn):
+def reimport_blocker(certificate_arn, certificate, limiter=None):
+    """Why certificate must not overwrite the certificate at certificate_arn, or None if it may.
+
+    check-certs can return a wildcard or SAN certificate that merely covers the
+    domain, and ACM only re-imports over imported certificates, so the existing
+    certificate has to be IMPORTED with the same names and key algorithm.
+    Returns {"reason": ..., "safe_to_retire": ...}; safe_to_retire is true only
+    for an imported certificate whose names the new certificate all covers, so
+    it may still be retired once the new certificate is imported beside it.
+    """
+    try:
+        existing = call_acm("describe_certificate", limiter, CertificateArn=certificate_arn)["Certificate"]
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ResourceNotFoundException":
+            raise
+        return {"reason": "it no longer exists", "safe_to_retire": False}
+
+    if existing.get("Type") != "IMPORTED":
+        return {"reason": f"it is {existing.get('Type')}, not IMPORTED", "safe_to_retire": False}
+    metadata = certificate_metadata(certificate)
+    existing_names = {name.lower() for name in existing.get("SubjectAlternativeNames", [])}
+    new_names = {name.lower() for name in metadata["subject_alternative_names"]}
+    if existing_names != new_names:
+        return {"reason": "it covers different names", "safe_to_retire": existing_names <= new_names}
+    if existing.get("KeyAlgorithm") != ACM_KEY_ALGORITHMS.get(metadata["key_type"]):
+        return {"reason": f"its key algorithm is {existing.get('KeyAlgorithm')}", "safe_to_retire": True}
+    return None
+
+
+def superseded_certificate_arn(old_cert_arn, certificate, reimported, limiter=None):
+    """The old certificate ARN to retire after importing certificate, or None to leave it alone.
+
+    A certificate check-certs found may be a wildcard or SAN certificate that
+    still serves other names, or one ACM issued, so only an imported
+    certificate whose names the new certificate covers is retired.
+    """
+    if reimported or not old_cert_arn:
+        return None
+    blocker = reimport_blocker(old_cert_arn, certificate, limiter)
+    if blocker and not blocker["safe_to_retire"]:
+        logger.info("Leaving old certificate %s in place (%s)", old_cert_arn, blocker["reason"])
+        return None
+    return old_cert_arn
+
+
+def is_deletion_deferred(old_cert_arn):
+    """Whether a superseded certificate is left for sweep-certs instead of deleted now."""
+    return bool(old_cert_arn) and deletion_mode == "deferred"
+
+
+def retire_old_certificate(old_cert_arn, limiter=None):
+    """Delete a superseded certificate inline, or leave it queued for sweep-certs.
+
+    Deferred certificates are recorded as pending_deletion in the inventory
+    index; sweep-certs deletes them once nothing uses them any more.
+    """
+    if not old_cert_arn:
+        return False, None
+    if is_deletion_deferred(old_cert_arn):
+        logger.info("Old certificate queued for deletion by the sweeper: %s", old_cert_arn)
+        return False, None
+    return delete_old_certificate(old_cert_arn, limiter)
+
+
+def delete_old_certificate(old_cert_arn, limiter=None):
     """Delete old certificate from ACM."""
     if not old_cert_arn:
         logger.debug("No old certificate ARN provided for deletion")
@@ -90,7 +411,7 @@ def delete_old_certificate(old_cert_arn):
     logger.info("Attempting to delete old certificate: %s", old_cert_arn)
 
     try:
-        acm.delete_certificate(CertificateArn=old_cert_arn)
+        call_acm("delete_certificate", limiter, CertificateArn=old_cert_arn)
         logger.info("Successfully deleted old certificate: %s", old_cert_arn)
         return True, None
     except Exception as e:
@@ -98,24 +419,37 @@ def delete_old_certificate(old_cert_arn):
         return False, str(e)
 
 
-def update_certificate_inventories(domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted):
-    """Update certificate inventories in S3."""
+def update_certificate_inventories(domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted,
+                                   deletion_pending=False):
+    """Queue one inventory index update covering the new and any retired certificate."""
     logger.info("Updating certificate inventories")
+    metadata_writer.submit(
+        store_inventory_records,
+        inventory_records(domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted,
+                          deletion_pending)
+    )
 
-    # Update new certificate inventory
-    update_certificate_inventory(domain, new_cert_arn, expiration_date, transaction_id, "active")
 
-    # Update old certificate inventory if deleted
-    if old_cert_deleted and old_cert_arn:
-        logger.info("Updating inventory for deleted old certificate")
-        update_certificate_inventory(domain, old_cert_arn, expiration_date, transaction_id, "deleted", new_cert_arn)
+def inventory_records(domain, old_cert_arn, new_cert_arn, expiration_date, transaction_id, old_cert_deleted,
+                      deletion_pending=False):
+    """Inventory records for a new certificate and, if it was deleted or queued for deletion, the one it replaced."""
+    records = [inventory_record(domain, new_cert_arn, expiration_date, transaction_id, "active")]
 
+    if old_cert_arn and (old_cert_deleted or deletion_pending):
+        status = "deleted" if old_cert_deleted else "pending_deletion"
+        logger.info("Updating inventory for %s old certificate", status.replace("_", " "))
+        records.append(inventory_record(domain, old_cert_arn, expiration_date, transaction_id, status, new_cert_arn))
+    return records
 
-def update_certificate_inventory(domain, cert_arn, expiration_date, transaction_id, status, replaced_by=None):
-    """Update individual certificate inventory in S3."""
-    logger.debug("Updating certificate inventory for: %s", cert_arn)
 
-    inventory = {
+def store_inventory_records(records):
+    """Apply inventory records to the index in S3 with a conditional write."""
+    update_index(s3, bucket_name, records)
+
+
+def inventory_record(domain, cert_arn, expiration_date, transaction_id, status, replaced_by=None):
+    """Build the inventory index record for one certificate."""
+    return {
         "certificate_arn": cert_arn,
         "domain": domain,
         "expiration_date": expiration_date,
@@ -126,24 +460,13 @@ def update_certificate_inventory(domain, cert_arn, expiration_date, transaction_
         "replaced_by": replaced_by
     }
 
-    cert_id = cert_arn.split("/")[-1] if cert_arn else "unknown"
-    key_suffix = "_deleted.json" if status == "deleted" else ".json"
-
-    s3.put_object(
-        Bucket=bucket_name,
-        Key=f"inventory/certificates/{domain}_{cert_id}{key_suffix}",
-        Body=json.dumps(inventory, indent=2, default=str),
-        ServerSideEncryption="aws:kms"
-    )
-    logger.debug("Certificate inventory updated: inventory/certificates/%s_%s%s", domain, cert_id, key_suffix)
-
 
 def store_replacement_artifacts(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date):
-    """Store replacement artifacts in S3."""
+    """Queue replacement artifact writes to S3."""
     logger.info("Storing replacement artifacts in S3")
 
-    store_replacement_metadata(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
-    store_replacement_summary(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
+    metadata_writer.submit(store_replacement_metadata, transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
+    metadata_writer.submit(store_replacement_summary, transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date)
 
 
 def store_replacement_metadata(transaction_id, domain, old_cert_arn, new_cert_arn, expiration_date):
@@ -240,4 +563,7 @@ def create_error_response(domain, transaction_id, error_message):
         "error": error_message,
         "domain": domain,
         "transaction_id": transaction_id
-    }
\ No newline at end of file
+    }
+
+
+log_import_time(import_started)
@@ -1,11 +1,42 @@
+import json
 import os
+from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, patch
 
 import pytest
+from botocore.exceptions import ClientError
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
 
 import index
 
 
+def self_signed_certificate(*names):
+    """Return a PEM self-signed P-256 certificate for names."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=90))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in names]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def described_certificate(names, certificate_type="IMPORTED", key_algorithm="EC_prime256v1"):
+    """Return a DescribeCertificate response for an existing certificate."""
+    return {"Certificate": {"SubjectAlternativeNames": list(names), "Type": certificate_type, "KeyAlgorithm": key_algorithm}}
+
+
 class TestReplaceCertificateLambda:
     """Test suite for replace certificate Lambda function."""
 
@@ -53,7 +84,9 @@ class TestReplaceCertificateLambda:
         self, setup_env, mock_aws_clients, sample_event, mock_certificate_data
     ):
         """Test successful certificate replacement."""
-        with patch("index.retrieve_certificate_from_s3", return_value=mock_certificate_data), \
+        with patch("index.import_mode", "new"), patch("index.deletion_mode", "inline"), \
+             patch("index.retrieve_certificate_from_s3", return_value=mock_certificate_data), \
+             patch("index.reimport_blocker", return_value=None), \
              patch("index.import_certificate_to_acm", return_value="new-cert-arn"), \
              patch("index.delete_old_certificate", return_value=(True, None)), \
              patch("index.update_certificate_inventories") as mock_update_inventory, \
@@ -67,6 +100,30 @@ class TestReplaceCertificateLambda:
         mock_update_inventory.assert_called_once()
         mock_store_artifacts.assert_called_once()
 
+    def test_lambda_handler_reports_metadata_errors(
+        self, setup_env, mock_aws_clients, sample_event, mock_certificate_data
+    ):
+        """Test background metadata write failures are reported in the response."""
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "new"), \
+             patch("index.deletion_mode", "inline"), \
+             patch("index.retrieve_certificate_from_s3", return_value=mock_certificate_data), \
+             patch("index.reimport_blocker", return_value=None), \
+             patch("index.import_certificate_to_acm", return_value="new-cert-arn"), \
+             patch("index.delete_old_certificate", return_value=(True, None)), \
+             patch("index.store_replacement_summary", side_effect=Exception("Access Denied")), \
+             patch("index.store_replacement_metadata") as mock_store_metadata, \
+             patch("index.store_inventory_records"), \
+             patch("index.inventory_record") as mock_update_inventory:
+
+            result = index.lambda_handler(sample_event, {})
+
+        assert result["success"] is True
+        assert len(result["metadata_errors"]) == 1
+        assert "store_replacement_summary" in result["metadata_errors"][0]["operation"]
+        assert result["metadata_errors"][0]["error"] == "Access Denied"
+        mock_store_metadata.assert_called_once()
+        assert mock_update_inventory.call_count == 2
+
     def test_lambda_handler_failure(
         self, setup_env, mock_aws_clients, sample_event
     ):
@@ -82,6 +139,21 @@ class TestReplaceCertificateLambda:
         assert "S3 error" in result["error"]
         mock_store_error.assert_called_once()
 
+    def test_lambda_handler_throttling_is_retryable(
+        self, setup_env, mock_aws_clients, sample_event, mock_certificate_data
+    ):
+        """Test a throttled import is raised as RetryableError instead of returned as a failure."""
+        throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "ImportCertificate")
+        with patch("index.bucket_name", "test-bucket"), \
+             patch("index.retrieve_certificate_from_s3", return_value=mock_certificate_data), \
+             patch("index.import_certificate_to_acm", side_effect=throttled), \
+             patch("index.store_replacement_error") as mock_store_error:
+
+            with pytest.raises(index.RetryableError):
+                index.lambda_handler(sample_event, {})
+
+        mock_store_error.assert_called_once()
+
 
 class TestRetrieveCertificateFromS3:
     """Test suite for retrieve_certificate_from_s3 function."""
@@ -128,6 +200,26 @@ class TestRetrieveCertificateFromS3:
         assert "chain.pem" in calls[2][1]["Key"]
 
 
+    def test_retrieve_certificate_from_bundle(self, mock_s3):
+        """Test a bundle written by generate-certs is read with one GET of the requested version."""
+        bundle = {
+            "format_version": 1,
+            "certificate": "MOCK_CERTIFICATE",
+            "private_key": "MOCK_PRIVATE_KEY",
+            "chain": "MOCK_CHAIN",
+            "metadata": {"expiration_date": "2030-01-01T00:00:00"}
+        }
+        mock_s3.get_object.return_value = {"Body": Mock(read=Mock(return_value=json.dumps(bundle).encode()))}
+
+        with patch("index.bucket_name", "test-bucket"):
+            result = index.retrieve_certificate_from_s3("example.com", "v1")
+
+        assert result == ("MOCK_CERTIFICATE", "MOCK_PRIVATE_KEY", "MOCK_CHAIN", "2030-01-01T00:00:00")
+        mock_s3.get_object.assert_called_once_with(
+            Bucket="test-bucket", Key="certificates/example.com/bundle.json", VersionId="v1"
+        )
+
+
 class TestImportCertificateToAcm:
     """Test suite for import_certificate_to_acm function."""
 
@@ -153,6 +245,131 @@ class TestImportCertificateToAcm:
         )
 
 
+    def test_reimport_in_place(self, mock_acm):
+        """Test passing the old ARN overwrites that certificate instead of creating a new one."""
+        certificate = self_signed_certificate("example.com")
+        mock_acm.describe_certificate.return_value = described_certificate(["example.com"])
+        mock_acm.import_certificate.return_value = {"CertificateArn": "old-arn"}
+
+        result = index.import_certificate_to_acm(certificate, "key", "chain", "old-arn")
+
+        assert result == "old-arn"
+        mock_acm.describe_certificate.assert_called_once_with(CertificateArn="old-arn")
+        mock_acm.import_certificate.assert_called_once_with(
+            CertificateArn="old-arn", Certificate=certificate, PrivateKey="key", CertificateChain="chain"
+        )
+
+    def test_reimport_of_missing_certificate_imports_new(self, mock_acm):
+        """Test a re-import into a deleted certificate falls back to a new import."""
+        mock_acm.describe_certificate.side_effect = ClientError(
+            {"Error": {"Code": "ResourceNotFoundException", "Message": "gone"}}, "DescribeCertificate"
+        )
+        mock_acm.import_certificate.return_value = {"CertificateArn": "new-arn"}
+
+        assert index.import_certificate_to_acm("cert", "key", "chain", "old-arn") == "new-arn"
+        mock_acm.import_certificate.assert_called_once_with(Certificate="cert", PrivateKey="key", CertificateChain="chain")
+
+    @pytest.mark.parametrize("existing", [
+        described_certificate(["*.example.com", "example.com"]),
+        described_certificate(["example.com", "www.example.com"]),
+    ], ids=["wildcard", "san"])
+    def test_covering_certificate_is_not_overwritten(self, mock_acm, existing):
+        """Test a wildcard or SAN certificate that only covers the domain keeps its names and a new one is imported."""
+        mock_acm.describe_certificate.return_value = existing
+        mock_acm.import_certificate.return_value = {"CertificateArn": "new-arn"}
+
+        assert index.import_certificate_to_acm(self_signed_certificate("example.com"), "key", "chain", "old-arn") == "new-arn"
+        assert "CertificateArn" not in mock_acm.import_certificate.call_args[1]
+
+    @pytest.mark.parametrize("existing", [
+        described_certificate(["example.com"], certificate_type="AMAZON_ISSUED"),
+        described_certificate(["example.com"], key_algorithm="RSA_2048"),
+    ], ids=["amazon-issued", "key-algorithm"])
+    def test_incompatible_certificate_imports_new(self, mock_acm, existing):
+        """Test an ACM-issued certificate or one with another key algorithm is left alone."""
+        mock_acm.describe_certificate.return_value = existing
+        mock_acm.import_certificate.return_value = {"CertificateArn": "new-arn"}
+
+        assert index.import_certificate_to_acm(self_signed_certificate("example.com"), "key", "chain", "old-arn") == "new-arn"
+        mock_acm.import_certificate.assert_called_once()
+        assert "CertificateArn" not in mock_acm.import_certificate.call_args[1]
+
+    @pytest.mark.parametrize("existing,safe_to_retire", [
+        (described_certificate(["*.example.com", "example.com"]), False),
+        (described_certificate(["example.com"], certificate_type="AMAZON_ISSUED"), False),
+        (described_certificate(["example.com"], key_algorithm="RSA_2048"), True),
+    ], ids=["wildcard", "amazon-issued", "key-algorithm"])
+    def test_blocker_says_whether_the_existing_certificate_may_be_retired(self, mock_acm, existing, safe_to_retire):
+        """Test only an imported certificate for the same names is safe to retire when it cannot be overwritten."""
+        mock_acm.describe_certificate.return_value = existing
+
+        blocker = index.reimport_blocker("old-arn", self_signed_certificate("example.com"))
+
+        assert blocker["safe_to_retire"] is safe_to_retire
+
+
+class TestReimportInPlace:
+    """Test suite for renewing certificates in place."""
+
+    def test_lambda_handler_reimports_without_deleting(self):
+        """Test the renewed certificate keeps the old ARN and nothing is deleted."""
+        event = {"domain": "example.com", "transaction_id": "test-transaction", "certificate_arn": "old-arn"}
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "reimport"), \
+             patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.import_certificate_to_acm", return_value="old-arn") as mock_import, \
+             patch("index.delete_old_certificate") as mock_delete, \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_inventory_records"), \
+             patch("index.inventory_record") as mock_update_inventory:
+
+            result = index.lambda_handler(event, {})
+
+        mock_import.assert_called_once_with("CERT", "KEY", "CHAIN", "old-arn")
+        mock_delete.assert_not_called()
+        assert result["new_certificate_arn"] == "old-arn"
+        assert result["reimported_in_place"] is True
+        assert result["old_certificate_deleted"] is False
+        # Only the active inventory record is written
+        mock_update_inventory.assert_called_once()
+
+    def test_group_sharing_one_old_certificate_reimports_it(self):
+        """Test a group whose domains all used one certificate re-imports into that ARN."""
+        group = {"group": "san-example.com", "domains": ["a.example.com", "b.example.com"],
+                 "old_certificate_arns": {"a.example.com": "old-arn", "b.example.com": "old-arn"}}
+        with patch("index.import_mode", "reimport"), \
+             patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.import_certificate_to_acm", return_value="old-arn") as mock_import, \
+             patch("index.delete_old_certificate") as mock_delete, \
+             patch("index.metadata_writer") as mock_writer:
+
+            result = index.replace_group_certificate(group, "test-transaction")
+
+        mock_import.assert_called_once_with("CERT", "KEY", "CHAIN", "old-arn")
+        mock_delete.assert_not_called()
+        assert result["reimported_in_place"] is True
+        assert result["deleted_certificate_arns"] == []
+        # Summary plus one inventory index update holding an active record per domain
+        assert mock_writer.submit.call_count == 2
+        records = mock_writer.submit.call_args_list[1][0][1]
+        assert [(record["domain"], record["status"]) for record in records] == [
+            ("a.example.com", "active"), ("b.example.com", "active")
+        ]
+
+    def test_lambda_handler_without_old_arn_imports_new(self):
+        """Test a first-time certificate is imported as new."""
+        event = {"domain": "example.com", "transaction_id": "test-transaction"}
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "reimport"), \
+             patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.import_certificate_to_acm", return_value="new-arn") as mock_import, \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_inventory_records"):
+
+            result = index.lambda_handler(event, {})
+
+        mock_import.assert_called_once_with("CERT", "KEY", "CHAIN", None)
+        assert result["reimported_in_place"] is False
+
+
 class TestDeleteOldCertificate:
     """Test suite for delete_old_certificate function."""
 
@@ -160,4 +377,163 @@ class TestDeleteOldCertificate:
     def mock_acm(self):
         """Mock ACM client."""
         with patch("index.acm") as mock_acm:
-            yield
\ No newline at end of file
+            yield
+
+class TestGroupReplacement:
+    """Test suite for SAN group replacement."""
+
+    @pytest.fixture
+    def mock_aws_clients(self):
+        """Mock AWS clients and a recorded group mapping."""
+        groups = {"groups": [
+            {
+                "group": "san-example.com",
+                "domains": ["a.example.com", "b.example.com"],
+                "old_certificate_arns": {"a.example.com": "old-arn", "b.example.com": "old-arn"},
+                "success": True
+            },
+            {"group": "san-example.org", "domains": ["a.example.org"], "success": False, "error": "DNS failed"}
+        ]}
+        with patch("index.s3") as mock_s3, patch("index.acm") as mock_acm, \
+             patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "new"), \
+             patch("index.deletion_mode", "inline"):
+            mock_s3.get_object.return_value = {"Body": Mock(read=Mock(return_value=json.dumps(groups).encode()))}
+            yield {"s3": mock_s3, "acm": mock_acm}
+
+    def test_each_group_imported_once(self, mock_aws_clients):
+        """Test a group certificate is imported once and a shared old certificate deleted once."""
+        with patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")) as mock_retrieve, \
+             patch("index.import_certificate_to_acm", return_value="new-arn") as mock_import, \
+             patch("index.delete_old_certificate", return_value=(True, None)) as mock_delete, \
+             patch("index.reimport_blocker", return_value=None), \
+             patch("index.store_inventory_records") as mock_inventories:
+
+            result = index.lambda_handler({"transaction_id": "test-transaction", "domains": []}, {})
+
+        mock_aws_clients["s3"].get_object.assert_called_once_with(
+            Bucket="test-bucket", Key="transactions/test-transaction/certificate_groups.json"
+        )
+        mock_retrieve.assert_called_once_with("san-example.com", None)
+        mock_import.assert_called_once()
+        mock_delete.assert_called_once_with("old-arn", None)
+        # One index update: each domain's new certificate and the deleted shared one
+        mock_inventories.assert_called_once()
+        assert len(mock_inventories.call_args[0][0]) == 4
+        assert result["success"] is False
+        assert result["groups"][0]["new_certificate_arn"] == "new-arn"
+        assert result["groups"][0]["deleted_certificate_arns"] == ["old-arn"]
+        assert result["groups"][1] == {"group": "san-example.org", "success": False, "error": "DNS failed"}
+
+
+class TestDeferredDeletion:
+    """Test suite for leaving superseded certificates to the sweeper."""
+
+    def test_old_certificate_queued_not_deleted(self):
+        """Test a new ARN leaves the old certificate pending_deletion in the inventory index."""
+        event = {"domain": "example.com", "transaction_id": "test-transaction", "certificate_arn": "old-arn"}
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "new"), \
+             patch("index.deletion_mode", "deferred"), \
+             patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.import_certificate_to_acm", return_value="new-arn"), \
+             patch("index.reimport_blocker", return_value=None), \
+             patch("index.delete_old_certificate") as mock_delete, \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_inventory_records") as mock_inventory:
+
+            result = index.lambda_handler(event, {})
+
+        mock_delete.assert_not_called()
+        assert result["old_certificate_deleted"] is False
+        assert result["old_certificate_deletion_pending"] is True
+        records = mock_inventory.call_args[0][0]
+        assert [(r["certificate_arn"], r["status"]) for r in records] == [("new-arn", "active"), ("old-arn", "pending_deletion")]
+        assert records[1]["replaced_by"] == "new-arn"
+
+    def test_reimported_certificate_is_not_queued(self):
+        """Test a certificate re-imported in place is never queued for deletion."""
+        event = {"domain": "example.com", "transaction_id": "test-transaction", "certificate_arn": "old-arn"}
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "reimport"), \
+             patch("index.deletion_mode", "deferred"), \
+             patch("index.retrieve_certificate_from_s3", return_value=("CERT", "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.import_certificate_to_acm", return_value="old-arn"), \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_inventory_records") as mock_inventory:
+
+            result = index.lambda_handler(event, {})
+
+        assert result["old_certificate_deletion_pending"] is False
+        assert [r["status"] for r in mock_inventory.call_args[0][0]] == ["active"]
+
+
+    @pytest.mark.parametrize("deletion_mode", ["deferred", "inline"])
+    def test_covering_wildcard_is_neither_queued_nor_deleted(self, deletion_mode):
+        """Test a wildcard certificate check-certs returned for the domain is left in ACM untouched."""
+        event = {"domain": "a.example.com", "transaction_id": "test-transaction", "certificate_arn": "wildcard-arn"}
+        certificate = self_signed_certificate("a.example.com")
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "reimport"), \
+             patch("index.deletion_mode", deletion_mode), patch("index.acm") as mock_acm, \
+             patch("index.retrieve_certificate_from_s3", return_value=(certificate, "KEY", "CHAIN", "2030-01-01")), \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_inventory_records") as mock_inventory:
+            mock_acm.describe_certificate.return_value = described_certificate(["*.example.com", "example.com"])
+            mock_acm.import_certificate.return_value = {"CertificateArn": "new-arn"}
+
+            result = index.lambda_handler(event, {})
+
+        mock_acm.delete_certificate.assert_not_called()
+        assert result["new_certificate_arn"] == "new-arn"
+        assert result["old_certificate_deleted"] is False
+        assert result["old_certificate_deletion_pending"] is False
+        assert [(r["certificate_arn"], r["status"]) for r in mock_inventory.call_args[0][0]] == [("new-arn", "active")]
+
+
+class TestBatchReplacement:
+    """Test suite for rate-limited batch replacement."""
+
+    def test_batch_returns_per_domain_outcomes(self):
+        """Test each entry gets its own outcome and the inventory index is updated once."""
+        def retrieve(domain, version_id=None, legacy_version_ids=None):
+            if domain == "broken.example.com":
+                raise Exception("NoSuchKey")
+            return ("CERT", "KEY", "CHAIN", "2030-01-01")
+
+        event = {"transaction_id": "batch-transaction", "certificates": [
+            {"domain": "a.example.com", "certificate_arn": "arn-a"},
+            {"domain": "broken.example.com", "certificate_arn": "arn-b"},
+            {"domain": "c.example.com", "transaction_id": "own-transaction"}
+        ]}
+        with patch("index.bucket_name", "test-bucket"), patch("index.import_mode", "reimport"), \
+             patch("index.import_limiter", index.AdaptiveRateLimiter(1000)), \
+             patch("index.acm_batch") as mock_acm, \
+             patch("index.retrieve_certificate_from_s3", side_effect=retrieve), \
+             patch("index.reimport_blocker", return_value=None), \
+             patch("index.store_replacement_artifacts"), \
+             patch("index.store_replacement_error") as mock_store_error, \
+             patch("index.store_inventory_records") as mock_inventory:
+            mock_acm.import_certificate.side_effect = lambda **kwargs: {"CertificateArn": kwargs.get("CertificateArn", "arn-new")}
+
+            result = index.lambda_handler(event, {})
+
+        assert result["success"] is False
+        assert [(r["domain"], r["success"]) for r in result["results"]] == [
+            ("a.example.com", True), ("broken.example.com", False), ("c.example.com", True)
+        ]
+        assert result["results"][0]["new_certificate_arn"] == "arn-a"
+        assert result["results"][2]["transaction_id"] == "own-transaction"
+        mock_store_error.assert_called_once_with("batch-transaction", "broken.example.com", "arn-b", "NoSuchKey")
+        mock_inventory.assert_called_once()
+        assert [record["certificate_arn"] for record in mock_inventory.call_args[0][0]] == ["arn-a", "arn-new"]
+
+    def test_throttled_import_is_retried_at_lower_rate(self):
+        """Test a ThrottlingException slows the shared limiter and the import still succeeds."""
+        throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "ImportCertificate")
+        limiter = index.AdaptiveRateLimiter(4, is_throttle=index.is_throttling_error, sleep=lambda seconds: None)
+
+        with patch("index.acm_batch") as mock_acm:
+            mock_acm.import_certificate.side_effect = [throttled, {"CertificateArn": "arn-new"}]
+            result = index.import_certificate_to_acm("cert", "key", "chain", limiter=limiter)
+
+        assert result == "arn-new"
+        assert mock_acm.import_certificate.call_count == 2
+        assert limiter.throttles == 1
+        assert limiter.rate < 4
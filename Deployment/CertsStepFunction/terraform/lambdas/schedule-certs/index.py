@@ -0,0 +1,215 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
+import heapq
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from acm_certificates import build_certificate_index, list_acm_certificates
+from aws_clients import is_missing_object, lazy_client, log_import_time
+from errors import MissingInputError
+
+# Initialize AWS clients and environment variables
+s3 = lazy_client("s3")
+acm = lazy_client("acm")
+sfn = lazy_client("stepfunctions")
+bucket_name = os.environ.get("S3_BUCKET")
+state_machine_arn = os.environ.get("STATE_MACHINE_ARN")
+scheduled_domains = os.environ.get("SCHEDULED_DOMAINS", "")
+renewal_window_days = int(os.environ.get("RENEWAL_WINDOW_DAYS", "30"))
+recheck_interval_hours = int(os.environ.get("RECHECK_INTERVAL_HOURS", "24"))
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+SCHEDULE_KEY = "schedule/expiry_schedule.json"
+SCHEDULE_VERSION = 1
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# Unknown domains are due immediately
+UNKNOWN_EXPIRATION = "1970-01-01T00:00:00"
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(getattr(logging, log_level, logging.INFO))
+
+
+def lambda_handler(event, context):
+    """Lambda handler to start checks only for domains whose renewal window has opened."""
+    logger.info("Starting certificate schedule tick")
+    logger.debug("Event: %s", event)
+
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+    if not state_machine_arn:
+        logger.error("STATE_MACHINE_ARN environment variable is required but not set")
+        raise MissingInputError("STATE_MACHINE_ARN environment variable is required")
+
+    now = datetime.utcnow()
+    schedule = load_schedule()
+    changed = sync_domains(schedule, get_configured_domains(event))
+
+    due = pop_due_domains(schedule, now)
+    started = []
+    rescheduled = []
+
+    if due:
+        expirations = get_acm_expirations(due)
+        for domain in due:
+            expiration = expirations.get(domain)
+            if expiration and not is_in_renewal_window(expiration, now):
+                # Renewed since it was scheduled - just move it to its real slot
+                push_domain(schedule, domain, expiration)
+                rescheduled.append(domain)
+            else:
+                start_certificate_workflow(domain)
+                push_domain(schedule, domain, provisional_expiration(now))
+                started.append(domain)
+        changed = True
+
+    if changed:
+        save_schedule(schedule)
+
+    response = {
+        "domains_scheduled": len(schedule),
+        "started": started,
+        "rescheduled": rescheduled,
+        "next_wakeup": next_wakeup(schedule, now),
+    }
+    logger.info("Certificate schedule tick completed: %s", response)
+    return response
+
+
+def get_configured_domains(event):
+    """Return the domains to schedule from the event or SCHEDULED_DOMAINS."""
+    domains = event.get("domains")
+    if domains is None:
+        domains = [domain.strip() for domain in scheduled_domains.split(",") if domain.strip()]
+    return [domain.lower() for domain in domains]
+
+
+def load_schedule():
+    """Load the expiry min-heap from S3, returning an empty heap if none exists."""
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=SCHEDULE_KEY)
+    except Exception as e:
+        if not is_missing_object(e):
+            raise
+        logger.info("No schedule found at %s - starting a new one", SCHEDULE_KEY)
+        return []
+
+    document = json.loads(response["Body"].read())
+    schedule = [tuple(entry) for entry in document.get("entries", [])]
+    heapq.heapify(schedule)
+    logger.debug("Loaded schedule with %d entries", len(schedule))
+    return schedule
+
+
+def save_schedule(schedule):
+    """Persist the expiry min-heap to S3 as one compact object."""
+    document = {"version": SCHEDULE_VERSION, "entries": schedule}
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=SCHEDULE_KEY,
+        Body=json.dumps(document, separators=(",", ":")),
+        ContentType="application/json",
+        ServerSideEncryption="aws:kms",
+    )
+    logger.info("Schedule stored in S3: %s (%d entries)", SCHEDULE_KEY, len(schedule))
+
+
+def sync_domains(schedule, domains):
+    """Add newly configured domains and drop ones no longer configured."""
+    if not domains:
+        return False
+
+    configured = set(domains)
+    known = {domain for _, domain in schedule}
+    if configured == known:
+        return False
+
+    schedule[:] = [entry for entry in schedule if entry[1] in configured]
+    for domain in sorted(configured - known):
+        logger.info("Adding domain to schedule: %s", domain)
+        schedule.append((UNKNOWN_EXPIRATION, domain))
+    heapq.heapify(schedule)
+    return True
+
+
+def push_domain(schedule, domain, expiration):
+    """Push a domain onto the heap keyed by its expiration date."""
+    heapq.heappush(schedule, (format_timestamp(expiration), domain))
+
+
+def pop_due_domains(schedule, now):
+    """Pop every domain whose renewal window has opened."""
+    due = []
+    while schedule and is_in_renewal_window(parse_timestamp(schedule[0][0]), now):
+        _, domain = heapq.heappop(schedule)
+        due.append(domain)
+
+    logger.info("%d domains due for renewal check", len(due))
+    return due
+
+
+def is_in_renewal_window(expiration, now):
+    """Check whether a certificate expiring at the given time should be renewed."""
+    return expiration - timedelta(days=renewal_window_days) <= now
+
+
+def provisional_expiration(now):
+    """Pseudo-expiration that makes a started domain due again after the recheck interval."""
+    return now + timedelta(days=renewal_window_days, hours=recheck_interval_hours)
+
+
+def next_wakeup(schedule, now):
+    """Return when the earliest renewal window opens."""
+    if not schedule:
+        return None
+    wakeup = parse_timestamp(schedule[0][0]) - timedelta(days=renewal_window_days)
+    return format_timestamp(max(wakeup, now))
+
+
+def get_acm_expirations(domains):
+    """List ACM once and return the latest NotAfter of the certificates covering each domain.
+
+    Coverage follows check-certs: exact names, SANs and one-label wildcards.
+    """
+    certificates = list_acm_certificates(acm)
+    certificate_index = build_certificate_index(certificates)
+    not_after = {cert["CertificateArn"]: cert.get("NotAfter") for cert in certificates}
+    expirations = {}
+
+    for domain in domains:
+        covering = [arn for arn in certificate_index.match(domain) if not_after.get(arn)]
+        if covering:
+            # match() orders latest-expiring first
+            expirations[domain] = not_after[covering[0]].replace(tzinfo=None)
+
+    logger.debug("Found expirations for %d of %d domains", len(expirations), len(domains))
+    return expirations
+
+
+def start_certificate_workflow(domain):
+    """Start the certificate management Step Function for a domain."""
+    response = sfn.start_execution(
+        stateMachineArn=state_machine_arn,
+        input=json.dumps({"domain": domain}),
+    )
+    logger.info("Started certificate workflow for %s: %s", domain, response["executionArn"])
+    return response["executionArn"]
+
+
+def format_timestamp(value):
+    """Format a datetime in the fixed, lexically sortable schedule format."""
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_timestamp(value):
+    """Parse a timestamp stored in the schedule."""
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+log_import_time(import_started)
@@ -0,0 +1,171 @@
+import json
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+import index
+
+
+def no_such_key():
+    """Return the ClientError S3 raises for a missing object."""
+    return ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+
+
+def schedule_body(entries):
+    """Return a mock S3 get_object response holding a schedule."""
+    body = Mock()
+    body.read.return_value = json.dumps({"version": 1, "entries": entries}).encode()
+    return {"Body": body}
+
+
+def saved_entries(mock_s3):
+    """Return the entries from the last schedule written to S3."""
+    body = mock_s3.put_object.call_args[1]["Body"]
+    return [tuple(entry) for entry in json.loads(body)["entries"]]
+
+
+def ts(value):
+    """Format a datetime the way the schedule stores it."""
+    return index.format_timestamp(value)
+
+
+class TestScheduleCertificateLambda:
+    """Test suite for schedule certificate Lambda function."""
+
+    @pytest.fixture
+    def mock_aws_clients(self):
+        """Mock AWS clients and required configuration."""
+        with patch("index.s3") as mock_s3, patch("index.acm") as mock_acm, \
+             patch("index.sfn") as mock_sfn, \
+             patch("index.bucket_name", "test-bucket"), \
+             patch("index.state_machine_arn", "arn:states:certificate_manager"):
+            mock_acm.get_paginator.return_value.paginate.return_value = []
+            mock_sfn.start_execution.return_value = {"executionArn": "arn:execution"}
+            yield {"s3": mock_s3, "acm": mock_acm, "sfn": mock_sfn}
+
+    def test_lambda_handler_missing_bucket_name(self):
+        """Test Lambda handler raises error when S3_BUCKET is missing."""
+        with patch("index.bucket_name", None):
+            with pytest.raises(index.MissingInputError, match="S3_BUCKET environment variable is required"):
+                index.lambda_handler({}, {})
+
+    def test_lambda_handler_missing_state_machine(self):
+        """Test Lambda handler raises error when STATE_MACHINE_ARN is missing."""
+        with patch("index.bucket_name", "test-bucket"), patch("index.state_machine_arn", None):
+            with pytest.raises(index.MissingInputError, match="STATE_MACHINE_ARN environment variable is required"):
+                index.lambda_handler({}, {})
+
+    def test_new_domains_are_checked_immediately(self, mock_aws_clients):
+        """Test domains without a known expiration start a workflow on the first tick."""
+        mock_aws_clients["s3"].get_object.side_effect = no_such_key()
+
+        result = index.lambda_handler({"domains": ["example.com"]}, {})
+
+        assert result["started"] == ["example.com"]
+        mock_aws_clients["sfn"].start_execution.assert_called_once()
+        call_args = mock_aws_clients["sfn"].start_execution.call_args[1]
+        assert json.loads(call_args["input"]) == {"domain": "example.com"}
+        assert [domain for _, domain in saved_entries(mock_aws_clients["s3"])] == ["example.com"]
+
+    def test_only_due_domains_are_checked(self, mock_aws_clients):
+        """Test domains outside their renewal window are left untouched."""
+        now = datetime.utcnow()
+        mock_aws_clients["s3"].get_object.return_value = schedule_body([
+            [ts(now + timedelta(days=10)), "due.example.com"],
+            [ts(now + timedelta(days=80)), "later.example.com"],
+        ])
+
+        result = index.lambda_handler({"domains": ["due.example.com", "later.example.com"]}, {})
+
+        assert result["started"] == ["due.example.com"]
+        # The started domain is re-checked after the recheck interval
+        wakeup = index.parse_timestamp(result["next_wakeup"])
+        assert timedelta(hours=23) < wakeup - now < timedelta(hours=25)
+        mock_aws_clients["sfn"].start_execution.assert_called_once()
+
+    def test_renewed_domain_is_rescheduled(self, mock_aws_clients):
+        """Test a due domain already renewed in ACM moves to its new expiration."""
+        now = datetime.utcnow()
+        renewed = now + timedelta(days=90)
+        mock_aws_clients["s3"].get_object.return_value = schedule_body([
+            [ts(now + timedelta(days=5)), "example.com"],
+        ])
+        mock_aws_clients["acm"].get_paginator.return_value.paginate.return_value = [{
+            "CertificateSummaryList": [
+                {"CertificateArn": "arn:new", "DomainName": "example.com", "NotAfter": renewed}
+            ]
+        }]
+
+        result = index.lambda_handler({}, {})
+
+        assert result["rescheduled"] == ["example.com"]
+        assert result["started"] == []
+        mock_aws_clients["sfn"].start_execution.assert_not_called()
+        assert saved_entries(mock_aws_clients["s3"]) == [(ts(renewed), "example.com")]
+
+    def test_covering_certificate_of_any_key_type_reschedules(self, mock_aws_clients):
+        """Test a renewed EC wildcard certificate covering the domain counts as its expiration."""
+        now = datetime.utcnow()
+        renewed = now + timedelta(days=90)
+        mock_aws_clients["s3"].get_object.return_value = schedule_body([
+            [ts(now + timedelta(days=5)), "www.example.com"],
+        ])
+        mock_aws_clients["acm"].get_paginator.return_value.paginate.return_value = [{
+            "CertificateSummaryList": [
+                {"CertificateArn": "arn:old", "DomainName": "www.example.com", "NotAfter": now + timedelta(days=5)},
+                {"CertificateArn": "arn:wildcard", "DomainName": "example.com",
+                 "SubjectAlternativeNameSummaries": ["example.com", "*.example.com"], "NotAfter": renewed}
+            ]
+        }]
+
+        result = index.lambda_handler({}, {})
+
+        assert result["rescheduled"] == ["www.example.com"]
+        assert saved_entries(mock_aws_clients["s3"]) == [(ts(renewed), "www.example.com")]
+        paginate_args = mock_aws_clients["acm"].get_paginator.return_value.paginate.call_args[1]
+        assert "EC_prime256v1" in paginate_args["Includes"]["keyTypes"]
+
+    def test_idle_tick_does_not_write(self, mock_aws_clients):
+        """Test a tick with nothing due only reads the schedule."""
+        now = datetime.utcnow()
+        mock_aws_clients["s3"].get_object.return_value = schedule_body([
+            [ts(now + timedelta(days=80)), "example.com"],
+        ])
+
+        result = index.lambda_handler({}, {})
+
+        assert result["started"] == []
+        mock_aws_clients["s3"].put_object.assert_not_called()
+        mock_aws_clients["acm"].get_paginator.assert_not_called()
+
+
+class TestScheduleHelpers:
+    """Test suite for schedule heap helpers."""
+
+    def test_sync_domains_adds_and_prunes(self):
+        """Test configured domains replace the scheduled set."""
+        schedule = [("2030-01-01T00:00:00", "old.example.com"), ("2030-02-01T00:00:00", "kept.example.com")]
+
+        changed = index.sync_domains(schedule, ["kept.example.com", "new.example.com"])
+
+        assert changed is True
+        assert sorted(domain for _, domain in schedule) == ["kept.example.com", "new.example.com"]
+        assert schedule[0] == (index.UNKNOWN_EXPIRATION, "new.example.com")
+
+    def test_pop_due_domains_in_expiry_order(self):
+        """Test due domains come off the heap earliest expiration first."""
+        now = datetime(2030, 1, 1)
+        schedule = []
+        index.push_domain(schedule, "b.example.com", now + timedelta(days=20))
+        index.push_domain(schedule, "c.example.com", now + timedelta(days=60))
+        index.push_domain(schedule, "a.example.com", now + timedelta(days=2))
+
+        assert index.pop_due_domains(schedule, now) == ["a.example.com", "b.example.com"]
+        assert index.next_wakeup(schedule, now) == "2030-01-31T00:00:00"
+
+    def test_configured_domains_from_environment(self):
+        """Test SCHEDULED_DOMAINS is used when the event has no domains."""
+        with patch("index.scheduled_domains", "A.example.com, b.example.com"):
+            assert index.get_configured_domains({}) == ["a.example.com", "b.example.com"]
@@ -0,0 +1,120 @@
+import logging
+from datetime import timezone
+
+logger = logging.getLogger()
+
+# ListCertificates only returns RSA_1024/RSA_2048 certificates unless key types are requested
+ACM_KEY_TYPES = [
+    "RSA_1024", "RSA_2048", "RSA_3072", "RSA_4096",
+    "EC_prime256v1", "EC_secp384r1", "EC_secp521r1",
+]
+
+
+def list_acm_certificates(client):
+    """List every certificate summary in ACM, of every key type, following pagination."""
+    paginator = client.get_paginator("list_certificates")
+    certificates = []
+
+    for page in paginator.paginate(Includes={"keyTypes": ACM_KEY_TYPES}):
+        certificates.extend(page["CertificateSummaryList"])
+
+    logger.debug("Found %d certificates in ACM", len(certificates))
+    return certificates
+
+
+class CertificateTrie:
+    """Reverse-label trie over certificate DomainName and SubjectAlternativeNames.
+
+    Names are stored label by label from the TLD down, so "which certificates
+    cover this host" costs one step per label. A wildcard name such as
+    "*.example.com" is stored on the "example.com" node and covers exactly
+    one extra label, matching ACM/TLS wildcard semantics.
+    """
+
+    # Ranking for otherwise equal matches: primary name, then SAN, then wildcard
+    PRIMARY, SAN, WILDCARD = 0, 1, 2
+
+    def __init__(self):
+        self._root = {"children": {}, "exact": {}, "wildcard": {}}
+        self.size = 0
+        # ListCertificates summary per ARN, filled by build_certificate_index
+        self.summaries = {}
+
+    @staticmethod
+    def _labels(name):
+        return name.lower().rstrip(".").split(".")[::-1]
+
+    def insert(self, name, certificate_arn, not_after=None, primary=False):
+        """Index a certificate under one of its names."""
+        labels = self._labels(name)
+        wildcard = labels[-1] == "*"
+        if wildcard:
+            labels = labels[:-1]
+
+        node = self._root
+        for label in labels:
+            node = node["children"].setdefault(label, {"children": {}, "exact": {}, "wildcard": {}})
+
+        bucket = node["wildcard"] if wildcard else node["exact"]
+        if certificate_arn not in bucket:
+            self.size += 1
+        rank = self.WILDCARD if wildcard else (self.PRIMARY if primary else self.SAN)
+        best = bucket.get(certificate_arn)
+        if best is None or rank < best[1]:
+            bucket[certificate_arn] = (not_after, rank)
+
+    def match(self, host):
+        """Return ARNs of certificates covering a host, latest-expiring first."""
+        labels = self._labels(host)
+        wildcard_lookup = labels[-1] == "*"
+        if wildcard_lookup:
+            labels = labels[:-1]
+
+        matches = {}
+        node = self._root
+        for position, label in enumerate(labels):
+            if position == len(labels) - 1 and not wildcard_lookup:
+                self._collect(matches, node["wildcard"], self.WILDCARD)
+            node = node["children"].get(label)
+            if node is None:
+                break
+        else:
+            if wildcard_lookup:
+                self._collect(matches, node["wildcard"], self.WILDCARD)
+            else:
+                self._collect(matches, node["exact"])
+
+        ordered = sorted(matches.items(), key=lambda item: (-_expiry_sort_key(item[1][0]), item[1][1]))
+        return [certificate_arn for certificate_arn, _ in ordered]
+
+    @staticmethod
+    def _collect(matches, bucket, rank=None):
+        for certificate_arn, (not_after, entry_rank) in bucket.items():
+            entry_rank = entry_rank if rank is None else rank
+            best = matches.get(certificate_arn)
+            if best is None or entry_rank < best[1]:
+                matches[certificate_arn] = (not_after, entry_rank)
+
+
+def _expiry_sort_key(not_after):
+    """Convert a NotAfter value into a comparable timestamp (missing sorts last)."""
+    if not_after is None:
+        return float("-inf")
+    if not_after.tzinfo is None:
+        not_after = not_after.replace(tzinfo=timezone.utc)
+    return not_after.timestamp()
+
+
+def build_certificate_index(certificates):
+    """Build a CertificateTrie from ACM certificate summaries, including SAN entries."""
+    certificate_index = CertificateTrie()
+
+    for cert in certificates:
+        certificate_index.summaries[cert["CertificateArn"]] = cert
+        not_after = cert.get("NotAfter")
+        certificate_index.insert(cert["DomainName"], cert["CertificateArn"], not_after, primary=True)
+        for name in cert.get("SubjectAlternativeNameSummaries", []):
+            certificate_index.insert(name, cert["CertificateArn"], not_after)
+
+    logger.debug("Built certificate index with %d name entries", certificate_index.size)
+    return certificate_index
@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from errors import THROTTLING_CODES
+
+logger = logging.getLogger()
+
+# Tuned defaults for every client: fail fast on connect, retry throttling with
+# the standard backoff, and keep enough pooled connections for thread pools.
+DEFAULT_CONFIG = Config(
+    connect_timeout=int(os.environ.get("AWS_CONNECT_TIMEOUT", "5")),
+    read_timeout=int(os.environ.get("AWS_READ_TIMEOUT", "30")),
+    retries={"max_attempts": int(os.environ.get("AWS_MAX_ATTEMPTS", "5")), "mode": "standard"},
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "16")),
+)
+
+# S3 answers a lost conditional-write race with one of these
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None, config=None, name=None):
+    """Return the shared client for a service/region, creating it on first use.
+
+    Clients are cached at module level so warm invocations reuse them and
+    their connection pools. name keeps a differently configured client for
+    the same service apart from the default one.
+    """
+    key = (service_name, region_name, name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            started = time.perf_counter()
+            client = boto3.client(
+                service_name,
+                region_name=region_name,
+                config=DEFAULT_CONFIG.merge(config) if config else DEFAULT_CONFIG,
+            )
+            _clients[key] = client
+            logger.info(
+                "Created %s client (region: %s) in %.1f ms",
+                service_name,
+                region_name or "default",
+                (time.perf_counter() - started) * 1000,
+            )
+    return client
+
+
+def clear_clients():
+    """Drop every cached client."""
+    with _clients_lock:
+        _clients.clear()
+
+
+class LazyClient:
+    """Module-level stand-in for a boto3 client that is only built when first used."""
+
+    def __init__(self, service_name, region_name=None, config=None, name=None):
+        self._service_name = service_name
+        self._region_name = region_name
+        self._config = config
+        self._name = name
+
+    def __getattr__(self, name):
+        # Introspection (mock.patch, copy, pickle) must not build a client
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(get_client(self._service_name, self._region_name, self._config, self._name), name)
+
+    def __repr__(self):
+        return f"LazyClient({self._service_name!r}, region_name={self._region_name!r})"
+
+
+def lazy_client(service_name, region_name=None, config=None, name=None):
+    """Return a LazyClient for a service."""
+    return LazyClient(service_name, region_name, config, name)
+
+
+def is_missing_object(error):
+    """Check whether an S3 error means the object does not exist."""
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404")
+
+
+def is_write_conflict(error):
+    """Check whether an S3 error means a conditional write lost a race."""
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in CONFLICT_CODES
+
+
+def is_throttling_error(error):
+    """Check whether an AWS error means the request was throttled."""
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_CODES
+
+
+def log_import_time(import_started):
+    """Log how long the calling Lambda module took to import."""
+    logger.info("Module import completed in %.1f ms", (time.perf_counter() - import_started) * 1000)
@@ -0,0 +1,168 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aws_clients import is_missing_object
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from errors import CertificateValidationError
+
+logger = logging.getLogger()
+
+# Bumped when the bundle layout changes incompatibly
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_FILE = "bundle.json"
+# Three-object layout written before bundles, still readable
+LEGACY_FILES = {"certificate": "cert.pem", "private_key": "privkey.pem", "chain": "chain.pem"}
+# ACM KeyAlgorithm for each key_type_of name
+ACM_KEY_ALGORITHMS = {
+    "rsa-1024": "RSA_1024", "rsa-2048": "RSA_2048", "rsa-3072": "RSA_3072", "rsa-4096": "RSA_4096",
+    "ec-p256": "EC_prime256v1", "ec-p384": "EC_secp384r1", "ec-p521": "EC_secp521r1"
+}
+
+
+class BundleFormatError(CertificateValidationError):
+    """A stored bundle uses a format version this code cannot read."""
+
+
+def bundle_key(name):
+    """S3 key of the bundle for a domain or SAN group."""
+    return f"certificates/{name}/{BUNDLE_FILE}"
+
+
+def certificate_metadata(certificate):
+    """Parse expiry, SANs, fingerprint and key type from a PEM certificate."""
+    try:
+        cert_obj = x509.load_pem_x509_certificate(certificate.encode())
+    except ValueError as e:
+        raise CertificateValidationError(f"Certificate could not be parsed: {e}") from e
+    try:
+        sans = cert_obj.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        sans = []
+
+    return {
+        "expiration_date": cert_obj.not_valid_after_utc.replace(tzinfo=None).isoformat(),
+        "not_before": cert_obj.not_valid_before_utc.replace(tzinfo=None).isoformat(),
+        "subject_alternative_names": sans,
+        "fingerprint_sha256": cert_obj.fingerprint(hashes.SHA256()).hex(),
+        "serial_number": format(cert_obj.serial_number, "x"),
+        "key_type": key_type_of(cert_obj.public_key())
+    }
+
+
+def key_type_of(public_key):
+    """Key type name (ec-p256, rsa-2048, ...) for a public key."""
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return f"ec-p{public_key.curve.key_size}"
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return f"rsa-{public_key.key_size}"
+    return type(public_key).__name__
+
+
+def write_bundle(s3, bucket_name, name, certificate, private_key, chain, transaction_id, expiration_date=None):
+    """Write the certificate, key, chain and parsed metadata as one KMS-encrypted object.
+
+    A single PUT makes the hand-off to replace-certs atomic. Returns the S3
+    VersionId, which is None when bucket versioning is off.
+    """
+    metadata = certificate_metadata(certificate)
+    if expiration_date:
+        metadata["expiration_date"] = expiration_date
+    metadata.update(transaction_id=transaction_id, generated_at=datetime.utcnow().isoformat())
+
+    bundle = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "name": name,
+        "certificate": certificate,
+        "private_key": private_key,
+        "chain": chain,
+        "metadata": metadata
+    }
+
+    response = s3.put_object(
+        Bucket=bucket_name,
+        Key=bundle_key(name),
+        Body=json.dumps(bundle),
+        ContentType="application/json",
+        ServerSideEncryption="aws:kms",
+        # Object metadata mirrors the legacy files so HEAD requests still see it
+        Metadata={
+            "domain": name,
+            "expiration-date": metadata["expiration_date"],
+            "transaction-id": transaction_id,
+            "generated-at": metadata["generated_at"],
+            "bundle-format": str(BUNDLE_FORMAT_VERSION)
+        }
+    )
+    logger.info("Certificate bundle uploaded to S3: %s", bundle_key(name))
+    return response.get("VersionId")
+
+
+def head_bundle(s3, bucket_name, name):
+    """Return a bundle's transaction_id, expiration_date and version_id from one HEAD, or None if it does not exist."""
+    try:
+        response = s3.head_object(Bucket=bucket_name, Key=bundle_key(name))
+    except Exception as e:
+        if not is_missing_object(e):
+            raise
+        return None
+
+    metadata = response.get("Metadata", {})
+    return {
+        "transaction_id": metadata.get("transaction-id"),
+        "expiration_date": metadata.get("expiration-date"),
+        "version_id": response.get("VersionId")
+    }
+
+
+def read_bundle(s3, bucket_name, name, version_id=None, legacy_version_ids=None):
+    """Read a certificate bundle, falling back to the legacy three-file layout.
+
+    legacy_version_ids optionally pins each legacy file ({filename: VersionId}).
+    Returns a dict with certificate, private_key, chain and metadata.
+    """
+    request = {"Bucket": bucket_name, "Key": bundle_key(name)}
+    if version_id:
+        request["VersionId"] = version_id
+
+    try:
+        response = s3.get_object(**request)
+    except Exception as e:
+        if not is_missing_object(e):
+            raise
+        logger.info("No certificate bundle for %s - reading legacy certificate files", name)
+        return read_legacy_files(s3, bucket_name, name, legacy_version_ids)
+
+    bundle = json.loads(response["Body"].read())
+    if bundle.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise BundleFormatError(f"Unsupported certificate bundle format {bundle.get('format_version')!r} for {name}")
+
+    logger.debug("Certificate bundle read from S3: %s", bundle_key(name))
+    return {field: bundle[field] for field in ("certificate", "private_key", "chain", "metadata")}
+
+
+def read_legacy_files(s3, bucket_name, name, version_ids=None):
+    """Read cert.pem, privkey.pem and chain.pem written before bundles existed.
+
+    The three GETs run concurrently over the client's shared connection pool,
+    so the read takes as long as the slowest object rather than the sum.
+    """
+    version_ids = version_ids or {}
+
+    def fetch(filename):
+        request = {"Bucket": bucket_name, "Key": f"certificates/{name}/{filename}"}
+        if version_ids.get(filename):
+            request["VersionId"] = version_ids[filename]
+        response = s3.get_object(**request)
+        return response["Body"].read().decode("utf-8"), response.get("Metadata", {})
+
+    with ThreadPoolExecutor(max_workers=len(LEGACY_FILES), thread_name_prefix="s3-get") as executor:
+        futures = {field: executor.submit(fetch, filename) for field, filename in LEGACY_FILES.items()}
+        results = {field: future.result() for field, future in futures.items()}
+
+    contents = {field: body for field, (body, _) in results.items()}
+    contents["metadata"] = {"expiration_date": results["certificate"][1].get("expiration-date", "")}
+    return contents
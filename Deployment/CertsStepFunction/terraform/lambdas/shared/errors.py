@@ -0,0 +1,58 @@
+import socket
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+# Step Functions matches Retry and Catch rules on the raised exception's class
+# name, so these names are part of the state machine definition.
+
+# Error codes AWS uses to throttle a caller
+THROTTLING_CODES = ("ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded")
+# Error codes worth retrying: throttling and AWS-side failures
+TRANSIENT_CODES = THROTTLING_CODES + (
+    "RequestTimeout", "RequestTimeoutException", "ServiceUnavailable", "InternalError",
+    "InternalFailure", "SlowDown"
+)
+
+
+class CertificateWorkflowError(Exception):
+    """Base class for errors the certificate Lambdas raise to the state machine."""
+
+
+class RetryableError(CertificateWorkflowError):
+    """A transient failure - throttling, timeouts, AWS or ACME server errors. Safe to retry."""
+
+
+class MissingInputError(CertificateWorkflowError, ValueError):
+    """Required configuration, event input or stored artifact is missing."""
+
+
+class CertificateValidationError(CertificateWorkflowError, ValueError):
+    """A certificate, key or bundle could not be parsed or is unusable."""
+
+
+class AcmeRejectedError(CertificateWorkflowError):
+    """The ACME server or certbot rejected the order."""
+
+
+def is_transient(error):
+    """Whether an exception is a throttle, timeout or server-side failure worth retrying."""
+    if isinstance(error, RetryableError):
+        return True
+    if isinstance(error, CertificateWorkflowError):
+        return False
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return code in TRANSIENT_CODES or status >= 500
+    return isinstance(error, (ConnectionError, HTTPClientError, socket.timeout, TimeoutError))
+
+
+def classify_error(error):
+    """Return the exception a handler should raise to the state machine for error.
+
+    Transient errors become RetryableError; typed errors and anything else
+    are returned unchanged and are not retried.
+    """
+    if isinstance(error, CertificateWorkflowError) or not is_transient(error):
+        return error
+    return RetryableError(f"{type(error).__name__}: {error}")
@@ -0,0 +1,171 @@
+import logging
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from aws_clients import is_missing_object, is_write_conflict
+
+logger = logging.getLogger()
+
+# Only rewritten on replacement, so the bucket lifecycle keeps inventory/ out of Glacier
+INDEX_KEY = "inventory/index.sqlite"
+COLUMNS = (
+    "certificate_arn", "domain", "status", "expiration_date", "import_date",
+    "deletion_date", "transaction_id", "replaced_by", "updated_at"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS certificates (
+    certificate_arn TEXT NOT NULL,
+    domain TEXT NOT NULL,
+    status TEXT NOT NULL,
+    expiration_date TEXT,
+    import_date TEXT,
+    deletion_date TEXT,
+    transaction_id TEXT,
+    replaced_by TEXT,
+    updated_at TEXT NOT NULL,
+    -- A SAN certificate has one record per domain it covers
+    PRIMARY KEY (certificate_arn, domain)
+);
+CREATE INDEX IF NOT EXISTS certificates_domain ON certificates (domain);
+CREATE INDEX IF NOT EXISTS certificates_status_expiry ON certificates (status, expiration_date);
+CREATE INDEX IF NOT EXISTS certificates_expiry ON certificates (expiration_date);
+"""
+
+
+class InventoryConflictError(Exception):
+    """The index kept changing underneath us and could not be updated."""
+
+
+class InventoryIndex:
+    """Certificate inventory as a single SQLite database object in S3.
+
+    The whole database is loaded into memory with one GET, queried locally
+    through indexed columns, and written back with one PUT conditional on the
+    ETag it was loaded from.
+    """
+
+    def __init__(self, connection, etag=None):
+        self.connection = connection
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        self.etag = etag
+
+    @classmethod
+    def empty(cls):
+        return cls(sqlite3.connect(":memory:", check_same_thread=False))
+
+    @classmethod
+    def load(cls, s3, bucket_name, key=INDEX_KEY):
+        """Load the index from S3, or start an empty one if none exists yet."""
+        try:
+            response = s3.get_object(Bucket=bucket_name, Key=key)
+        except Exception as e:
+            if not is_missing_object(e):
+                raise
+            logger.info("No inventory index at %s - starting a new one", key)
+            return cls.empty()
+
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        connection.deserialize(response["Body"].read())
+        return cls(connection, response.get("ETag"))
+
+    def save(self, s3, bucket_name, key=INDEX_KEY):
+        """Write the index back, only if nobody else has written it since it was loaded."""
+        condition = {"IfMatch": self.etag} if self.etag else {"IfNoneMatch": "*"}
+        # serialize() only sees committed pages
+        self.connection.commit()
+        response = s3.put_object(
+            Bucket=bucket_name,
+            Key=key,
+            Body=self.connection.serialize(),
+            ContentType="application/vnd.sqlite3",
+            ServerSideEncryption="aws:kms",
+            **condition
+        )
+        self.etag = response.get("ETag")
+        return self.etag
+
+    def upsert(self, record):
+        """Insert or replace one certificate record keyed on its ARN and domain."""
+        row = {column: record.get(column) for column in COLUMNS}
+        row["updated_at"] = row["updated_at"] or datetime.utcnow().isoformat()
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO certificates ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join(':' + column for column in COLUMNS)})",
+            row
+        )
+
+    def for_certificate(self, certificate_arn):
+        """Return the records for an ARN, one per domain it covers."""
+        rows = self.connection.execute(
+            "SELECT * FROM certificates WHERE certificate_arn = ? ORDER BY domain", (certificate_arn,)
+        )
+        return [dict(row) for row in rows]
+
+    def query(self, domain=None, status=None, expires_after=None, expires_before=None, limit=None):
+        """Return records matching every given filter, soonest expiry first.
+
+        Expiry bounds are ISO 8601 strings or datetimes; expires_after is
+        inclusive and expires_before exclusive.
+        """
+        clauses = []
+        params = []
+        for clause, value in (
+            ("domain = ?", domain),
+            ("status = ?", status),
+            ("expiration_date >= ?", _iso(expires_after)),
+            ("expiration_date < ?", _iso(expires_before)),
+        ):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+
+        sql = "SELECT * FROM certificates"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY expiration_date, domain"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self.connection.execute(sql, params)]
+
+    def expiring_within(self, days, now=None, status="active"):
+        """Certificates with the given status that expire in the next days days."""
+        now = now or datetime.utcnow()
+        return self.query(status=status, expires_after=now, expires_before=now + timedelta(days=days))
+
+    def count(self):
+        """Number of records in the index."""
+        return self.connection.execute("SELECT COUNT(*) FROM certificates").fetchone()[0]
+
+
+def update_index(s3, bucket_name, records, key=INDEX_KEY, attempts=5, backoff=0.2):
+    """Apply records to the index with optimistic concurrency.
+
+    Each attempt loads the current index, upserts the records and writes it
+    back conditionally; a lost race reloads and retries with jittered backoff.
+    """
+    for attempt in range(1, attempts + 1):
+        index = InventoryIndex.load(s3, bucket_name, key)
+        for record in records:
+            index.upsert(record)
+        try:
+            index.save(s3, bucket_name, key)
+            logger.info("Inventory index updated with %d records (%d total)", len(records), index.count())
+            return index
+        except Exception as e:
+            if not is_write_conflict(e):
+                raise
+            logger.warning("Inventory index changed during update (attempt %d/%d)", attempt, attempts)
+            time.sleep(random.uniform(0, backoff * attempt))
+
+    raise InventoryConflictError(f"Inventory index {key} could not be updated after {attempts} attempts")
+
+
+def _iso(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
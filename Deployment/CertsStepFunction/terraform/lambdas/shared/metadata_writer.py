@@ -0,0 +1,49 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+
+class MetadataWriter:
+    """Runs S3 metadata PUTs on a small thread pool so they overlap with ACM work.
+
+    Handlers submit writes as soon as their inputs are known and call drain()
+    before returning. The pool is created on first use and reused across warm
+    invocations. With max_workers of zero, writes run inline on submit.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = []
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a write; failures are collected by drain()."""
+        name = getattr(func, "__name__", repr(func))
+
+        if self.max_workers <= 0:
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self._pending.append((name, None, e))
+            return
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="metadata-writer")
+        self._pending.append((name, self._executor.submit(func, *args, **kwargs), None))
+        logger.debug("Queued metadata write: %s", name)
+
+    def drain(self):
+        """Wait for every queued write and return a list of failures."""
+        pending, self._pending = self._pending, []
+        errors = []
+
+        for name, future, error in pending:
+            if future is not None:
+                error = future.exception()
+            if error is not None:
+                logger.error("Metadata write %s failed: %s", name, str(error))
+                errors.append({"operation": name, "error": str(error)})
+
+        logger.debug("Drained %d metadata writes (%d failed)", len(pending), len(errors))
+        return errors
@@ -0,0 +1,153 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of blocking.
+
+    reserve() always takes a token and returns how long the caller must wait
+    before using it. The balance may go negative, so successive reservations
+    line up one refill interval apart and callers can report when a queued
+    request is expected to start. Timestamps are wall-clock seconds so the
+    state can be persisted and reloaded by another invocation.
+    """
+
+    def __init__(self, capacity, refill_per_second, tokens=None, updated=None, clock=time.time):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = clock() if updated is None else updated
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_window(cls, limit, window_seconds, clock=time.time):
+        """Bucket allowing limit requests per window_seconds."""
+        return cls(limit, limit / window_seconds, clock=clock)
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+            self.updated = now
+
+    def reserve(self, count=1, now=None):
+        """Take count tokens and return the seconds to wait before they are available."""
+        with self._lock:
+            now = self.clock() if now is None else now
+            self._refill(now)
+            self.tokens -= count
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.refill_per_second
+
+    def set_rate(self, refill_per_second, now=None):
+        """Change the refill rate; tokens accrued so far are kept at the old rate."""
+        with self._lock:
+            self._refill(self.clock() if now is None else now)
+            self.refill_per_second = refill_per_second
+
+    def drain(self):
+        """Drop any banked tokens so the next request waits a full interval."""
+        with self._lock:
+            self.tokens = min(self.tokens, 0)
+
+    def release(self, count=1):
+        """Return tokens from a reservation that will not be used."""
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + count)
+
+    def to_dict(self):
+        return {"tokens": self.tokens, "updated": self.updated}
+
+    def load(self, state):
+        """Restore tokens saved by to_dict()."""
+        with self._lock:
+            self.tokens = min(self.capacity, state["tokens"])
+            self.updated = state["updated"]
+
+
+class KeyedTokenBuckets:
+    """One TokenBucket per key, created on first use with the same limits."""
+
+    def __init__(self, limit, window_seconds, clock=time.time):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, key):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket.per_window(self.limit, self.window_seconds, clock=self.clock)
+                self._buckets[key] = bucket
+            return bucket
+
+    def to_dict(self):
+        with self._lock:
+            return {key: bucket.to_dict() for key, bucket in self._buckets.items()}
+
+    def load(self, state):
+        """Restore buckets saved by to_dict()."""
+        for key, bucket_state in state.items():
+            self.bucket(key).load(bucket_state)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate adapts to throttling (AIMD).
+
+    Every throttled call halves the rate and drops banked tokens; every
+    success adds a small fixed step back, up to max_rate. Callers sharing
+    one limiter therefore converge on the highest rate the API accepts
+    instead of bursting into throttles and backing off again.
+    """
+
+    def __init__(self, max_rate, min_rate=0.05, increase=0.05, decrease_factor=0.5, burst=1,
+                 is_throttle=None, max_attempts=8, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        # Requests/second regained per success; small steps keep throttles rare near the limit
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.is_throttle = is_throttle or (lambda error: False)
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+        self.bucket = TokenBucket(burst, max_rate, clock=clock)
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.bucket.refill_per_second
+
+    def acquire(self):
+        """Block until the next request may be sent."""
+        delay = self.bucket.reserve()
+        if delay > 0:
+            self.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.bucket.set_rate(min(self.max_rate, self.rate + self.increase))
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttles += 1
+            self.bucket.set_rate(max(self.min_rate, self.rate * self.decrease_factor))
+            self.bucket.drain()
+
+    def call(self, func, *args, **kwargs):
+        """Call func within the rate, retrying throttled attempts at the reduced rate."""
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_throttle(e) or attempt == self.max_attempts:
+                    raise
+                self.on_throttle()
+                continue
+            self.on_success()
+            return result
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from acm_certificates import ACM_KEY_TYPES, build_certificate_index, list_acm_certificates
+
+
+class TestListAcmCertificates:
+    """Test suite for listing ACM certificates."""
+
+    def test_every_key_type_and_page_is_listed(self):
+        """Test EC and larger RSA certificates are requested and every page is collected."""
+        client = Mock()
+        client.get_paginator.return_value.paginate.return_value = [
+            {"CertificateSummaryList": [{"CertificateArn": "arn:1"}]},
+            {"CertificateSummaryList": [{"CertificateArn": "arn:2"}]},
+        ]
+
+        certificates = list_acm_certificates(client)
+
+        assert [cert["CertificateArn"] for cert in certificates] == ["arn:1", "arn:2"]
+        client.get_paginator.return_value.paginate.assert_called_once_with(Includes={"keyTypes": ACM_KEY_TYPES})
+        assert {"EC_prime256v1", "EC_secp384r1", "RSA_4096"} <= set(ACM_KEY_TYPES)
+
+
+class TestBuildCertificateIndex:
+    """Test suite for matching hosts against certificate names."""
+
+    def test_wildcard_and_san_coverage(self):
+        """Test a host is covered by SANs and one-label wildcards, latest-expiring first."""
+        now = datetime(2030, 1, 1)
+        certificate_index = build_certificate_index([
+            {"CertificateArn": "arn:exact", "DomainName": "www.example.com", "NotAfter": now},
+            {"CertificateArn": "arn:wildcard", "DomainName": "example.com",
+             "SubjectAlternativeNameSummaries": ["*.example.com"], "NotAfter": now + timedelta(days=60)},
+        ])
+
+        assert certificate_index.match("www.example.com") == ["arn:wildcard", "arn:exact"]
+        assert certificate_index.match("a.b.example.com") == []
@@ -0,0 +1,99 @@
+from unittest.mock import patch
+
+import pytest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    """Start every test with no cached clients."""
+    aws_clients.clear_clients()
+    yield
+    aws_clients.clear_clients()
+
+
+class TestGetClient:
+    """Test suite for the shared client registry."""
+
+    def test_client_created_once(self):
+        """Test a service client is created on first use and then reused."""
+        with patch("aws_clients.boto3.client") as mock_client:
+            first = aws_clients.get_client("acm")
+            second = aws_clients.get_client("acm")
+
+        assert first is second
+        mock_client.assert_called_once()
+        assert mock_client.call_args[1]["config"] is aws_clients.DEFAULT_CONFIG
+
+    def test_clients_are_per_region(self):
+        """Test each region gets its own client."""
+        with patch("aws_clients.boto3.client", side_effect=lambda *args, **kwargs: object()) as mock_client:
+            east = aws_clients.get_client("acm", region_name="us-east-1")
+            west = aws_clients.get_client("acm", region_name="eu-west-1")
+
+        assert east is not west
+        assert mock_client.call_count == 2
+
+    def test_named_clients_are_separate(self):
+        """Test a named client for the same service does not share the default client."""
+        with patch("aws_clients.boto3.client", side_effect=lambda *args, **kwargs: object()):
+            default = aws_clients.get_client("acm")
+            batch = aws_clients.get_client("acm", name="batch")
+
+        assert default is not batch
+        assert aws_clients.get_client("acm", name="batch") is batch
+
+    def test_config_merged_with_defaults(self):
+        """Test a caller's config overrides the tuned defaults."""
+        with patch("aws_clients.boto3.client") as mock_client:
+            aws_clients.get_client("s3", config=Config(max_pool_connections=50))
+
+        config = mock_client.call_args[1]["config"]
+        assert config.max_pool_connections == 50
+        assert config.connect_timeout == aws_clients.DEFAULT_CONFIG.connect_timeout
+
+
+class TestLazyClient:
+    """Test suite for LazyClient."""
+
+    def test_no_client_until_first_use(self):
+        """Test creating a LazyClient does not build a boto3 client."""
+        with patch("aws_clients.boto3.client") as mock_client:
+            client = aws_clients.lazy_client("sns")
+            mock_client.assert_not_called()
+
+            client.publish(TopicArn="arn", Message="hello")
+
+        mock_client.assert_called_once()
+        mock_client.return_value.publish.assert_called_once_with(TopicArn="arn", Message="hello")
+
+    def test_introspection_does_not_create_client(self):
+        """Test dunder lookups such as those made by mock.patch stay lazy."""
+        with patch("aws_clients.boto3.client") as mock_client:
+            client = aws_clients.lazy_client("sns")
+            assert not hasattr(client, "__code__")
+
+        mock_client.assert_not_called()
+
+
+class TestIsMissingObject:
+    """Test suite for recognising missing S3 objects."""
+
+    @pytest.mark.parametrize("code,expected", [("NoSuchKey", True), ("404", True), ("AccessDenied", False)])
+    def test_error_codes(self, code, expected):
+        """Test GET and HEAD not-found codes are missing objects and other errors are not."""
+        error = ClientError({"Error": {"Code": code, "Message": code}}, "GetObject")
+
+        assert aws_clients.is_missing_object(error) is expected
+        assert aws_clients.is_missing_object(ValueError(code)) is False
+
+    def test_throttling_codes(self):
+        """Test throttling errors are recognised and other errors are not."""
+        throttled = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "ImportCertificate")
+        denied = ClientError({"Error": {"Code": "AccessDeniedException", "Message": "Denied"}}, "ImportCertificate")
+
+        assert aws_clients.is_throttling_error(throttled) is True
+        assert aws_clients.is_throttling_error(denied) is False
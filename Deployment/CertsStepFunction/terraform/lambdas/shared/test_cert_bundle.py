@@ -0,0 +1,150 @@
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from cert_bundle import BundleFormatError, bundle_key, certificate_metadata, head_bundle, read_bundle, write_bundle
+
+
+def self_signed_certificate(names):
+    """Return a PEM self-signed P-256 certificate for names."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])])
+    now = datetime.now(timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=90))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(name) for name in names]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def body(content):
+    """Return a get_object response body."""
+    return Mock(read=Mock(return_value=content if isinstance(content, bytes) else content.encode()))
+
+
+class TestCertificateMetadata:
+    """Test suite for parsing bundle metadata."""
+
+    def test_metadata_fields(self):
+        """Test SANs, key type and fingerprint are parsed from the certificate."""
+        metadata = certificate_metadata(self_signed_certificate(["example.com", "www.example.com"]))
+
+        assert metadata["subject_alternative_names"] == ["example.com", "www.example.com"]
+        assert metadata["key_type"] == "ec-p256"
+        assert len(metadata["fingerprint_sha256"]) == 64
+        assert datetime.fromisoformat(metadata["expiration_date"]) > datetime.utcnow()
+
+
+class TestBundle:
+    """Test suite for writing and reading certificate bundles."""
+
+    def test_write_then_read_round_trip(self):
+        """Test one PUT writes everything a single GET reads back."""
+        certificate = self_signed_certificate(["example.com"])
+        s3 = Mock()
+        s3.put_object.return_value = {"VersionId": "v1"}
+
+        version_id = write_bundle(s3, "test-bucket", "example.com", certificate, "KEY", "CHAIN", "tx-1")
+
+        assert version_id == "v1"
+        call_args = s3.put_object.call_args[1]
+        assert call_args["Key"] == "certificates/example.com/bundle.json"
+        assert call_args["ServerSideEncryption"] == "aws:kms"
+        assert call_args["Metadata"]["transaction-id"] == "tx-1"
+
+        s3.get_object.return_value = {"Body": body(call_args["Body"])}
+        bundle = read_bundle(s3, "test-bucket", "example.com", version_id="v1")
+
+        s3.get_object.assert_called_once_with(Bucket="test-bucket", Key=bundle_key("example.com"), VersionId="v1")
+        assert (bundle["certificate"], bundle["private_key"], bundle["chain"]) == (certificate, "KEY", "CHAIN")
+        assert bundle["metadata"]["transaction_id"] == "tx-1"
+
+    def test_legacy_files_read_when_no_bundle(self):
+        """Test certificates stored as three files before bundles are still readable."""
+        legacy = {
+            "certificates/example.com/cert.pem": {"Body": body("CERT"), "Metadata": {"expiration-date": "2030-01-01"}},
+            "certificates/example.com/privkey.pem": {"Body": body("KEY")},
+            "certificates/example.com/chain.pem": {"Body": body("CHAIN")},
+        }
+
+        def get_object(Bucket, Key, **kwargs):
+            if Key not in legacy:
+                raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+            return legacy[Key]
+
+        s3 = Mock(get_object=Mock(side_effect=get_object))
+        bundle = read_bundle(s3, "test-bucket", "example.com")
+
+        assert (bundle["certificate"], bundle["private_key"], bundle["chain"]) == ("CERT", "KEY", "CHAIN")
+        assert bundle["metadata"]["expiration_date"] == "2030-01-01"
+
+    def test_legacy_files_fetched_concurrently_by_version(self):
+        """Test the three legacy GETs overlap and each one pins its own VersionId."""
+        all_started = threading.Barrier(3, timeout=5)
+        requests = []
+
+        def get_object(Bucket, Key, **kwargs):
+            if Key.endswith("bundle.json"):
+                raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+            requests.append((Key.rsplit("/", 1)[-1], kwargs.get("VersionId")))
+            # Only returns once all three GETs are in flight at the same time
+            all_started.wait()
+            return {"Body": body(Key.rsplit("/", 1)[-1]), "Metadata": {}}
+
+        s3 = Mock(get_object=Mock(side_effect=get_object))
+        version_ids = {"cert.pem": "c1", "privkey.pem": "k1", "chain.pem": "h1"}
+        bundle = read_bundle(s3, "test-bucket", "example.com", legacy_version_ids=version_ids)
+
+        assert (bundle["certificate"], bundle["private_key"], bundle["chain"]) == ("cert.pem", "privkey.pem", "chain.pem")
+        assert sorted(requests) == sorted(version_ids.items())
+
+    def test_unknown_format_version_rejected(self):
+        """Test a bundle from a newer format is not misread."""
+        s3 = Mock()
+        s3.get_object.return_value = {"Body": body(json.dumps({"format_version": 99}))}
+
+        with pytest.raises(BundleFormatError):
+            read_bundle(s3, "test-bucket", "example.com")
+
+    def test_other_errors_propagate(self):
+        """Test access errors are not mistaken for a missing bundle."""
+        s3 = Mock()
+        s3.get_object.side_effect = ClientError({"Error": {"Code": "AccessDenied", "Message": "Denied"}}, "GetObject")
+
+        with pytest.raises(ClientError):
+            read_bundle(s3, "test-bucket", "example.com")
+        assert s3.get_object.call_count == 1
+
+    def test_head_reads_transaction_and_expiry(self):
+        """Test one HEAD returns what a retried generation needs to reuse the bundle."""
+        certificate = self_signed_certificate(["example.com"])
+        s3 = Mock()
+        write_bundle(s3, "test-bucket", "example.com", certificate, "KEY", "CHAIN", "test-transaction", "2030-01-01T00:00:00")
+        s3.head_object.return_value = {"Metadata": s3.put_object.call_args[1]["Metadata"], "VersionId": "v1"}
+
+        assert head_bundle(s3, "test-bucket", "example.com") == {
+            "transaction_id": "test-transaction", "expiration_date": "2030-01-01T00:00:00", "version_id": "v1"
+        }
+        s3.head_object.assert_called_once_with(Bucket="test-bucket", Key=bundle_key("example.com"))
+
+    def test_head_of_missing_bundle_is_none(self):
+        """Test a bundle that was never written is reported as absent."""
+        s3 = Mock()
+        s3.head_object.side_effect = ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+
+        assert head_bundle(s3, "test-bucket", "example.com") is None
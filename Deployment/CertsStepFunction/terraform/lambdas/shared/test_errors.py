@@ -0,0 +1,47 @@
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError, ReadTimeoutError
+
+import errors
+
+
+def client_error(code, status=400):
+    """Return a ClientError with the given error code and HTTP status."""
+    return ClientError(
+        {"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "ImportCertificate"
+    )
+
+
+class TestClassifyError:
+    """Test suite for mapping exceptions to the state machine's error classes."""
+
+    @pytest.mark.parametrize("error", [
+        client_error("ThrottlingException"),
+        client_error("InternalFailure", 500),
+        client_error("SomethingNew", 503),
+        EndpointConnectionError(endpoint_url="https://acm.us-east-1.amazonaws.com"),
+        ReadTimeoutError(endpoint_url="https://acm.us-east-1.amazonaws.com"),
+        TimeoutError("timed out"),
+    ])
+    def test_transient_errors_become_retryable(self, error):
+        """Test throttling, server-side and connection failures are raised as RetryableError."""
+        classified = errors.classify_error(error)
+
+        assert isinstance(classified, errors.RetryableError)
+        assert type(error).__name__ in str(classified)
+
+    @pytest.mark.parametrize("error", [
+        client_error("AccessDeniedException"),
+        client_error("ValidationException"),
+        KeyError("domain"),
+        errors.MissingInputError("S3_BUCKET environment variable is required"),
+        errors.AcmeRejectedError("Order ended in status invalid"),
+    ])
+    def test_other_errors_are_unchanged(self, error):
+        """Test permanent and already typed errors are returned as they are."""
+        assert errors.classify_error(error) is error
+
+    def test_typed_errors_keep_their_bases(self):
+        """Test input and validation errors are still ValueErrors for existing callers."""
+        assert issubclass(errors.MissingInputError, ValueError)
+        assert issubclass(errors.CertificateValidationError, ValueError)
+        assert not errors.is_transient(errors.CertificateValidationError("bad PEM"))
@@ -0,0 +1,145 @@
+import sqlite3
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from inventory_index import INDEX_KEY, InventoryConflictError, InventoryIndex, update_index
+
+
+class ConditionalS3:
+    """Single-object S3 stand-in honouring IfMatch / IfNoneMatch."""
+
+    def __init__(self):
+        self.body = None
+        self.etag = None
+        self.puts = 0
+
+    def get_object(self, Bucket, Key):
+        if self.body is None:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        return {"Body": Mock(read=Mock(return_value=self.body)), "ETag": self.etag}
+
+    def put_object(self, Bucket, Key, Body, IfMatch=None, IfNoneMatch=None, **kwargs):
+        if (IfNoneMatch == "*" and self.body is not None) or (IfMatch and IfMatch != self.etag):
+            raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": "Precondition failed"}}, "PutObject")
+        self.puts += 1
+        self.body = bytes(Body)
+        self.etag = f'"etag-{self.puts}"'
+        return {"ETag": self.etag}
+
+
+def record(arn, domain, status="active", expires_in_days=30, now=datetime(2030, 1, 1)):
+    """Return an inventory record expiring expires_in_days after now."""
+    return {
+        "certificate_arn": arn,
+        "domain": domain,
+        "status": status,
+        "expiration_date": (now + timedelta(days=expires_in_days)).isoformat()
+    }
+
+
+class TestInventoryIndex:
+    """Test suite for querying the inventory index."""
+
+    @pytest.fixture
+    def index(self):
+        """Return an index holding a mix of active and deleted certificates."""
+        index = InventoryIndex.empty()
+        index.upsert(record("arn-1", "a.example.com", expires_in_days=10))
+        index.upsert(record("arn-2", "b.example.com", expires_in_days=45))
+        index.upsert(record("arn-3", "a.example.com", status="deleted", expires_in_days=5))
+        index.upsert(record("arn-4", "c.example.com", expires_in_days=20))
+        index.upsert(record("arn-4", "d.example.com", expires_in_days=20))
+        return index
+
+    def test_expiring_within(self, index):
+        """Test only active certificates expiring inside the window are returned, soonest first."""
+        expiring = index.expiring_within(30, now=datetime(2030, 1, 1))
+
+        assert [(row["certificate_arn"], row["domain"]) for row in expiring] == [
+            ("arn-1", "a.example.com"), ("arn-4", "c.example.com"), ("arn-4", "d.example.com")
+        ]
+
+    def test_query_by_domain_and_status(self, index):
+        """Test domain and status filters combine."""
+        assert [row["certificate_arn"] for row in index.query(domain="a.example.com")] == ["arn-3", "arn-1"]
+        assert [row["certificate_arn"] for row in index.query(domain="a.example.com", status="active")] == ["arn-1"]
+
+    def test_upsert_replaces_record(self, index):
+        """Test re-recording a certificate for a domain updates it in place."""
+        index.upsert({**record("arn-1", "a.example.com"), "status": "deleted"})
+
+        assert index.count() == 5
+        assert index.for_certificate("arn-1")[0]["status"] == "deleted"
+
+    def test_expiry_queries_use_an_index(self, index):
+        """Test status and expiry lookups are index searches, not table scans."""
+        plan = index.connection.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM certificates WHERE status = ? AND expiration_date < ?",
+            ("active", "2030-02-01")
+        ).fetchall()
+
+        assert any("certificates_status_expiry" in str(tuple(row)) for row in plan)
+
+
+class TestUpdateIndex:
+    """Test suite for conditional writes of the index to S3."""
+
+    def test_create_then_update_round_trip(self):
+        """Test the first write creates the object and later writes build on it."""
+        s3 = ConditionalS3()
+
+        update_index(s3, "test-bucket", [record("arn-1", "a.example.com")])
+        update_index(s3, "test-bucket", [record("arn-2", "b.example.com")])
+
+        loaded = InventoryIndex.load(s3, "test-bucket")
+        assert loaded.count() == 2
+        assert loaded.etag == '"etag-2"'
+
+    def test_lost_race_reloads_and_retries(self):
+        """Test a write that lost to a concurrent writer is retried on top of that writer's changes."""
+        s3 = ConditionalS3()
+        update_index(s3, "test-bucket", [record("arn-1", "a.example.com")])
+        original_get = s3.get_object
+        raced = []
+
+        def get_object(Bucket, Key):
+            response = original_get(Bucket, Key)
+            if not raced:
+                # Another invocation writes between our load and our save
+                raced.append(True)
+                other = InventoryIndex.load(Mock(get_object=Mock(return_value=original_get(Bucket, Key))), Bucket)
+                other.upsert(record("arn-9", "z.example.com"))
+                other.save(s3, Bucket)
+            return response
+
+        s3.get_object = get_object
+        update_index(s3, "test-bucket", [record("arn-2", "b.example.com")], backoff=0)
+
+        assert sorted(row["certificate_arn"] for row in InventoryIndex.load(s3, "test-bucket").query()) == [
+            "arn-1", "arn-2", "arn-9"
+        ]
+
+    def test_gives_up_after_attempts(self):
+        """Test persistent conflicts surface as InventoryConflictError."""
+        s3 = Mock()
+        s3.get_object.side_effect = ClientError({"Error": {"Code": "NoSuchKey", "Message": "Not found"}}, "GetObject")
+        s3.put_object.side_effect = ClientError({"Error": {"Code": "PreconditionFailed", "Message": "x"}}, "PutObject")
+
+        with pytest.raises(InventoryConflictError):
+            update_index(s3, "test-bucket", [record("arn-1", "a.example.com")], attempts=2, backoff=0)
+        assert s3.put_object.call_count == 2
+        assert s3.put_object.call_args[1]["Key"] == INDEX_KEY
+        assert s3.put_object.call_args[1]["IfNoneMatch"] == "*"
+
+    def test_stored_object_is_sqlite(self):
+        """Test the object in S3 is a plain SQLite database."""
+        s3 = ConditionalS3()
+        update_index(s3, "test-bucket", [record("arn-1", "a.example.com")])
+
+        assert s3.body.startswith(b"SQLite format 3")
+        connection = sqlite3.connect(":memory:")
+        connection.deserialize(s3.body)
+        assert connection.execute("SELECT domain FROM certificates").fetchall() == [("a.example.com",)]
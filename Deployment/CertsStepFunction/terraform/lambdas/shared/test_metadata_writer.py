@@ -0,0 +1,59 @@
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from metadata_writer import MetadataWriter
+
+
+class TestMetadataWriter:
+    """Test suite for the background metadata writer."""
+
+    def test_writes_run_in_background(self):
+        """Test submitted writes run on pool threads and are drained."""
+        release = threading.Event()
+        calls = []
+
+        def write(name):
+            release.wait(timeout=5)
+            calls.append((name, threading.current_thread().name))
+
+        writer = MetadataWriter(max_workers=2)
+        writer.submit(write, "first")
+        writer.submit(write, "second")
+
+        assert calls == []
+        release.set()
+        errors = writer.drain()
+
+        assert errors == []
+        assert sorted(name for name, _ in calls) == ["first", "second"]
+        assert all(thread.startswith("metadata-writer") for _, thread in calls)
+
+    def test_drain_reports_failures(self):
+        """Test failed writes are reported instead of raised."""
+        def store_summary():
+            raise RuntimeError("Access Denied")
+
+        writer = MetadataWriter(max_workers=2)
+        writer.submit(store_summary)
+        writer.submit(Mock())
+
+        assert writer.drain() == [{"operation": "store_summary", "error": "Access Denied"}]
+        assert writer.drain() == []
+
+    def test_inline_mode(self):
+        """Test max_workers of zero runs writes on submit."""
+        write = Mock(side_effect=[None, ValueError("bad")])
+        writer = MetadataWriter(max_workers=0)
+
+        writer.submit(write, 1)
+        write.assert_called_once_with(1)
+        writer.submit(write, 2)
+
+        assert writer.drain() == [{"operation": repr(write), "error": "bad"}]
+
+    @pytest.mark.parametrize("max_workers", [0, 3])
+    def test_drain_without_writes(self, max_workers):
+        """Test draining an idle writer returns no errors."""
+        assert MetadataWriter(max_workers=max_workers).drain() == []
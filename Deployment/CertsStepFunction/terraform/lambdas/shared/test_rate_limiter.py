@@ -0,0 +1,147 @@
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, KeyedTokenBuckets, TokenBucket
+
+
+class FakeClock:
+    """Manually advanced clock."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    """Test suite for TokenBucket."""
+
+    def test_reservations_within_capacity_do_not_wait(self):
+        """Test a full bucket grants capacity reservations immediately."""
+        bucket = TokenBucket(capacity=3, refill_per_second=1, clock=FakeClock())
+
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    def test_reservations_beyond_capacity_queue_at_refill_rate(self):
+        """Test reservations past capacity are spaced one refill interval apart."""
+        bucket = TokenBucket.per_window(limit=2, window_seconds=20, clock=FakeClock())
+        bucket.reserve()
+        bucket.reserve()
+
+        assert bucket.reserve() == pytest.approx(10.0)
+        assert bucket.reserve() == pytest.approx(20.0)
+
+    def test_tokens_refill_over_time(self):
+        """Test elapsed time refills the bucket up to capacity."""
+        clock = FakeClock()
+        bucket = TokenBucket(capacity=2, refill_per_second=0.5, clock=clock)
+        bucket.reserve(2)
+
+        clock.now += 2
+        assert bucket.reserve() == 0.0
+        clock.now += 100
+        bucket.reserve()
+        assert bucket.tokens == pytest.approx(1.0)
+
+    def test_release_returns_tokens(self):
+        """Test releasing an unused reservation restores the balance."""
+        bucket = TokenBucket(capacity=1, refill_per_second=1, clock=FakeClock())
+        bucket.reserve()
+        bucket.reserve()
+        bucket.release()
+
+        assert bucket.tokens == pytest.approx(0.0)
+
+
+class TestKeyedTokenBuckets:
+    """Test suite for KeyedTokenBuckets."""
+
+    def test_buckets_are_independent_and_persist(self):
+        """Test each key has its own bucket and state round-trips."""
+        clock = FakeClock()
+        buckets = KeyedTokenBuckets(limit=1, window_seconds=60, clock=clock)
+        buckets.bucket("example.com").reserve()
+
+        assert buckets.bucket("example.org").reserve() == 0.0
+
+        restored = KeyedTokenBuckets(limit=1, window_seconds=60, clock=clock)
+        restored.load(buckets.to_dict())
+        assert restored.bucket("example.com").reserve() == pytest.approx(60.0)
+
+
+class Throttled(Exception):
+    """Stand-in for a throttling error."""
+
+
+class TestAdaptiveRateLimiter:
+    """Test suite for AdaptiveRateLimiter."""
+
+    def make_limiter(self, clock, **kwargs):
+        """Return a limiter whose sleeps advance the fake clock."""
+        def sleep(seconds):
+            clock.now += seconds
+
+        return AdaptiveRateLimiter(is_throttle=lambda e: isinstance(e, Throttled), clock=clock, sleep=sleep, **kwargs)
+
+    def test_throttle_halves_rate_and_retries(self):
+        """Test a throttled call is retried after the rate is cut."""
+        limiter = self.make_limiter(FakeClock(), max_rate=4)
+        responses = iter([Throttled(), "ok"])
+
+        def call():
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        assert limiter.call(call) == "ok"
+        assert limiter.throttles == 1
+        assert limiter.rate == pytest.approx(2.0 + 0.05)
+
+    def test_other_errors_are_not_retried(self):
+        """Test non-throttling errors propagate on the first attempt."""
+        limiter = self.make_limiter(FakeClock(), max_rate=4)
+        calls = []
+
+        def call():
+            calls.append(1)
+            raise ValueError("bad certificate")
+
+        with pytest.raises(ValueError):
+            limiter.call(call)
+        assert len(calls) == 1
+
+    def test_gives_up_after_max_attempts(self):
+        """Test persistent throttling is eventually raised."""
+        limiter = self.make_limiter(FakeClock(), max_rate=4, max_attempts=3)
+
+        def call():
+            raise Throttled()
+
+        with pytest.raises(Throttled):
+            limiter.call(call)
+        assert limiter.throttles == 2
+
+    def test_converges_below_the_api_limit(self):
+        """Test the rate settles near what the API accepts without repeated throttling."""
+        clock = FakeClock()
+        limiter = self.make_limiter(clock, max_rate=10)
+        accepted = []
+
+        def api():
+            # The API accepts at most 2 requests per second
+            if accepted and clock.now - accepted[-1] < 0.5:
+                raise Throttled()
+            accepted.append(clock.now)
+
+        for _ in range(200):
+            limiter.call(api)
+
+        late_throttles = limiter.throttles
+        for _ in range(100):
+            limiter.call(api)
+
+        throughput = 100 / (accepted[-1] - accepted[-101])
+        assert 1.0 < throughput <= 2.0
+        # Steady state throttles rarely rather than on every burst
+        assert limiter.throttles - late_throttles < 15
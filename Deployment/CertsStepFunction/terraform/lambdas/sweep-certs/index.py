@@ -0,0 +1,132 @@
+import time
+
+# Taken before the remaining imports so cold-start import cost shows up in the logs
+import_started = time.perf_counter()
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from aws_clients import is_throttling_error, lazy_client, log_import_time
+from botocore.config import Config
+from errors import MissingInputError
+from inventory_index import InventoryIndex, update_index
+from rate_limiter import AdaptiveRateLimiter
+
+# Initialize AWS clients and environment variables
+s3 = lazy_client("s3")
+# Throttles are absorbed by the rate limiters below, so the client must not retry them as well
+acm = lazy_client("acm", config=Config(retries={"total_max_attempts": 1, "mode": "standard"}), name="sweeper")
+bucket_name = os.environ.get("S3_BUCKET")
+log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+sweep_batch_size = int(os.environ.get("SWEEP_BATCH_SIZE", "100"))
+sweep_concurrency = int(os.environ.get("SWEEP_CONCURRENCY", "4"))
+# Time a superseded certificate stays queued before deletion is attempted, so
+# attached resources can move to the new certificate first
+deletion_grace_hours = float(os.environ.get("DELETION_GRACE_HOURS", "1"))
+
+# ACM per-account request rates shared by every sweep in this container
+describe_limiter = AdaptiveRateLimiter(
+    float(os.environ.get("ACM_DESCRIBE_RATE", "10")), is_throttle=is_throttling_error
+)
+delete_limiter = AdaptiveRateLimiter(
+    float(os.environ.get("ACM_DELETE_RATE", "5")), is_throttle=is_throttling_error
+)
+
+PENDING_STATUS = "pending_deletion"
+SWEEP_OUTCOMES = ("deleted", "already_deleted", "in_use", "error")
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(getattr(logging, log_level, logging.INFO))
+
+
+def lambda_handler(event, context):
+    """Lambda handler to delete superseded certificates that nothing uses any more."""
+    if not bucket_name:
+        logger.error("S3_BUCKET environment variable is required but not set")
+        raise MissingInputError("S3_BUCKET environment variable is required")
+
+    batch_size = int(event.get("batch_size", sweep_batch_size))
+    grace_hours = float(event.get("grace_hours", deletion_grace_hours))
+
+    index = InventoryIndex.load(s3, bucket_name)
+    certificate_arns = pending_certificates(index, datetime.utcnow() - timedelta(hours=grace_hours), batch_size)
+    logger.info("Sweeping %d certificates pending deletion (concurrency: %d)", len(certificate_arns), sweep_concurrency)
+
+    with ThreadPoolExecutor(max_workers=max(1, sweep_concurrency), thread_name_prefix="sweep") as executor:
+        results = list(executor.map(sweep_certificate, certificate_arns))
+
+    records = deleted_records(index, [r["certificate_arn"] for r in results if r["outcome"] in ("deleted", "already_deleted")])
+    if records:
+        update_index(s3, bucket_name, records)
+
+    response = {
+        "certificates_swept": len(results),
+        "summary": {outcome: sum(1 for r in results if r["outcome"] == outcome) for outcome in SWEEP_OUTCOMES},
+        "results": results,
+        "delete_rate": delete_limiter.rate,
+        "throttles": describe_limiter.throttles + delete_limiter.throttles
+    }
+    logger.info("Certificate sweep completed: %s", response["summary"])
+    return response
+
+
+def pending_certificates(index, queued_before, limit):
+    """Distinct ARNs queued for deletion before queued_before, longest-queued first."""
+    queued_at = {}
+    for record in index.query(status=PENDING_STATUS):
+        if record["updated_at"] <= queued_before.isoformat():
+            arn = record["certificate_arn"]
+            queued_at[arn] = min(queued_at.get(arn, record["updated_at"]), record["updated_at"])
+    return sorted(queued_at, key=queued_at.get)[:limit]
+
+
+def sweep_certificate(certificate_arn):
+    """Delete one queued certificate if nothing uses it; the outcome is returned, never raised."""
+    try:
+        certificate = describe_limiter.call(acm.describe_certificate, CertificateArn=certificate_arn)["Certificate"]
+    except Exception as e:
+        return sweep_failure(certificate_arn, e)
+
+    in_use_by = certificate.get("InUseBy", [])
+    if in_use_by:
+        logger.info("Certificate %s still in use by %d resources - leaving it queued", certificate_arn, len(in_use_by))
+        return {"certificate_arn": certificate_arn, "outcome": "in_use", "in_use_by": in_use_by}
+
+    try:
+        delete_limiter.call(acm.delete_certificate, CertificateArn=certificate_arn)
+    except Exception as e:
+        return sweep_failure(certificate_arn, e)
+
+    logger.info("Deleted superseded certificate: %s", certificate_arn)
+    return {"certificate_arn": certificate_arn, "outcome": "deleted"}
+
+
+def sweep_failure(certificate_arn, error):
+    """Map a describe or delete failure to a sweep outcome."""
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    if code == "ResourceNotFoundException":
+        logger.info("Certificate %s no longer exists", certificate_arn)
+        return {"certificate_arn": certificate_arn, "outcome": "already_deleted"}
+    if code == "ResourceInUseException":
+        # Attached between the InUseBy check and the delete
+        logger.info("Certificate %s was attached before it could be deleted - leaving it queued", certificate_arn)
+        return {"certificate_arn": certificate_arn, "outcome": "in_use", "in_use_by": []}
+
+    logger.warning("Unable to sweep certificate %s: %s", certificate_arn, str(error))
+    return {"certificate_arn": certificate_arn, "outcome": "error", "error": str(error)}
+
+
+def deleted_records(index, certificate_arns):
+    """Inventory records marking each domain record of the given ARNs deleted."""
+    deletion_date = datetime.utcnow().isoformat()
+    records = []
+    for certificate_arn in certificate_arns:
+        for record in index.for_certificate(certificate_arn):
+            records.append({**record, "status": "deleted", "deletion_date": deletion_date, "updated_at": None})
+    return records
+
+
+log_import_time(import_started)
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+import index
+from inventory_index import InventoryIndex
+
+
+def client_error(code, operation):
+    """Return a ClientError with the given error code."""
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
+
+
+def pending(arn, domain, hours_ago=2):
+    """Return a pending_deletion inventory record queued hours_ago hours ago."""
+    return {
+        "certificate_arn": arn,
+        "domain": domain,
+        "status": "pending_deletion",
+        "expiration_date": "2030-01-01T00:00:00",
+        "replaced_by": "arn-new",
+        "updated_at": (datetime.utcnow() - timedelta(hours=hours_ago)).isoformat()
+    }
+
+
+class TestSweepCertificates:
+    """Test suite for the deferred deletion sweeper."""
+
+    @pytest.fixture
+    def inventory(self):
+        """An inventory index holding queued and active certificates."""
+        inventory = InventoryIndex.empty()
+        for record in (
+            pending("arn-free", "a.example.com", hours_ago=5),
+            pending("arn-free", "b.example.com", hours_ago=5),
+            pending("arn-attached", "c.example.com"),
+            pending("arn-gone", "d.example.com"),
+            pending("arn-recent", "e.example.com", hours_ago=0),
+            {**pending("arn-new", "a.example.com"), "status": "active"},
+        ):
+            inventory.upsert(record)
+        return inventory
+
+    @pytest.fixture
+    def mock_aws(self, inventory):
+        """Mock ACM and the inventory index in S3 with unthrottled limiters."""
+        def describe(CertificateArn):
+            if CertificateArn == "arn-gone":
+                raise client_error("ResourceNotFoundException", "DescribeCertificate")
+            in_use_by = ["arn:aws:elasticloadbalancing:lb"] if CertificateArn == "arn-attached" else []
+            return {"Certificate": {"CertificateArn": CertificateArn, "InUseBy": in_use_by}}
+
+        with patch("index.s3"), patch("index.acm") as mock_acm, patch("index.bucket_name", "test-bucket"), \
+             patch("index.InventoryIndex.load", return_value=inventory), \
+             patch("index.update_index") as mock_update, \
+             patch("index.describe_limiter", index.AdaptiveRateLimiter(1000)), \
+             patch("index.delete_limiter", index.AdaptiveRateLimiter(1000)):
+            mock_acm.describe_certificate.side_effect = describe
+            yield {"acm": mock_acm, "update_index": mock_update}
+
+    def test_lambda_handler_missing_bucket_name(self):
+        """Test the sweeper requires S3_BUCKET."""
+        with patch("index.bucket_name", None):
+            with pytest.raises(ValueError, match="S3_BUCKET environment variable is required"):
+                index.lambda_handler({}, {})
+
+    def test_deletes_only_unused_certificates(self, mock_aws):
+        """Test unused certificates are deleted, attached ones stay queued and recent ones wait out the grace period."""
+        result = index.lambda_handler({}, {})
+
+        outcomes = {r["certificate_arn"]: r["outcome"] for r in result["results"]}
+        assert outcomes == {"arn-free": "deleted", "arn-attached": "in_use", "arn-gone": "already_deleted"}
+        mock_aws["acm"].delete_certificate.assert_called_once_with(CertificateArn="arn-free")
+        assert result["summary"] == {"deleted": 1, "already_deleted": 1, "in_use": 1, "error": 0}
+
+        # Every domain record of the removed certificates is marked deleted in one index update
+        records = mock_aws["update_index"].call_args[0][2]
+        assert sorted((r["certificate_arn"], r["domain"], r["status"]) for r in records) == [
+            ("arn-free", "a.example.com", "deleted"),
+            ("arn-free", "b.example.com", "deleted"),
+            ("arn-gone", "d.example.com", "deleted")
+        ]
+        assert all(r["deletion_date"] for r in records)
+
+    def test_batch_size_takes_longest_queued_first(self, mock_aws):
+        """Test a limited sweep starts with the certificates queued longest."""
+        result = index.lambda_handler({"batch_size": 1}, {})
+
+        assert [r["certificate_arn"] for r in result["results"]] == ["arn-free"]
+
+    def test_delete_race_and_errors_leave_certificate_queued(self, mock_aws):
+        """Test a certificate attached after the check, or a failed delete, is not marked deleted."""
+        mock_aws["acm"].delete_certificate.side_effect = client_error("ResourceInUseException", "DeleteCertificate")
+
+        result = index.lambda_handler({"grace_hours": 0}, {})
+
+        assert {r["certificate_arn"]: r["outcome"] for r in result["results"]}["arn-free"] == "in_use"
+        records = mock_aws["update_index"].call_args[0][2]
+        assert {r["certificate_arn"] for r in records} == {"arn-gone"}
+
+    def test_throttled_delete_is_retried(self):
+        """Test a throttled delete slows the limiter and is retried."""
+        limiter = index.AdaptiveRateLimiter(4, is_throttle=index.is_throttling_error, sleep=lambda seconds: None)
+        with patch("index.acm") as mock_acm, patch("index.delete_limiter", limiter), \
+             patch("index.describe_limiter", index.AdaptiveRateLimiter(1000)):
+            mock_acm.describe_certificate.return_value = {"Certificate": {"InUseBy": []}}
+            mock_acm.delete_certificate.side_effect = [client_error("ThrottlingException", "DeleteCertificate"), {}]
+
+            result = index.sweep_certificate("arn-free")
+
+        assert result == {"certificate_arn": "arn-free", "outcome": "deleted"}
+        assert limiter.throttles == 1
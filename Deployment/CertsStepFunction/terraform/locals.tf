@@ -19,8 +19,14 @@ locals {
       timeout  = var.timeout
       layers   = [aws_lambda_layer_version.shared_python_layer.arn]
       environment = {
-        LOG_LEVEL     = var.log_level
-        CERTBOT_EMAIL = var.certbot_email
+        LOG_LEVEL              = var.log_level
+        CERTBOT_EMAIL          = var.certbot_email
+        GENERATION_CONCURRENCY = var.generation_concurrency
+        CERT_ENGINE            = var.cert_engine
+        KEY_TYPE               = var.key_type
+        DOMAIN_KEY_TYPES       = jsonencode(var.domain_key_types)
+        KEY_POOL_SIZE          = var.key_pool_size
+        PUBLIC_SUFFIXES        = join(",", var.public_suffixes)
       }
     }
     replace_certificate = {
@@ -29,7 +35,34 @@ locals {
       timeout  = var.timeout
       layers   = [aws_lambda_layer_version.shared_python_layer.arn]
       environment = {
-        LOG_LEVEL = var.log_level
+        LOG_LEVEL                 = var.log_level
+        CERTIFICATE_IMPORT_MODE   = var.certificate_import_mode
+        REPLACE_BATCH_CONCURRENCY = var.replace_batch_concurrency
+        ACM_IMPORT_RATE           = var.acm_import_rate
+        OLD_CERTIFICATE_DELETION  = var.old_certificate_deletion
+      }
+    }
+    probe_certificate = {
+      filename = "lambdas/probe_certificate.zip"
+      handler  = "index.lambda_handler"
+      timeout  = var.timeout
+      layers   = [aws_lambda_layer_version.shared_python_layer.arn]
+      environment = {
+        LOG_LEVEL             = var.log_level
+        PROBE_TIMEOUT_SECONDS = var.probe_timeout_seconds
+        PROBE_CONCURRENCY     = var.probe_concurrency
+      }
+    }
+    sweep_certificate = {
+      filename = "lambdas/sweep_certificate.zip"
+      handler  = "index.lambda_handler"
+      timeout  = var.timeout
+      layers   = [aws_lambda_layer_version.shared_python_layer.arn]
+      environment = {
+        LOG_LEVEL            = var.log_level
+        SWEEP_BATCH_SIZE     = var.sweep_batch_size
+        DELETION_GRACE_HOURS = var.deletion_grace_hours
+        ACM_DELETE_RATE      = var.acm_delete_rate
       }
     }
   }
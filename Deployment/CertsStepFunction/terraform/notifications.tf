@@ -61,6 +61,7 @@ resource "aws_lambda_function" "notification" {
   handler       = "index.lambda_handler"
   runtime       = var.runtime
   timeout       = var.timeout
+  layers        = [aws_lambda_layer_version.shared_python_layer.arn]
 
   environment {
     variables = {
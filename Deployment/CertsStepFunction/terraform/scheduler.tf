@@ -0,0 +1,63 @@
+# Expiry-ordered scheduler Lambda Function
+resource "aws_lambda_function" "certificate_scheduler" {
+  filename      = "lambdas/schedule_certificate.zip"
+  function_name = "certificate-scheduler"
+  role          = aws_iam_role.lambda_role.arn
+  handler       = "index.lambda_handler"
+  runtime       = var.runtime
+  timeout       = var.timeout
+  layers        = [aws_lambda_layer_version.shared_python_layer.arn]
+
+  environment {
+    variables = {
+      S3_BUCKET              = data.aws_s3_bucket.certificate_bucket.bucket
+      STATE_MACHINE_ARN      = aws_sfn_state_machine.certificate_manager.arn
+      SCHEDULED_DOMAINS      = join(",", var.scheduled_domains)
+      RENEWAL_WINDOW_DAYS    = var.renewal_window_days
+      RECHECK_INTERVAL_HOURS = var.recheck_interval_hours
+      LOG_LEVEL              = var.log_level
+    }
+  }
+
+  kms_key_arn = aws_kms_key.certificate_management.arn
+
+  depends_on = [
+    aws_iam_role_policy_attachment.lambda_basic_execution
+  ]
+
+  tags = local.common_tags
+}
+
+# CloudWatch Log Group for Scheduler Lambda
+resource "aws_cloudwatch_log_group" "scheduler_logs" {
+  name              = "/aws/lambda/certificate-scheduler"
+  retention_in_days = 30
+
+  tags = local.common_tags
+}
+
+# EventBridge Trigger for Scheduler Lambda
+resource "aws_lambda_permission" "eventbridge_scheduler_trigger" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.certificate_scheduler.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.certificate_schedule_tick.arn
+}
+
+# Scheduler permission to start the certificate workflow
+resource "aws_iam_role_policy" "lambda_step_function_policy" {
+  name = "lambda_step_function_policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = "states:StartExecution"
+        Resource = aws_sfn_state_machine.certificate_manager.arn
+      }
+    ]
+  })
+}
@@ -31,6 +31,36 @@ variable "domain" {
   default     = "yourdomain.com"
 }
 
+variable "scheduled_domains" {
+  description = "Domains tracked by the expiry-ordered scheduler"
+  type        = list(string)
+  default     = ["yourdomain.com"]
+}
+
+variable "renewal_window_days" {
+  description = "Days before expiry at which the scheduler starts a renewal"
+  type        = number
+  default     = 30
+}
+
+variable "recheck_interval_hours" {
+  description = "Hours before the scheduler re-checks a domain whose renewal was started"
+  type        = number
+  default     = 24
+}
+
+variable "probe_timeout_seconds" {
+  description = "Per-endpoint TLS handshake timeout for the certificate prober"
+  type        = number
+  default     = 5
+}
+
+variable "probe_concurrency" {
+  description = "Maximum concurrent TLS handshakes for the certificate prober"
+  type        = number
+  default     = 200
+}
+
 variable "log_level" {
   description = "Log Level for Lambda logging"
   type        = string
@@ -71,4 +101,108 @@ variable "env" {
     condition     = contains(["dev", "staging", "prod"], var.env)
     error_message = "Environment must be one of: development, staging, production."
   }
-}
\ No newline at end of file
+}
+
+variable "generation_concurrency" {
+  description = "Number of certificate orders generate-certs runs concurrently in grouped mode"
+  type        = number
+  default     = 4
+}
+
+variable "cert_engine" {
+  description = "Certificate issuance engine for generate-certs: certbot CLI or the in-process ACME client"
+  type        = string
+  default     = "certbot"
+
+  validation {
+    condition     = contains(["certbot", "acme"], var.cert_engine)
+    error_message = "cert_engine must be one of: certbot, acme."
+  }
+}
+
+variable "key_type" {
+  description = "Default private key type for generated certificates"
+  type        = string
+  default     = "ec-p256"
+
+  validation {
+    condition     = contains(["ec-p256", "ec-p384", "rsa-2048", "rsa-3072", "rsa-4096"], var.key_type)
+    error_message = "key_type must be one of: ec-p256, ec-p384, rsa-2048, rsa-3072, rsa-4096."
+  }
+}
+
+variable "domain_key_types" {
+  description = "Per-domain key type overrides, e.g. RSA for clients without ECDSA support"
+  type        = map(string)
+  default     = {}
+}
+
+variable "key_pool_size" {
+  description = "Pre-generated private keys kept in S3 per RSA key type (0 disables the pool); EC keys are always generated inline"
+  type        = number
+  default     = 5
+}
+
+variable "public_suffixes" {
+  description = "Extra multi-label public suffixes (e.g. \"gov.example\") used to find registered domains for SAN grouping and ACME rate limits"
+  type        = list(string)
+  default     = []
+}
+
+variable "certificate_import_mode" {
+  description = "How replace-certs imports renewals: reimport overwrites the existing ACM ARN in place, new imports a new ARN and retires the old one"
+  type        = string
+  default     = "reimport"
+
+  validation {
+    condition     = contains(["reimport", "new"], var.certificate_import_mode)
+    error_message = "certificate_import_mode must be one of: reimport, new."
+  }
+}
+
+variable "replace_batch_concurrency" {
+  description = "Worker threads used by replace-certs batch mode"
+  type        = number
+  default     = 4
+}
+
+variable "acm_import_rate" {
+  description = "Maximum ACM ImportCertificate requests per second in replace-certs batch mode; the rate adapts downwards on throttling"
+  type        = number
+  default     = 1
+}
+
+variable "old_certificate_deletion" {
+  description = "How replace-certs retires superseded certificates: deferred queues them for the sweeper, inline deletes them during replacement"
+  type        = string
+  default     = "deferred"
+
+  validation {
+    condition     = contains(["deferred", "inline"], var.old_certificate_deletion)
+    error_message = "old_certificate_deletion must be one of: deferred, inline."
+  }
+}
+
+variable "sweep_batch_size" {
+  description = "Maximum superseded certificates the sweeper checks per run"
+  type        = number
+  default     = 100
+}
+
+variable "deletion_grace_hours" {
+  description = "Hours a superseded certificate stays queued before the sweeper tries to delete it"
+  type        = number
+  default     = 1
+}
+
+variable "acm_delete_rate" {
+  description = "Maximum ACM DeleteCertificate requests per second from the sweeper; the rate adapts downwards on throttling"
+  type        = number
+  default     = 5
+}
+
+variable "sweep_schedule_expression" {
+  description = "EventBridge schedule for the superseded-certificate sweeper"
+  type        = string
+  default     = "rate(6 hours)"
+}